@@ -0,0 +1,280 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from incidence import factor_similarity
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """
+    Cache of analysis results, keyed by the content of the prediction knowledge graph.
+
+    Results are kept in a bounded in-memory LRU and, when a path is given, in an SQLite
+    database of zlib compressed JSON, which survives restarts and is shared by the worker
+    processes. Every entry records the ground truth version it is valid for and what it
+    depends on (see KGExplainer.get_dependencies). When the ground truth moves to a newer
+    version through known edits, the entries the edits cannot change are carried over to
+    it and only the others are dropped; on any other version change, all the entries of
+    older versions are dropped. Results computed against an older version are not stored.
+    """
+
+    def __init__(self, max_entries=256, path=None, max_disk_entries=10000):
+        """
+        Args:
+            max_entries: Maximum number of results kept in memory, the least recently used go first
+            path: Optional SQLite database file of the on-disk tier
+            max_disk_entries: Maximum number of results kept on disk, the least recently used go first
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.version = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.invalidated = 0
+        self.carried_over = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        if path:
+            try:
+                self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS analyses ("
+                    "key TEXT PRIMARY KEY, version INTEGER NOT NULL, result BLOB NOT NULL, "
+                    "dependencies TEXT, accessed REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS analyses_accessed ON analyses (accessed)")
+                columns = {row[1] for row in self._db.execute("PRAGMA table_info(analyses)")}
+                if 'dependencies' not in columns:
+                    self._db.execute("ALTER TABLE analyses ADD COLUMN dependencies TEXT")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not open analysis cache database {path}: {str(e)}")
+                self._db = None
+
+    @staticmethod
+    def make_key(prediction_kg, options=None):
+        """
+        Return the cache key of an analysis.
+
+        The nodes and links are hashed in sorted order, so graphs listing the same nodes and
+        links in another order share their entry. The order of the Disease nodes is kept,
+        since the first one is the predicted disease.
+
+        Args:
+            prediction_kg: Prediction knowledge graph dictionary
+            options: JSON serializable analysis options that change the result
+        """
+        nodes = sorted(json.dumps(node, sort_keys=True) for node in prediction_kg['nodes'])
+        links = sorted(json.dumps(link, sort_keys=True) for link in prediction_kg['links'])
+        diseases = [node['id'] for node in prediction_kg['nodes'] if node.get('type') == 'Disease']
+        payload = json.dumps([nodes, links, diseases, options], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_stale(dependencies, edit):
+        """
+        Check whether an edit of the ground truth may change a result.
+
+        Args:
+            dependencies: Dependencies of the result, from KGExplainer.get_dependencies(), or
+                None when they are unknown
+            edit: GraphEdit of the ground truth
+        """
+        if dependencies is None or dependencies['global']:
+            return True
+        if any(disease in edit.affected for disease in dependencies['diseases']):
+            return True
+
+        # An edited disease changes the alternatives if it now scores at least as high as
+        # the last one, or at all when there were fewer than asked for
+        ranking = dependencies['ranking']
+        if ranking is not None:
+            for factors in edit.factors.values():
+                similarity = factor_similarity(ranking['factors'], factors, ranking['metric'])
+                if similarity is not None and (ranking['threshold'] is None or
+                                               similarity >= ranking['threshold'] - 1e-9):
+                    return True
+        return False
+
+    def get(self, key, version):
+        """Return the cached result for the key, or None."""
+        with self._lock:
+            self._check_version(version)
+            if version != self.version:
+                # Asked for by a request still using a replaced version
+                self.misses += 1
+                return None
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+
+            entry = self._load(key, version)
+            if entry is not None:
+                self._remember(key, entry)
+                self.disk_hits += 1
+                return entry[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value, dependencies=None):
+        """
+        Store a result computed against the given ground truth version.
+
+        Args:
+            key: Cache key, from make_key()
+            version: Version of the ground truth the result was computed against
+            value: JSON serializable result
+            dependencies: What the result depends on, from KGExplainer.get_dependencies(),
+                None to drop it on any change of the ground truth
+        """
+        with self._lock:
+            self._check_version(version)
+            if version != self.version:
+                # Computed against a version that was replaced in the meantime
+                return
+
+            self._remember(key, (value, dependencies))
+            self._store(key, version, value, dependencies)
+
+    def invalidate(self, version, edit=None):
+        """
+        Move the cache to a newer ground truth version.
+
+        Args:
+            version: The new ground truth version
+            edit: GraphEdit from the previous version, when the new version was derived from
+                it by disease edits. Without it, or when the cache is at another version than
+                the edit was applied to, every result is dropped.
+        """
+        with self._lock:
+            self._check_version(version, edit)
+
+    def stats(self):
+        """Return the hit and miss counters and the current sizes."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            disk_size = None
+            if self._db is not None:
+                try:
+                    disk_size = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            return {
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / total if total else 0,
+                'invalidations': self.invalidations,
+                'invalidated': self.invalidated,
+                'carried_over': self.carried_over,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'disk_size': disk_size,
+                'max_disk_entries': self.max_disk_entries if self._db is not None else None,
+                'version': self.version
+            }
+
+    def _check_version(self, version, edit=None):
+        if self.version is not None and version <= self.version:
+            return
+
+        previous = self.version
+        self.version = version
+        if previous is None:
+            self._drop_disk_entries(version)
+            return
+
+        self.invalidations += 1
+        if edit is None or edit.previous_version != previous:
+            self.invalidated += len(self._entries)
+            self._entries.clear()
+            self._drop_disk_entries(version)
+            logger.info(f"Ground truth version {version} invalidated the cached analyses of version {previous}")
+            return
+
+        # Carry the results the edit cannot change over to the new version
+        for key, (_, dependencies) in list(self._entries.items()):
+            if self.is_stale(dependencies, edit):
+                del self._entries[key]
+                self.invalidated += 1
+            else:
+                self.carried_over += 1
+
+        if self._db is not None:
+            try:
+                rows = self._db.execute("SELECT key, dependencies FROM analyses WHERE version = ?",
+                                        (previous,)).fetchall()
+                stale = [(key,) for key, dependencies in rows
+                         if self.is_stale(json.loads(dependencies) if dependencies else None, edit)]
+                self._db.executemany("DELETE FROM analyses WHERE key = ?", stale)
+                self._db.execute("UPDATE analyses SET version = ? WHERE version = ?", (version, previous))
+                self._db.commit()
+            except (sqlite3.Error, ValueError) as e:
+                logger.warning(f"Could not update the analysis cache database: {str(e)}")
+        self._drop_disk_entries(version)
+        logger.info(f"Ground truth version {version}: kept {len(self._entries)} cached analyses of version {previous}")
+
+    def _drop_disk_entries(self, version):
+        # Drop the results of older versions from the database
+        if self._db is None:
+            return
+        try:
+            self._db.execute("DELETE FROM analyses WHERE version < ?", (version,))
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not invalidate the analysis cache database: {str(e)}")
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key, version):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute("SELECT result, dependencies FROM analyses WHERE key = ? AND version = ?",
+                                   (key, version)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE analyses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return json.loads(zlib.decompress(row[0]).decode('utf-8')), json.loads(row[1]) if row[1] else None
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            logger.warning(f"Could not read the analysis cache database: {str(e)}")
+            return None
+
+    def _store(self, key, version, value, dependencies):
+        if self._db is None:
+            return
+        try:
+            blob = zlib.compress(json.dumps(value).encode('utf-8'))
+            self._db.execute("INSERT OR REPLACE INTO analyses (key, version, result, dependencies, accessed) "
+                             "VALUES (?, ?, ?, ?, ?)", (key, version, blob, json.dumps(dependencies), time.time()))
+            excess = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0] - self.max_disk_entries
+            if excess > 0:
+                self._db.execute("DELETE FROM analyses WHERE key IN "
+                                 "(SELECT key FROM analyses ORDER BY accessed LIMIT ?)", (excess,))
+            self._db.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Could not save to the analysis cache database: {str(e)}")
@@ -1,23 +1,175 @@
 
 
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response, stream_with_context
 import json
 import os
 import re
 import logging
-from openai import OpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from gpt_to_jsonkg import create_kg_from_prediction
-from xai import KGExplainer
+from xai import ANALYSIS_SECTIONS, KGExplainer
+from analysis_cache import AnalysisCache
+from file_utils import FileLock, atomic_write
+from kg_store import GroundTruthStore
+from gpt_client import GPTClient, GPTResponseCache, JSONObjectScanner
+from jobs import JobQueue, QueueFullError
+from vocabulary import VocabularyIndex
 
 # OpenAI API key
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "your-api-key")
 
+# GPT client settings, GPT_CACHE_PATH enables persisting the response cache
+GPT_MODEL = os.environ.get("GPT_MODEL", "gpt-4")
+GPT_TIMEOUT = float(os.environ.get("GPT_TIMEOUT", "60"))
+GPT_CACHE_SIZE = int(os.environ.get("GPT_CACHE_SIZE", "256"))
+GPT_CACHE_PATH = os.environ.get("GPT_CACHE_PATH")
+GPT_CACHE_SAVE_INTERVAL = float(os.environ.get("GPT_CACHE_SAVE_INTERVAL", "5"))
+
+# Batch analysis limits
+ANALYZE_BATCH_MAX_SIZE = int(os.environ.get("ANALYZE_BATCH_MAX_SIZE", "200"))
+ANALYZE_BATCH_WORKERS = int(os.environ.get("ANALYZE_BATCH_WORKERS", "4"))
+
+# Relevance filtering of the vocabulary injected in the GPT system prompt
+VOCAB_FILTER = os.environ.get("VOCAB_FILTER", "1") == "1"
+VOCAB_MAX_DISEASES = int(os.environ.get("VOCAB_MAX_DISEASES", "20"))
+VOCAB_MAX_SYMPTOMS = int(os.environ.get("VOCAB_MAX_SYMPTOMS", "20"))
+VOCAB_TOKEN_BUDGET = int(os.environ["VOCAB_TOKEN_BUDGET"]) if os.environ.get("VOCAB_TOKEN_BUDGET") else None
+
+# Asynchronous analysis jobs (POST /api/analyze?async=1)
+ANALYSIS_JOB_WORKERS = int(os.environ.get("ANALYSIS_JOB_WORKERS", "2"))
+ANALYSIS_JOB_MAX_PENDING = int(os.environ.get("ANALYSIS_JOB_MAX_PENDING", "32"))
+ANALYSIS_JOB_TTL = float(os.environ.get("ANALYSIS_JOB_TTL", "600"))
+
+# Alternative diagnoses of the counterfactuals: how many and how they are scored
+# ('jaccard', 'weighted_jaccard' or 'cosine')
+COUNTERFACTUAL_TOP_K = int(os.environ.get("COUNTERFACTUAL_TOP_K", "3"))
+COUNTERFACTUAL_METRIC = os.environ.get("COUNTERFACTUAL_METRIC", "jaccard")
+
+# Score only the likely alternatives found by the MinHash LSH index, for very large graphs
+COUNTERFACTUAL_APPROXIMATE = os.environ.get("COUNTERFACTUAL_APPROXIMATE", "0") == "1"
+
+# Analysis results cached by prediction content and ground truth version: entries kept in
+# memory (0 disables the cache), and the optional SQLite database and size of the on-disk tier
+ANALYSIS_CACHE_SIZE = int(os.environ.get("ANALYSIS_CACHE_SIZE", "256"))
+ANALYSIS_CACHE_PATH = os.environ.get("ANALYSIS_CACHE_PATH")
+ANALYSIS_CACHE_DISK_SIZE = int(os.environ.get("ANALYSIS_CACHE_DISK_SIZE", "10000"))
+
+# Seconds between compactions of the ground truth edit journal
+KG_COMPACT_INTERVAL = float(os.environ.get("KG_COMPACT_INTERVAL", "60"))
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Ground truth knowledge graph, loaded once and shared by every request
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ground_truth_store = GroundTruthStore(os.path.join(BACKEND_DIR, "knowledge_graph.json"))
+ground_truth_store.start_compaction(KG_COMPACT_INTERVAL)
+
+# Serializes updates of info.txt across threads and worker processes
+INFO_FILE_PATH = os.path.join(BACKEND_DIR, "info.txt")
+info_file_lock = FileLock(INFO_FILE_PATH + ".lock")
+
+# Results of earlier analyses, shared by every request
+analysis_cache = AnalysisCache(ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_PATH, ANALYSIS_CACHE_DISK_SIZE)
+
+# Worker pool running the analyses submitted as jobs
+analysis_jobs = JobQueue(ANALYSIS_JOB_WORKERS, ANALYSIS_JOB_MAX_PENDING, ANALYSIS_JOB_TTL)
+
+# OpenAI client and response cache shared by every request
+gpt_client = GPTClient(
+    OPENAI_API_KEY,
+    model=GPT_MODEL,
+    timeout=GPT_TIMEOUT,
+    cache=GPTResponseCache(GPT_CACHE_SIZE, GPT_CACHE_PATH, GPT_CACHE_SAVE_INTERVAL)
+)
+
+# Vocabulary index, rebuilt when info.txt or the ground truth graph changes
+vocabulary_cache = {'key': None, 'index': None, 'requests': 0, 'tokens_saved': 0}
+vocabulary_lock = threading.Lock()
+
+# Serialized bodies of the read endpoints, only kept for the current ETag
+read_cache = {'etag': None, 'bodies': {}}
+read_cache_lock = threading.Lock()
+
+
+def parse_sections(value):
+    """
+    Parse the analysis sections requested by a client.
+    
+    Args:
+        value: Comma separated string or list of section names, or None
+    
+    Returns:
+        List of section names, or None when no section was requested
+    
+    Raises:
+        ValueError: If a section does not exist
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    sections = [str(section).strip() for section in value if str(section).strip()]
+    unknown = [section for section in sections if section not in ANALYSIS_SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown analysis sections: {', '.join(unknown)} "
+                         f"(available: {', '.join(ANALYSIS_SECTIONS)})")
+    return sections or None
+
+
+def analyze_prediction(gpt_data, snapshot, sections=None):
+    """
+    Build the knowledge graph of a GPT prediction and analyze it against the ground truth.
+    
+    The result is served from the analysis cache when the same prediction was analyzed with
+    the same options against this ground truth version, or against an earlier one whose
+    edits could not change the result.
+    
+    Args:
+        gpt_data: GPT response in the {"result": [...]} format
+        snapshot: Ground truth snapshot to compare against
+        sections: Analysis sections to compute, None for the visualization data only
+    
+    Returns:
+        The visualization data of the analysis, or a dictionary of the requested sections
+    """
+    # Step 1: Generate knowledge graph from GPT response (kept in memory)
+    kg = create_kg_from_prediction(gpt_data)
+    logger.info(f"Created knowledge graph with {len(kg['nodes'])} nodes and {len(kg['links'])} links")
+    
+    # Step 2: Reuse the result of an identical analysis
+    cache_key = None
+    if ANALYSIS_CACHE_SIZE > 0:
+        options = [COUNTERFACTUAL_TOP_K, COUNTERFACTUAL_METRIC, COUNTERFACTUAL_APPROXIMATE,
+                   sorted(sections) if sections is not None else None]
+        cache_key = AnalysisCache.make_key(kg, options)
+        analysis_cache.invalidate(snapshot.version, snapshot.edit)
+        cached = analysis_cache.get(cache_key, snapshot.version)
+        if cached is not None:
+            logger.info("Analysis served from the cache")
+            return cached
+    
+    # Step 3: Analyze the knowledge graph against the ground truth
+    explainer = KGExplainer.from_index(snapshot.ground_truth, kg,
+                                       counterfactual_top_k=COUNTERFACTUAL_TOP_K,
+                                       similarity_metric=COUNTERFACTUAL_METRIC,
+                                       approximate_counterfactuals=COUNTERFACTUAL_APPROXIMATE)
+    if sections is None:
+        explainer.analyze()
+        result = explainer.get_visualization_data()
+    else:
+        results = explainer.analyze(sections)
+        result = {section: results[section] for section in sections}
+    
+    if cache_key is not None:
+        analysis_cache.put(cache_key, snapshot.version, result, explainer.get_dependencies())
+    return result
+
+
 @app.route('/api/analyze', methods=['POST', 'OPTIONS'])
 def analyze_gpt_response():
     # Handle preflight OPTIONS request
@@ -36,25 +188,41 @@ def analyze_gpt_response():
         gpt_data = request.json
         logger.info(f"Received data: {json.dumps(gpt_data)[:100]}...")
         
-        # Define file paths in the same directory
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        ground_truth_path = os.path.join(current_dir, "knowledge_graph.json")
-        pred_kg_path = os.path.join(current_dir, "temp_pred_kg.json")
+        # Only compute the requested sections (?sections=metrics,explanations), or the
+        # visualization data when none is requested
+        try:
+            sections = parse_sections(request.args.get('sections'))
+        except ValueError as e:
+            response = jsonify({"success": False, "error": str(e)})
+            response.headers.add("Access-Control-Allow-Origin", "*")
+            return response, 400
         
-        # Step 1: Generate knowledge graph from GPT response
-        logger.info("Generating knowledge graph...")
-        kg = create_kg_from_prediction(gpt_data, pred_kg_path)
-        logger.info(f"Created knowledge graph with {len(kg['nodes'])} nodes and {len(kg['links'])} links")
+        # In asynchronous mode, queue the analysis and return the job id right away
+        if request.args.get('async') == '1':
+            def run_job():
+                snapshot = ground_truth_store.get()
+                return {"data": analyze_prediction(gpt_data, snapshot, sections), "ground_truth_version": snapshot.version}
+            
+            try:
+                job_id = analysis_jobs.submit(run_job)
+            except QueueFullError as e:
+                response = jsonify({"success": False, "error": str(e)})
+                response.headers.add("Access-Control-Allow-Origin", "*")
+                return response, 503
+            
+            logger.info(f"Queued analysis job {job_id}")
+            response = jsonify({"success": True, "job_id": job_id, "status_url": f"/api/jobs/{job_id}"})
+            response.headers.add("Access-Control-Allow-Origin", "*")
+            return response, 202
         
-        # Step 2: Analyze the knowledge graph
+        # Generate and analyze the knowledge graph against the current ground truth
         logger.info("Analyzing knowledge graph...")
-        explainer = KGExplainer(ground_truth_path, pred_kg_path)
-        explainer.analyze()
-        viz_data = explainer.get_visualization_data()
+        snapshot = ground_truth_store.get()
+        viz_data = analyze_prediction(gpt_data, snapshot, sections)
         
-        # Return the visualization data directly
+        # Return the visualization data (or the requested sections) directly
         logger.info("Sending response...")
-        response = jsonify({"success": True, "data": viz_data})
+        response = jsonify({"success": True, "data": viz_data, "ground_truth_version": snapshot.version})
         response.headers.add("Access-Control-Allow-Origin", "*")  # Add CORS header
         return response
     
@@ -65,58 +233,272 @@ def analyze_gpt_response():
         return response, 500
 
 
+def analyze_candidates(gpt_data, snapshot, sections=None):
+    """
+    Analyze every item of a GPT prediction as a candidate disease and rank them.
+    
+    Args:
+        gpt_data: GPT response in the {"result": [...]} format, one item per candidate
+        snapshot: Ground truth snapshot to compare against
+        sections: Sections computed for each candidate, None for the metrics, explanations
+            and counterfactuals
+    
+    Returns:
+        The ranked candidates, see KGExplainer.analyze_candidates()
+    """
+    kg = create_kg_from_prediction(gpt_data, all_results=True)
+    if sections is None:
+        sections = ['metrics', 'explanations', 'counterfactuals']
+    
+    cache_key = None
+    if ANALYSIS_CACHE_SIZE > 0:
+        options = [COUNTERFACTUAL_TOP_K, COUNTERFACTUAL_METRIC, COUNTERFACTUAL_APPROXIMATE, 'candidates', sorted(sections)]
+        cache_key = AnalysisCache.make_key(kg, options)
+        analysis_cache.invalidate(snapshot.version, snapshot.edit)
+        cached = analysis_cache.get(cache_key, snapshot.version)
+        if cached is not None:
+            return cached
+    
+    explainer = KGExplainer.from_index(snapshot.ground_truth, kg,
+                                       counterfactual_top_k=COUNTERFACTUAL_TOP_K,
+                                       similarity_metric=COUNTERFACTUAL_METRIC,
+                                       approximate_counterfactuals=COUNTERFACTUAL_APPROXIMATE)
+    result = explainer.analyze_candidates(sections)
+    
+    # The combined graph reads the whole ground truth, so any edit drops the entry
+    if cache_key is not None:
+        analysis_cache.put(cache_key, snapshot.version, result)
+    return result
 
-# Helper function to get nodes of a specific type from the knowledge graph
-def get_nodes_by_type(node_type):
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    kg_path = os.path.join(current_dir, "knowledge_graph.json")
+
+@app.route('/api/analyze-candidates', methods=['POST', 'OPTIONS'])
+def analyze_candidates_endpoint():
+    """
+    Analyze a prediction with several candidate diseases, e.g. a differential diagnosis.
+    
+    The body is a GPT response whose "result" array has one item per candidate. All of them
+    are analyzed in one pass and returned ranked by confidence score, with one combined
+    graph. ?sections= selects the sections computed for each candidate.
+    """
+    if request.method == 'OPTIONS':
+        response = make_response()
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        response.headers.add("Access-Control-Allow-Methods", "POST")
+        return response
     
     try:
-        with open(kg_path, 'r') as f:
-            kg_data = json.load(f)
+        gpt_data = request.json
+        
+        try:
+            sections = parse_sections(request.args.get('sections'))
+        except ValueError as e:
+            response = jsonify({"success": False, "error": str(e)})
+            response.headers.add("Access-Control-Allow-Origin", "*")
+            return response, 400
+        
+        snapshot = ground_truth_store.get()
+        data = analyze_candidates(gpt_data, snapshot, sections)
+        logger.info(f"Ranked {len(data['candidates'])} candidate diseases")
+        
+        response = jsonify({"success": True, "data": data, "ground_truth_version": snapshot.version})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response
+    
+    except Exception as e:
+        logger.error(f"Error processing candidates request: {str(e)}")
+        response = jsonify({"success": False, "error": str(e)})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, 500
+
+
+@app.route('/api/analyze-batch', methods=['POST', 'OPTIONS'])
+def analyze_batch():
+    """
+    Analyze many GPT predictions in one request.
+    
+    The body is {"predictions": [{"result": [...]}, ...], "parallel": false, "sections": null}.
+    Every prediction is analyzed against the same ground truth snapshot, and the results are
+    returned in the same order, each one either {"success": True, "data": ...} or
+    {"success": False, "error": ...}. Like /api/analyze, "data" is the visualization data unless
+    a list of sections is requested.
+    """
+    if request.method == 'OPTIONS':
+        response = make_response()
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        response.headers.add("Access-Control-Allow-Methods", "POST")
+        return response
+    
+    try:
+        data = request.json
+        predictions = data.get('predictions') if isinstance(data, dict) else None
+        
+        if not isinstance(predictions, list):
+            response = jsonify({"success": False, "error": "A 'predictions' list is required"})
+            response.headers.add("Access-Control-Allow-Origin", "*")
+            return response, 400
+        
+        if len(predictions) > ANALYZE_BATCH_MAX_SIZE:
+            response = jsonify({
+                "success": False,
+                "error": f"Batch of {len(predictions)} predictions exceeds the maximum of {ANALYZE_BATCH_MAX_SIZE}"
+            })
+            response.headers.add("Access-Control-Allow-Origin", "*")
+            return response, 413
+        
+        try:
+            sections = parse_sections(data.get('sections'))
+        except ValueError as e:
+            response = jsonify({"success": False, "error": str(e)})
+            response.headers.add("Access-Control-Allow-Origin", "*")
+            return response, 400
+        
+        logger.info(f"Analyzing batch of {len(predictions)} predictions")
+        snapshot = ground_truth_store.get()
+        
+        def analyze_item(gpt_data):
+            try:
+                return {"success": True, "data": analyze_prediction(gpt_data, snapshot, sections)}
+            except Exception as e:
+                logger.error(f"Error analyzing batch item: {str(e)}")
+                return {"success": False, "error": str(e)}
+        
+        if data.get('parallel') and ANALYZE_BATCH_WORKERS > 1 and len(predictions) > 1:
+            with ThreadPoolExecutor(max_workers=ANALYZE_BATCH_WORKERS) as executor:
+                results = list(executor.map(analyze_item, predictions))
+        else:
+            results = [analyze_item(gpt_data) for gpt_data in predictions]
+        
+        response = jsonify({"success": True, "results": results, "ground_truth_version": snapshot.version})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response
+    
+    except Exception as e:
+        logger.error(f"Error processing batch request: {str(e)}")
+        response = jsonify({"success": False, "error": str(e)})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, 500
+
+
+# Endpoint to poll an asynchronous analysis job
+@app.route('/api/jobs/<job_id>', methods=['GET', 'OPTIONS'])
+def get_job(job_id):
+    if request.method == 'OPTIONS':
+        response = make_response()
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        response.headers.add("Access-Control-Allow-Methods", "GET")
+        return response
+    
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        response = jsonify({"success": False, "error": f"Job '{job_id}' not found"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response, 404
+    
+    body = {"success": job['status'] != 'failed', "job_id": job_id, "status": job['status'], "timing": job['timing']}
+    if job['status'] == 'done':
+        body.update(job['result'])
+    elif job['status'] == 'failed':
+        body['error'] = job['error']
+    
+    response = jsonify(body)
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
+
+# Helper function to get nodes of a specific type from the knowledge graph
+def get_nodes_by_type(node_type, index=None):
+    try:
+        if index is None:
+            index = ground_truth_store.get().index
         
         nodes = []
-        for node in kg_data['nodes']:
-            if node['type'] == node_type:
-                nodes.append({
-                    'id': node['id'],
-                    'custom': node.get('custom', False)
-                })
+        for node in index.nodes_of_type(node_type):
+            nodes.append({
+                'id': node['id'],
+                'custom': node.get('custom', False)
+            })
         
         return nodes
     except Exception as e:
         logger.error(f"Error getting nodes of type {node_type}: {str(e)}")
         return []
 
+def read_etag(snapshot):
+    """ETag of the read endpoints, it changes with every write of the ground truth or info.txt."""
+    try:
+        info_mtime = os.stat(INFO_FILE_PATH).st_mtime_ns
+    except FileNotFoundError:
+        info_mtime = 0
+    return f"kg-{snapshot.version}-{info_mtime}"
+
+
+def invalidate_read_cache():
+    """Drop the cached read responses after a successful write."""
+    with read_cache_lock:
+        read_cache['etag'] = None
+        read_cache['bodies'] = {}
+
+
+def cached_read_response(key, snapshot, build_body):
+    """
+    Build a read endpoint response with an ETag, answering If-None-Match with a 304.
+    
+    The serialized body is cached for the current ETag, so repeated reads of an unchanged
+    graph only cost a dictionary lookup.
+    
+    Args:
+        key: Cache key of the response within the endpoint family
+        snapshot: Ground truth snapshot the response is computed from
+        build_body: Function returning the response dictionary, only called on a cache miss
+    """
+    etag = read_etag(snapshot)
+    
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        with read_cache_lock:
+            if read_cache['etag'] != etag:
+                read_cache['etag'] = etag
+                read_cache['bodies'] = {}
+            body = read_cache['bodies'].get(key)
+        
+        if body is None:
+            body = jsonify(build_body()).get_data()
+            with read_cache_lock:
+                if read_cache['etag'] == etag:
+                    read_cache['bodies'][key] = body
+        
+        response = make_response(body)
+        response.mimetype = 'application/json'
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
 # Endpoint to get all diseases from the knowledge graph
 @app.route('/api/diseases', methods=['GET', 'OPTIONS'])
 def get_diseases():
     if request.method == 'OPTIONS':
         response = make_response()
         response.headers.add("Access-Control-Allow-Origin", "*")
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type, If-None-Match")
         response.headers.add("Access-Control-Allow-Methods", "GET")
         return response
     
     try:
-        # Path to the knowledge graph file
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        kg_path = os.path.join(current_dir, "knowledge_graph.json")
-        
-        # Read the knowledge graph file
-        with open(kg_path, 'r') as f:
-            kg_data = json.load(f)
-        
-        # Extract all disease nodes
-        diseases = []
-        for node in kg_data['nodes']:
-            if node['type'] == 'Disease':
-                diseases.append(node['id'])
+        # Get the current ground truth graph
+        snapshot = ground_truth_store.get()
         
         # Return the list of diseases
-        response = jsonify({"success": True, "diseases": diseases})
-        response.headers.add("Access-Control-Allow-Origin", "*")
-        return response
+        return cached_read_response('diseases', snapshot, lambda: {
+            "success": True,
+            "diseases": list(snapshot.index.ids_by_type.get('Disease', [])),
+            "version": snapshot.version
+        })
     
     except Exception as e:
         logger.error(f"Error getting diseases: {str(e)}")
@@ -130,45 +512,39 @@ def get_disease(disease_name):
     if request.method == 'OPTIONS':
         response = make_response()
         response.headers.add("Access-Control-Allow-Origin", "*")
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type, If-None-Match")
         response.headers.add("Access-Control-Allow-Methods", "GET")
         return response
     
     try:
-        # Path to the knowledge graph file
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        kg_path = os.path.join(current_dir, "knowledge_graph.json")
-        
-        # Read the knowledge graph file
-        with open(kg_path, 'r') as f:
-            kg_data = json.load(f)
+        # Get the current ground truth graph
+        snapshot = ground_truth_store.get()
         
         # Check if the disease exists
-        disease_exists = False
-        for node in kg_data['nodes']:
-            if node['type'] == 'Disease' and node['id'] == disease_name:
-                disease_exists = True
-                break
-        
-        if not disease_exists:
+        if not snapshot.index.has_node(disease_name, 'Disease'):
             response = jsonify({"success": False, "error": f"Disease '{disease_name}' not found"})
             response.headers.add("Access-Control-Allow-Origin", "*")
             return response, 404
         
         # Get all connections for this disease
-        connections = []
-        for link in kg_data['links']:
-            if link['source'] == disease_name:
+        def build_body():
+            connections = []
+            for link in snapshot.index.outgoing.get(disease_name, []):
                 connections.append({
                     'target': link['target'],
                     'relationship': link['relationship'],
                     'weight': link.get('weight', 0.5)
                 })
+            
+            return {
+                "success": True,
+                "disease": disease_name,
+                "connections": connections,
+                "version": snapshot.version
+            }
         
         # Return the disease connections
-        response = jsonify({"success": True, "disease": disease_name, "connections": connections})
-        response.headers.add("Access-Control-Allow-Origin", "*")
-        return response
+        return cached_read_response(('disease', disease_name), snapshot, build_body)
     
     except Exception as e:
         logger.error(f"Error getting disease connections: {str(e)}")
@@ -182,22 +558,26 @@ def get_symptoms():
     if request.method == 'OPTIONS':
         response = make_response()
         response.headers.add("Access-Control-Allow-Origin", "*")
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type, If-None-Match")
         response.headers.add("Access-Control-Allow-Methods", "GET")
         return response
     
     try:
-        # Get all symptom nodes
-        symptoms = get_nodes_by_type('Symptom')
+        # Get the current ground truth graph
+        snapshot = ground_truth_store.get()
+        
+        def build_body():
+            # Get all symptom nodes
+            symptoms = get_nodes_by_type('Symptom', snapshot.index)
+            return {
+                "success": True, 
+                "symptoms": [symptom['id'] for symptom in symptoms],
+                "custom_symptoms": [symptom['id'] for symptom in symptoms if symptom.get('custom')],
+                "version": snapshot.version
+            }
         
         # Return the symptoms
-        response = jsonify({
-            "success": True, 
-            "symptoms": [symptom['id'] for symptom in symptoms],
-            "custom_symptoms": [symptom['id'] for symptom in symptoms if symptom.get('custom')]
-        })
-        response.headers.add("Access-Control-Allow-Origin", "*")
-        return response
+        return cached_read_response('symptoms', snapshot, build_body)
     
     except Exception as e:
         logger.error(f"Error getting symptoms: {str(e)}")
@@ -243,78 +623,80 @@ def update_info_file():
             response.headers.add("Access-Control-Allow-Origin", "*")
             return response, 404
         
-        # Read the existing file content
-        try:
-            with open(file_path, 'r') as file:
-                current_content = file.read()
-                logger.info(f"Successfully read file, content length: {len(current_content)}")
-        except Exception as e:
-            error_msg = f"Error reading file: {str(e)}"
-            logger.error(error_msg)
-            response = jsonify({"success": False, "error": error_msg})
-            response.headers.add("Access-Control-Allow-Origin", "*")
-            return response, 500
+        # Read, update and rewrite the file under a lock shared by all workers, so concurrent
+        # updates are not lost and readers never see a partially written file
+        with info_file_lock:
+            # Read the existing file content
+            try:
+                with open(file_path, 'r') as file:
+                    current_content = file.read()
+                    logger.info(f"Successfully read file, content length: {len(current_content)}")
+            except Exception as e:
+                error_msg = f"Error reading file: {str(e)}"
+                logger.error(error_msg)
+                response = jsonify({"success": False, "error": error_msg})
+                response.headers.add("Access-Control-Allow-Origin", "*")
+                return response, 500
         
-        # Parse the existing content into sections
-        sections = {}
-        current_section = None
+            # Parse the existing content into sections
+            sections = {}
+            current_section = None
         
-        for line in current_content.split('\n'):
-            line = line.strip()
-            if not line:
-                continue
+            for line in current_content.split('\n'):
+                line = line.strip()
+                if not line:
+                    continue
                 
-            if ':' in line and line.split(':', 1)[0].strip() in ['Diseases', 'Symptoms', 'Age Groups', 'Gender', 'Blood Pressure', 'Cholesterol Level']:
-                section_name, section_content = line.split(':', 1)
-                current_section = section_name.strip()
-                sections[current_section] = section_content.strip()
-            elif current_section:
-                sections[current_section] += line
-        
-        logger.info(f"Parsed sections: {sections.keys()}")
-        
-        # Update the sections based on the data provided
-        if 'allDiseases' in data:
-            all_diseases = data['allDiseases']
-            # Sort alphabetically to maintain order
-            all_diseases.sort()
-            sections['Diseases'] = ', '.join(all_diseases)
-            logger.info(f"Updated Diseases section with {len(all_diseases)} diseases")
-        
-        if 'allSymptoms' in data:
-            all_symptoms = data['allSymptoms']
-            # Sort alphabetically to maintain order
-            all_symptoms.sort()
-            sections['Symptoms'] = ', '.join(all_symptoms)
-            logger.info(f"Updated Symptoms section with {len(all_symptoms)} symptoms")
-        
-        # Reconstruct the file content
-        updated_content = ""
-        for section, content in sections.items():
-            updated_content += f"{section}: {content}\n"
-        
-        logger.info(f"Prepared updated content: {updated_content[:100]}...")
-        
-        # Create a backup of the original file just in case
-        backup_path = file_path + ".backup"
-        try:
-            with open(backup_path, 'w') as backup_file:
-                backup_file.write(current_content)
+                if ':' in line and line.split(':', 1)[0].strip() in ['Diseases', 'Symptoms', 'Age Groups', 'Gender', 'Blood Pressure', 'Cholesterol Level']:
+                    section_name, section_content = line.split(':', 1)
+                    current_section = section_name.strip()
+                    sections[current_section] = section_content.strip()
+                elif current_section:
+                    sections[current_section] += line
+        
+            logger.info(f"Parsed sections: {sections.keys()}")
+        
+            # Update the sections based on the data provided
+            if 'allDiseases' in data:
+                all_diseases = data['allDiseases']
+                # Sort alphabetically to maintain order
+                all_diseases.sort()
+                sections['Diseases'] = ', '.join(all_diseases)
+                logger.info(f"Updated Diseases section with {len(all_diseases)} diseases")
+        
+            if 'allSymptoms' in data:
+                all_symptoms = data['allSymptoms']
+                # Sort alphabetically to maintain order
+                all_symptoms.sort()
+                sections['Symptoms'] = ', '.join(all_symptoms)
+                logger.info(f"Updated Symptoms section with {len(all_symptoms)} symptoms")
+        
+            # Reconstruct the file content
+            updated_content = ""
+            for section, content in sections.items():
+                updated_content += f"{section}: {content}\n"
+        
+            logger.info(f"Prepared updated content: {updated_content[:100]}...")
+        
+            # Create a backup of the original file just in case
+            backup_path = file_path + ".backup"
+            try:
+                atomic_write(backup_path, current_content)
                 logger.info(f"Created backup at: {backup_path}")
-        except Exception as e:
-            logger.warning(f"Could not create backup: {str(e)}")
+            except Exception as e:
+                logger.warning(f"Could not create backup: {str(e)}")
         
-        # Write the updated content back to the file
-        try:
-            with open(file_path, 'w') as file:
-                file.write(updated_content)
+            # Write the updated content back to the file
+            try:
+                atomic_write(file_path, updated_content)
                 logger.info(f"Successfully wrote updated content to file")
-        except Exception as e:
-            error_msg = f"Error writing to file: {str(e)}"
-            logger.error(error_msg)
-            response = jsonify({"success": False, "error": error_msg})
-            response.headers.add("Access-Control-Allow-Origin", "*")
-            return response, 500
+                invalidate_read_cache()
+            except Exception as e:
+                error_msg = f"Error writing to file: {str(e)}"
+                logger.error(error_msg)
+                response = jsonify({"success": False, "error": error_msg})
+                response.headers.add("Access-Control-Allow-Origin", "*")
+                return response, 500
         
         response = jsonify({
             "success": True, 
@@ -354,95 +736,25 @@ def update_graph():
             response.headers.add("Access-Control-Allow-Origin", "*")
             return response, 400
         
-        # Path to the knowledge graph file
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        kg_path = os.path.join(current_dir, "knowledge_graph.json")
-        
-        # Read the knowledge graph file
-        with open(kg_path, 'r') as f:
-            kg_data = json.load(f)
-        
-        # Check if the disease exists
-        disease_exists = False
-        for node in kg_data['nodes']:
-            if node['type'] == 'Disease' and node['id'] == disease_name:
-                disease_exists = True
-                break
-        
-        # If adding a new disease and it already exists, return an error
-        if action == 'add' and disease_exists:
-            response = jsonify({"success": False, "error": f"Disease '{disease_name}' already exists"})
+        # Check and journal the edit
+        try:
+            snapshot = ground_truth_store.update_disease(disease_name, action, connections)
+        except ValueError as e:
+            # Invalid connections, or adding a disease whose name is already a node id
+            response = jsonify({"success": False, "error": str(e)})
             response.headers.add("Access-Control-Allow-Origin", "*")
             return response, 400
-        
-        # If modifying a disease and it doesn't exist, return an error
-        if action == 'modify' and not disease_exists:
-            response = jsonify({"success": False, "error": f"Disease '{disease_name}' not found"})
+        except LookupError as e:
+            # Modifying a disease that doesn't exist
+            response = jsonify({"success": False, "error": str(e)})
             response.headers.add("Access-Control-Allow-Origin", "*")
             return response, 404
         
-        # If adding a new disease, add it to the nodes
-        if action == 'add':
-            kg_data['nodes'].append({
-                'id': disease_name,
-                'type': 'Disease'
-            })
-        
-        # If modifying, remove all existing connections for this disease
-        if action == 'modify':
-            kg_data['links'] = [link for link in kg_data['links'] if link['source'] != disease_name]
-        
-        # Add the new connections
-        for conn in connections:
-            target = conn.get('target')
-            relationship = conn.get('relationship')
-            weight = conn.get('weight', 0.5)
-            
-            # Check if the target node exists
-            target_exists = False
-            target_type = None
-            
-            for node in kg_data['nodes']:
-                if node['id'] == target:
-                    target_exists = True
-                    target_type = node['type']
-                    break
-            
-            # If target doesn't exist, add it with the appropriate type
-            if not target_exists:
-                # Determine the type based on the relationship
-                if relationship == 'HAS_SYMPTOM':
-                    target_type = 'Symptom'
-                    logger.info(f"Adding new symptom node: {target}")
-                elif relationship == 'COMMON_IN':
-                    target_type = 'Age Group'
-                elif relationship == 'PREVALENT_IN':
-                    target_type = 'Gender'
-                elif relationship == 'ASSOCIATED_WITH':
-                    target_type = 'Blood Pressure'
-                elif relationship == 'CORRELATED_WITH':
-                    target_type = 'Cholesterol Level'
-                
-                kg_data['nodes'].append({
-                    'id': target,
-                    'type': target_type,
-                    'custom': True  # Mark as a custom-added node
-                })
-            
-            # Add the new link
-            kg_data['links'].append({
-                'source': disease_name,
-                'target': target,
-                'relationship': relationship,
-                'weight': weight
-            })
-        
-        # Write the updated knowledge graph back to the file
-        with open(kg_path, 'w') as f:
-            json.dump(kg_data, f, indent=2)
+        invalidate_read_cache()
+        analysis_cache.invalidate(snapshot.version, snapshot.edit)
         
         # Return success
-        response = jsonify({"success": True})
+        response = jsonify({"success": True, "version": snapshot.version})
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response
     
@@ -452,6 +764,93 @@ def update_graph():
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 500
 
+def select_vocabulary(existing_data, user_prompt):
+    """
+    Keep only the diseases and symptoms of the existing data that are relevant to the prompt.
+    
+    Args:
+        existing_data: Content of info.txt
+        user_prompt: The user prompt
+    
+    Returns:
+        The vocabulary text to inject in the system prompt
+    """
+    snapshot = ground_truth_store.get()
+    key = (existing_data, snapshot.version)
+    
+    with vocabulary_lock:
+        index = vocabulary_cache['index'] if vocabulary_cache['key'] == key else None
+    
+    if index is None:
+        index = VocabularyIndex(existing_data, snapshot.index)
+        with vocabulary_lock:
+            vocabulary_cache['key'] = key
+            vocabulary_cache['index'] = index
+    
+    selection = index.select(user_prompt, VOCAB_MAX_DISEASES, VOCAB_MAX_SYMPTOMS, VOCAB_TOKEN_BUDGET)
+    with vocabulary_lock:
+        vocabulary_cache['requests'] += 1
+        vocabulary_cache['tokens_saved'] += selection['tokens_saved']
+    
+    logger.info(f"Vocabulary filtered to {len(selection['selected'].get('Diseases', []))} diseases and "
+                f"{len(selection['selected'].get('Symptoms', []))} symptoms, "
+                f"~{selection['tokens_saved']} of {selection['full_tokens']} tokens saved")
+    return selection['text']
+
+
+def sse_event(event, data):
+    """Format a server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def clean_gpt_response(gpt_response):
+    """Remove the markdown formatting around the JSON of a GPT response."""
+    return re.sub(r'^```json\n|^```\n|```$', '', gpt_response.strip())
+
+
+def is_json_response(gpt_response):
+    """Check whether a GPT response parses as JSON, only those are cached."""
+    try:
+        json.loads(clean_gpt_response(gpt_response))
+        return True
+    except ValueError:
+        return False
+
+
+def stream_gpt_events(system_prompt, user_prompt):
+    """
+    Generate the server-sent events of a streamed GPT inference.
+    
+    Each fragment of the completion is sent as a 'token' event. As soon as the
+    {"result": [...]} object is complete it is parsed and sent as the final 'result' event;
+    any trailing text (such as a closing markdown fence) is still read so the full completion
+    lands in the response cache. Objects without a "result" list before it are skipped. An
+    'error' event is sent if no such object can be parsed, and the completion is then not cached.
+    """
+    scanner = JSONObjectScanner()
+    try:
+        for text in gpt_client.stream(system_prompt, user_prompt,
+                                      validate=lambda content: scanner.result is not None):
+            if scanner.result is not None:
+                continue
+            yield sse_event('token', {"text": text})
+            if scanner.feed(text) is not None:
+                logger.info("Streamed GPT response contains a complete result object")
+                yield sse_event('result', scanner.result)
+        
+        if scanner.result is None:
+            logger.error("Streamed GPT response does not contain a result object")
+            yield sse_event('error', {
+                "success": False,
+                "error": "Invalid JSON response from GPT",
+                "raw_response": scanner.buffer
+            })
+    
+    except Exception as e:
+        logger.error(f"Error in streamed GPT inference: {str(e)}")
+        yield sse_event('error', {"success": False, "error": str(e)})
+
+
 @app.route('/api/gpt-inference', methods=['POST', 'OPTIONS'])
 def gpt_inference():
     # Handle preflight OPTIONS request
@@ -488,6 +887,10 @@ def gpt_inference():
             print(f"\n----- FILE READ ERROR -----")
             print(f"Error: {str(file_err)}")
             existing_data = ""
+        
+        # Only inject the part of the existing data that is relevant to this prompt
+        if VOCAB_FILTER and existing_data:
+            existing_data = select_vocabulary(existing_data, user_prompt)
             
         # Create system prompt with instructions to use existing data
         # Headache, Nausea
@@ -533,20 +936,19 @@ def gpt_inference():
         print("\n----- USER PROMPT -----")
         print(user_prompt)
         
-        # Initialize OpenAI client
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        
-        # Call OpenAI API using client library
-        completion = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        )
+        # Opt-in streaming mode, the tokens are forwarded as server-sent events
+        if request.json.get('stream') or request.args.get('stream') == '1':
+            response = Response(
+                stream_with_context(stream_gpt_events(system_prompt, user_prompt)),
+                mimetype='text/event-stream'
+            )
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            response.headers.add("Access-Control-Allow-Origin", "*")
+            return response
         
-        # Process response
-        gpt_response = completion.choices[0].message.content
+        # Call OpenAI API through the shared client, identical prompts are served from its cache
+        gpt_response = gpt_client.complete(system_prompt, user_prompt, validate=is_json_response)
         
         # Print the raw response to terminal
         print("\n----- RAW GPT RESPONSE -----")
@@ -557,7 +959,7 @@ def gpt_inference():
         # Parse JSON from the response
         try:
             # Remove any markdown formatting if present
-            clean_response = re.sub(r'^```json\n|^```\n|```$', '', gpt_response.strip())
+            clean_response = clean_gpt_response(gpt_response)
             
             # Print the cleaned response
             print("\n----- CLEANED RESPONSE -----")
@@ -599,6 +1001,37 @@ def gpt_inference():
         return response, 500
 
 
+# Endpoint to get the GPT response cache counters
+@app.route('/api/gpt-inference/stats', methods=['GET'])
+def gpt_inference_stats():
+    stats = gpt_client.cache.stats() if gpt_client.cache is not None else {}
+    with vocabulary_lock:
+        vocabulary_stats = {
+            "enabled": VOCAB_FILTER,
+            "requests": vocabulary_cache['requests'],
+            "tokens_saved": vocabulary_cache['tokens_saved']
+        }
+    response = jsonify({"success": True, "model": gpt_client.model, "cache": stats, "vocabulary": vocabulary_stats})
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
+
+# Endpoint to get the analysis cache counters
+@app.route('/api/analyze/stats', methods=['GET'])
+def analyze_stats():
+    response = jsonify({"success": True, "cache": analysis_cache.stats()})
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
+
+# Endpoint to get the number of background analysis jobs by status
+@app.route('/api/jobs/stats', methods=['GET'])
+def jobs_stats():
+    response = jsonify({"success": True, "jobs": analysis_jobs.stats()})
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
+
 # Simple test endpoint
 @app.route('/', methods=['GET'])
 def index():
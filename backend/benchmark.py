@@ -0,0 +1,617 @@
+"""
+Benchmarks of the knowledge graph analysis on synthetic ground truths of growing size.
+
+Usage:
+    python benchmark.py edge-matching [--sizes 1000 10000 100000 1000000]
+    python benchmark.py counterfactuals [--sizes 1000 10000 100000 1000000]
+    python benchmark.py counterfactuals-lsh [--sizes 1000 10000 100000 1000000]
+    python benchmark.py graph-build [--sizes 1000 10000 100000 1000000]
+    python benchmark.py request-setup [--sizes 1000 10000 100000 1000000]
+    python benchmark.py edit-rewarm [--sizes 1000 10000 100000 1000000]
+    python benchmark.py candidates [--sizes 1000 10000 100000 1000000]
+    python benchmark.py csv-build [--sizes 1000000 10000000]
+    python benchmark.py csv-stream [--sizes 1000000 10000000]
+    python benchmark.py csv-shards [--sizes 1000000 10000000]
+    python benchmark.py csv-incremental [--sizes 1000000 10000000]
+    python benchmark.py csv-thresholds [--sizes 1000000 10000000]
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from analysis_cache import AnalysisCache
+from graph_core import CompactGraph
+from incidence import DiseaseFactorMatrix, MinHashLSHIndex
+from kg_store import GroundTruthStore
+from xai import GroundTruthIndex, KGExplainer
+
+# The CSV builder is a script, its file name is not a valid module name
+csv_to_jsonkg = importlib.import_module('csv-to-jsonkg')
+
+# Factor types of the synthetic graphs: (node type, relationship, number of values)
+FACTOR_TYPES = [
+    ('Symptom', 'HAS_SYMPTOM', 1000),
+    ('Age Group', 'COMMON_IN', 4),
+    ('Gender', 'PREVALENT_IN', 2),
+    ('Blood Pressure', 'ASSOCIATED_WITH', 3),
+    ('Cholesterol Level', 'CORRELATED_WITH', 3)
+]
+
+
+def make_ground_truth(num_links, links_per_disease=10, seed=0, variants=1):
+    """
+    Generate a ground truth KG with about num_links links.
+
+    Each disease gets links_per_disease links: a few demographic and vital factors and
+    symptoms drawn from a pool of 1000, with random weights. With variants > 1, diseases come
+    in families of that size whose members only differ from the first one by two symptoms.
+    """
+    rng = random.Random(seed)
+    nodes = []
+    links = []
+
+    factors = {}
+    for node_type, relationship, count in FACTOR_TYPES:
+        factors[relationship] = [f"{node_type} {i}" for i in range(count)]
+        nodes.extend({'id': node_id, 'type': node_type} for node_id in factors[relationship])
+
+    num_diseases = max(1, num_links // links_per_disease)
+    for i in range(num_diseases):
+        disease = f"Disease {i}"
+        nodes.append({'id': disease, 'type': 'Disease'})
+
+        if i % variants == 0:
+            targets = [(relationship, rng.choice(values)) for relationship, values in factors.items()
+                       if relationship != 'HAS_SYMPTOM']
+            symptoms = rng.sample(factors['HAS_SYMPTOM'], links_per_disease - len(targets))
+            targets.extend(('HAS_SYMPTOM', symptom) for symptom in symptoms)
+            family = targets
+        else:
+            targets = list(family)
+            for position in rng.sample(range(len(targets) - len(symptoms), len(targets)), 2):
+                targets[position] = ('HAS_SYMPTOM', rng.choice(factors['HAS_SYMPTOM']))
+            targets = list(dict.fromkeys(targets))
+
+        for relationship, target in targets:
+            links.append({
+                'source': disease,
+                'target': target,
+                'relationship': relationship,
+                'weight': round(rng.uniform(0.3, 1.0), 3)
+            })
+
+    return {'nodes': nodes, 'links': links}
+
+
+def make_prediction(ground_truth, seed=0):
+    """Generate a prediction KG for a random disease of the ground truth, half of it matching."""
+    rng = random.Random(seed)
+    diseases = [node['id'] for node in ground_truth['nodes'] if node['type'] == 'Disease']
+    disease = rng.choice(diseases)
+    gt_links = [link for link in ground_truth['links'] if link['source'] == disease]
+
+    nodes = [{'id': disease, 'type': 'Disease'}]
+    links = []
+    for i, gt_link in enumerate(gt_links):
+        target = gt_link['target'] if i % 2 == 0 else f"Novel Symptom {i}"
+        nodes.append({'id': target, 'type': 'Symptom'})
+        links.append({'source': disease, 'target': target, 'relationship': gt_link['relationship'], 'weight': 1.0})
+
+    return {'nodes': nodes, 'links': links}
+
+
+def best_time(func, repeat=3):
+    """Return the best wall-clock time of several runs of a function, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def linear_edge_match(ground_truth, prediction):
+    """Match prediction links against the ground truth the old way, scanning all its links."""
+    matches = {}
+    for link in prediction['links']:
+        for gt_link in ground_truth['links']:
+            gt_source = gt_link['source'] if isinstance(gt_link['source'], str) else gt_link['source']['id']
+            gt_target = gt_link['target'] if isinstance(gt_link['target'], str) else gt_link['target']['id']
+            if (gt_source == link['source'] and gt_target == link['target'] and
+                    gt_link['relationship'] == link['relationship']):
+                matches[(link['source'], link['target'])] = gt_link.get('weight', 0)
+                break
+    return matches
+
+
+def indexed_edge_match(edges, prediction):
+    """Match prediction links against a prebuilt ground truth edge index."""
+    matches = {}
+    for link in prediction['links']:
+        key = (link['source'], link['target'], link['relationship'])
+        if key in edges:
+            matches[(link['source'], link['target'])] = edges[key]
+    return matches
+
+
+def benchmark_edge_matching(sizes):
+    """Compare the linear scan and the edge index for classifying prediction links."""
+    print(f"{'GT links':>10} {'linear scan':>14} {'index build':>14} {'index lookup':>14} {'speedup':>10}")
+    for size in sizes:
+        ground_truth = make_ground_truth(size)
+        prediction = make_prediction(ground_truth)
+
+        repeat = 1 if size >= 10 ** 6 else 3
+        linear = best_time(lambda: linear_edge_match(ground_truth, prediction), repeat)
+        build = best_time(lambda: KGExplainer.build_edge_index(ground_truth), repeat)
+        edges = KGExplainer.build_edge_index(ground_truth)
+        lookup = best_time(lambda: indexed_edge_match(edges, prediction), 10)
+
+        assert linear_edge_match(ground_truth, prediction) == indexed_edge_match(edges, prediction)
+        print(f"{len(ground_truth['links']):>10} {linear * 1000:>12.2f}ms {build * 1000:>12.2f}ms "
+              f"{lookup * 1e6:>12.2f}us {linear / lookup:>9.0f}x")
+
+
+def loop_alternatives(ground_truth, ground_truth_nx, disease, factors, k=3):
+    """Rank the alternative diagnoses the old way, building the factor set of every disease."""
+    similarity = {}
+    for node in ground_truth['nodes']:
+        if node['type'] == 'Disease' and node['id'] != disease:
+            disease_factors = {target for _, target in ground_truth_nx.out_edges(node['id'])}
+            combined = factors | disease_factors
+            if combined:
+                similarity[node['id']] = len(factors & disease_factors) / len(combined)
+    return sorted(similarity.items(), key=lambda x: x[1], reverse=True)[:k]
+
+
+def matrix_alternatives(matrix, disease, factors, k=3, metric='jaccard'):
+    """Rank the alternative diagnoses with the disease x factor matrix."""
+    similarities, defined = matrix.similarities(factors, metric)
+    return matrix.top_k(similarities, defined, k, exclude=[disease])
+
+
+def benchmark_counterfactuals(sizes):
+    """Compare the per-disease loop and the incidence matrix for ranking alternative diagnoses."""
+    print(f"{'GT links':>10} {'loop':>12} {'matrix build':>14} {'jaccard':>12} {'w. jaccard':>12} "
+          f"{'cosine':>12} {'speedup':>10}")
+    for size in sizes:
+        ground_truth = make_ground_truth(size)
+        prediction = make_prediction(ground_truth)
+        disease = prediction['nodes'][0]['id']
+        factors = {link['target']: link['weight'] for link in prediction['links']}
+        ground_truth_nx = KGExplainer.to_networkx(ground_truth)
+
+        repeat = 1 if size >= 10 ** 6 else 3
+        loop = best_time(lambda: loop_alternatives(ground_truth, ground_truth_nx, disease, set(factors)), repeat)
+        build = best_time(lambda: DiseaseFactorMatrix(ground_truth), repeat)
+        matrix = DiseaseFactorMatrix(ground_truth)
+        times = [best_time(lambda: matrix_alternatives(matrix, disease, factors, metric=metric), 10)
+                 for metric in ('jaccard', 'weighted_jaccard', 'cosine')]
+
+        assert loop_alternatives(ground_truth, ground_truth_nx, disease, set(factors)) == \
+            matrix_alternatives(matrix, disease, factors)
+        print(f"{len(ground_truth['links']):>10} {loop * 1000:>10.2f}ms {build * 1000:>12.2f}ms " +
+              " ".join(f"{t * 1000:>10.2f}ms" for t in times) + f" {loop / times[0]:>9.0f}x")
+
+
+def benchmark_counterfactuals_lsh(sizes, queries=100, k=3):
+    """
+    Compare the exact alternatives of the incidence matrix with the approximate ones of the
+    LSH index, on graphs of disease families of 5 variants.
+
+    Recall is the share of the exact top k the approximate top k finds, counting an
+    approximate result as found when it is as similar as the k-th exact one (ties).
+    """
+    print(f"{'GT links':>10} {'matrix build':>14} {'LSH build':>12} {'exact/query':>13} "
+          f"{'LSH/query':>12} {'candidates':>11} {'recall@' + str(k):>10}")
+    for size in sizes:
+        ground_truth = make_ground_truth(size, variants=5)
+        matrix = DiseaseFactorMatrix(ground_truth)
+        build = best_time(lambda: DiseaseFactorMatrix(ground_truth), 1)
+        lsh_build = best_time(lambda: MinHashLSHIndex(ground_truth), 1)
+        lsh = MinHashLSHIndex(ground_truth)
+
+        rng = random.Random(1)
+        exact_time = approximate_time = 0
+        found = expected = candidates = 0
+        for _ in range(queries):
+            disease = rng.choice(matrix.diseases)
+            factors = dict(lsh.factors[disease])
+
+            start = time.perf_counter()
+            exact = matrix_alternatives(matrix, disease, factors, k)
+            exact_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            approximate = lsh.top_k(factors, k, exclude=[disease])
+            approximate_time += time.perf_counter() - start
+
+            candidates += len(lsh.candidates(factors))
+            if exact:
+                threshold = exact[-1][1]
+                found += sum(1 for _, similarity in approximate if similarity >= threshold - 1e-12)
+                expected += len(exact)
+
+        print(f"{len(ground_truth['links']):>10} {build * 1000:>12.2f}ms {lsh_build * 1000:>10.2f}ms "
+              f"{exact_time / queries * 1000:>11.3f}ms {approximate_time / queries * 1000:>10.3f}ms "
+              f"{candidates / queries:>11.1f} {found / expected if expected else 1:>10.3f}")
+
+
+def allocated_size(func):
+    """Return the result of a function and the memory it still holds allocated, in bytes."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def peak_size(func):
+    """Return the result of a function and the peak memory it allocated while running, in bytes."""
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_graph_build(sizes):
+    """Compare the NetworkX graph and the CompactGraph the explainer runs on."""
+    print(f"{'GT links':>10} {'nx build':>12} {'compact build':>14} {'nx memory':>12} "
+          f"{'compact memory':>15} {'nx edges':>12} {'compact edges':>14}")
+    for size in sizes:
+        ground_truth = make_ground_truth(size)
+        diseases = [node['id'] for node in ground_truth['nodes'] if node['type'] == 'Disease'][:1000]
+
+        repeat = 1 if size >= 10 ** 6 else 3
+        nx_build = best_time(lambda: KGExplainer.to_networkx(ground_truth), repeat)
+        compact_build = best_time(lambda: CompactGraph(ground_truth), repeat)
+        graph, nx_memory = allocated_size(lambda: KGExplainer.to_networkx(ground_truth))
+        compact, compact_memory = allocated_size(lambda: CompactGraph(ground_truth))
+
+        # Time to read the outgoing edges of a disease, as the profiles do
+        nx_edges = best_time(lambda: [list(graph.out_edges(disease, data=True)) for disease in diseases])
+        compact_edges = best_time(lambda: [compact.out_edges(disease) for disease in diseases])
+
+        print(f"{len(ground_truth['links']):>10} {nx_build * 1000:>10.2f}ms {compact_build * 1000:>12.2f}ms "
+              f"{nx_memory / 2 ** 20:>10.1f}MB {compact_memory / 2 ** 20:>13.1f}MB "
+              f"{nx_edges / len(diseases) * 1e6:>10.2f}us {compact_edges / len(diseases) * 1e6:>12.2f}us")
+
+
+def benchmark_request_setup(sizes):
+    """Compare analyzing a prediction from the raw ground truth and from a warm GroundTruthIndex."""
+    print(f"{'GT links':>10} {'cold setup':>12} {'index setup':>13} {'index analyze':>15}")
+    for size in sizes:
+        ground_truth = make_ground_truth(size)
+        prediction = make_prediction(ground_truth)
+
+        # The explainer prints a summary of the graphs it loads
+        with contextlib.redirect_stdout(io.StringIO()):
+            index = GroundTruthIndex(ground_truth)
+            KGExplainer.from_index(index, prediction).analyze()
+
+            repeat = 1 if size >= 10 ** 6 else 3
+            cold = best_time(lambda: KGExplainer.from_graphs(ground_truth, prediction), repeat)
+            setup = best_time(lambda: KGExplainer.from_index(index, prediction), 10)
+            analyze = best_time(lambda: KGExplainer.from_index(index, prediction).analyze(), 3)
+
+        print(f"{len(ground_truth['links']):>10} {cold * 1000:>10.2f}ms {setup * 1000:>11.3f}ms "
+              f"{analyze * 1000:>13.2f}ms")
+
+
+def warm_index(index, diseases):
+    """Build every structure of a GroundTruthIndex and the profiles of some diseases."""
+    index.graph, index.edges, index.factors, index.lsh, index.structure, index.visualization_base
+    for disease in diseases:
+        index.profiles.get(disease)
+
+
+def benchmark_edit_rewarm(sizes, predictions=100, edits=5):
+    """
+    Measure the time from a disease edit to a fully warm ground truth index again, patching
+    the index of the previous version or building it cold, and how many cached analyses
+    (explanations) the edit leaves valid.
+    """
+    logging.disable(logging.INFO)
+    print(f"{'GT links':>10} {'patched':>12} {'cold':>12} {'speedup':>9} {'cached kept':>12}")
+    for size in sizes:
+        ground_truth = make_ground_truth(size)
+        queries = [make_prediction(ground_truth, seed) for seed in range(predictions)]
+        diseases = [query['nodes'][0]['id'] for query in queries]
+        rng = random.Random(1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "knowledge_graph.json")
+            with open(path, 'w') as f:
+                json.dump(ground_truth, f)
+            store = GroundTruthStore(path)
+            snapshot = store.get()
+            warm_index(snapshot.ground_truth, diseases)
+
+            cache = AnalysisCache(predictions)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i, query in enumerate(queries):
+                    explainer = KGExplainer.from_index(snapshot.ground_truth, query)
+                    explainer.analyze(['explanations'])
+                    cache.put(i, snapshot.version, explainer.analysis_results['explanations'],
+                              explainer.get_dependencies())
+
+            patched = cold = 0
+            kept = 0
+            for _ in range(edits):
+                disease = rng.choice(snapshot.ground_truth.factors.diseases)
+                connections = [{'target': f"Symptom {rng.randrange(1000)}", 'relationship': 'HAS_SYMPTOM',
+                                'weight': round(rng.uniform(0.3, 1.0), 3)} for _ in range(10)]
+
+                start = time.perf_counter()
+                snapshot = store.update_disease(disease, 'modify', connections)
+                warm_index(snapshot.ground_truth, diseases)
+                patched += time.perf_counter() - start
+
+                start = time.perf_counter()
+                warm_index(GroundTruthIndex(snapshot.kg), diseases)
+                cold += time.perf_counter() - start
+
+                cache.invalidate(snapshot.version, snapshot.edit)
+                kept += cache.stats()['size']
+
+        print(f"{len(ground_truth['links']):>10} {patched / edits * 1000:>10.2f}ms {cold / edits * 1000:>10.2f}ms "
+              f"{cold / patched:>8.1f}x {kept / edits / predictions:>11.1%}")
+
+
+def merge_predictions(predictions):
+    """Merge single disease predictions into one prediction with several candidate diseases."""
+    nodes, links, seen = [], [], set()
+    for prediction in predictions:
+        for node in prediction['nodes']:
+            if node['id'] not in seen:
+                seen.add(node['id'])
+                nodes.append(node)
+        links.extend(prediction['links'])
+    return {'nodes': nodes, 'links': links}
+
+
+def benchmark_candidates(sizes, candidates=5):
+    """Compare ranking several candidate diseases in one pass with one full analysis per candidate."""
+    print(f"{'GT links':>10} {'candidates':>11} {'separate':>12} {'one pass':>12} {'speedup':>9}")
+    for size in sizes:
+        ground_truth = make_ground_truth(size)
+        predictions = []
+        for seed in range(candidates * 3):
+            prediction = make_prediction(ground_truth, seed)
+            if prediction['nodes'][0]['id'] not in [p['nodes'][0]['id'] for p in predictions]:
+                predictions.append(prediction)
+            if len(predictions) == candidates:
+                break
+        merged = merge_predictions(predictions)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            index = GroundTruthIndex(ground_truth)
+            warm_index(index, [])
+            separate = best_time(lambda: [KGExplainer.from_index(index, prediction).analyze()
+                                          for prediction in predictions])
+            one_pass = best_time(lambda: KGExplainer.from_index(index, merged).analyze_candidates())
+
+        print(f"{len(ground_truth['links']):>10} {len(predictions):>11} {separate * 1000:>10.2f}ms "
+              f"{one_pass * 1000:>10.2f}ms {separate / one_pass:>8.1f}x")
+
+
+def make_dataset(rows, num_diseases=40, seed=0):
+    """
+    Generate a medical dataset with the columns of the CSV the ground truth is built from.
+
+    The cells of a column share their string objects, so datasets of 10^7 rows fit in memory.
+    """
+    rng = np.random.default_rng(seed)
+
+    def column(values):
+        return rng.choice(np.array(values, dtype=object), rows)
+
+    df = pd.DataFrame({'Disease': column([f"Disease {i}" for i in range(num_diseases)])})
+    for feature in csv_to_jsonkg.FEATURE_SCHEMA:
+        if feature['binning'] == 'binary':
+            df[feature['column']] = column(['Yes', 'No'])
+    df['Age'] = rng.integers(0, 90, rows)
+    df['Gender'] = column(['Male', 'Female'])
+    df['Blood Pressure'] = column(['Low', 'Normal', 'High'])
+    df['Cholesterol Level'] = column(['Low', 'Normal', 'High'])
+    return df
+
+
+def masked_feature_counts(df):
+    """Count the feature values the old way, masking the rows of every disease once per feature."""
+    counts = {'features': {}}
+    diseases = df['Disease'].unique()
+    for feature in csv_to_jsonkg.FEATURE_SCHEMA:
+        column = feature['column']
+        table = counts['features'][column] = {}
+        for disease in diseases:
+            values = df[df['Disease'] == disease][column]
+            if feature['binning'] == 'binary':
+                count = int((values == feature['positive']).sum())
+                if count:
+                    table[(disease, feature['positive'])] = count
+            elif feature['binning'] == 'ranges':
+                for value in values:
+                    for name, low, high in feature['bins']:
+                        if low <= value <= high:
+                            table[(disease, name)] = table.get((disease, name), 0) + 1
+                            break
+            else:
+                for value, count in values.value_counts().items():
+                    table[(disease, value)] = int(count)
+    return counts
+
+
+def benchmark_csv_build(sizes):
+    """Compare counting the feature values of a dataset per disease mask and in one grouped pass."""
+    print(f"{'rows':>10} {'masked':>10} {'grouped':>10} {'speedup':>9}")
+    for size in sizes:
+        df = make_dataset(size)
+
+        start = time.perf_counter()
+        expected = masked_feature_counts(df)
+        masked = time.perf_counter() - start
+
+        grouped = best_time(lambda: csv_to_jsonkg.count_features(df))
+        counts = csv_to_jsonkg.count_features(df)
+        assert all(counts[table] == expected[table] for table in expected)
+        print(f"{size:>10} {masked:>9.2f}s {grouped:>9.2f}s {masked / grouped:>8.1f}x")
+
+
+def benchmark_csv_stream(sizes, whole_max_rows=10 ** 6):
+    """
+    Compare counting the features of a CSV file read whole and streamed in chunks of
+    categoricals. Files of more than whole_max_rows rows are only streamed, read whole they
+    do not fit in the memory of a small machine.
+    """
+    print(f"{'rows':>10} {'whole':>10} {'streamed':>10} {'whole peak':>12} {'streamed peak':>14}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dataset.csv")
+            make_dataset(size).to_csv(path, index=False)
+
+            streamed = best_time(lambda: csv_to_jsonkg.count_csv(path), 1)
+            counts, streamed_peak = peak_size(lambda: csv_to_jsonkg.count_csv(path))
+
+            if size <= whole_max_rows:
+                whole = best_time(lambda: csv_to_jsonkg.count_features(pd.read_csv(path)), 1)
+                expected, whole_peak = peak_size(lambda: csv_to_jsonkg.count_features(pd.read_csv(path)))
+                assert counts == expected
+                print(f"{size:>10} {whole:>9.2f}s {streamed:>9.2f}s {whole_peak / 2 ** 20:>10.1f}MB "
+                      f"{streamed_peak / 2 ** 20:>12.1f}MB")
+            else:
+                print(f"{size:>10} {'-':>10} {streamed:>9.2f}s {'-':>12} {streamed_peak / 2 ** 20:>12.1f}MB")
+
+
+def benchmark_csv_shards(sizes, shards=16):
+    """Measure how counting a dataset split in CSV shards scales with the number of worker processes."""
+    cores = os.cpu_count() or 1
+    workers = [1]
+    while workers[-1] * 2 <= cores:
+        workers.append(workers[-1] * 2)
+    if workers[-1] != cores:
+        workers.append(cores)
+
+    print(f"{'rows':>10} {'shards':>7} {'workers':>8} {'time':>10} {'speedup':>9}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            df = make_dataset(size)
+            paths = []
+            for i, rows in enumerate(np.array_split(np.arange(size), shards)):
+                paths.append(os.path.join(directory, f"shard-{i:03d}.csv"))
+                df.iloc[rows].to_csv(paths[-1], index=False)
+            del df
+
+            single = None
+            for count in workers:
+                elapsed = best_time(lambda: csv_to_jsonkg.count_csvs(paths, count), 1)
+                single = single or elapsed
+                print(f"{size:>10} {shards:>7} {count:>8} {elapsed:>9.2f}s {single / elapsed:>8.1f}x")
+
+
+def benchmark_csv_incremental(sizes, shards=16, appended=0.01):
+    """Compare rebuilding the knowledge graph of CSV shards and updating it after rows are appended."""
+    print(f"{'rows':>10} {'appended':>9} {'rebuild':>10} {'update':>10} {'speedup':>9}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            df = make_dataset(size + int(size * appended))
+            paths = []
+            for i, rows in enumerate(np.array_split(np.arange(size), shards)):
+                paths.append(os.path.join(directory, f"shard-{i:03d}.csv"))
+                df.iloc[rows].to_csv(paths[-1], index=False)
+            output_path = os.path.join(directory, "knowledge_graph.json")
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                csv_to_jsonkg.update_knowledge_graph_from_csvs(paths, output_path)
+                df.iloc[size:].to_csv(paths[-1], index=False, header=False, mode='a')
+
+                start = time.perf_counter()
+                updated = csv_to_jsonkg.update_knowledge_graph_from_csvs(paths, output_path)
+                update = time.perf_counter() - start
+
+                start = time.perf_counter()
+                rebuilt = csv_to_jsonkg.create_knowledge_graph_from_csvs(paths, output_path)
+                rebuild = time.perf_counter() - start
+
+            assert updated == rebuilt
+            print(f"{size:>10} {len(df) - size:>9} {rebuild:>9.2f}s {update:>9.2f}s {rebuild / update:>8.1f}x")
+
+
+def benchmark_csv_thresholds(sizes, thresholds=(0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5)):
+    """Compare building the knowledge graph of a CSV file once per threshold and all of them from one count."""
+    print(f"{'rows':>10} {'thresholds':>11} {'separate':>10} {'one count':>10} {'speedup':>9}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dataset.csv")
+            make_dataset(size).to_csv(path, index=False)
+
+            start = time.perf_counter()
+            separate = [csv_to_jsonkg.create_knowledge_graph_from_counts(csv_to_jsonkg.count_csv(path),
+                                                                         thresholds=threshold)
+                        for threshold in thresholds]
+            separate_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            variants = csv_to_jsonkg.create_knowledge_graph_variants(csv_to_jsonkg.count_csv(path), thresholds)
+            one_count = time.perf_counter() - start
+
+            assert variants == separate
+            print(f"{size:>10} {len(thresholds):>11} {separate_time:>9.2f}s {one_count:>9.2f}s "
+                  f"{separate_time / one_count:>8.1f}x")
+
+
+BENCHMARKS = {
+    'edge-matching': benchmark_edge_matching,
+    'counterfactuals': benchmark_counterfactuals,
+    'counterfactuals-lsh': benchmark_counterfactuals_lsh,
+    'graph-build': benchmark_graph_build,
+    'request-setup': benchmark_request_setup,
+    'edit-rewarm': benchmark_edit_rewarm,
+    'candidates': benchmark_candidates,
+    'csv-build': benchmark_csv_build,
+    'csv-stream': benchmark_csv_stream,
+    'csv-shards': benchmark_csv_shards,
+    'csv-incremental': benchmark_csv_incremental,
+    'csv-thresholds': benchmark_csv_thresholds
+}
+
+# Sizes of the benchmarks that do not count ground truth links
+DEFAULT_SIZES = {
+    'csv-build': [10 ** 6, 10 ** 7],
+    'csv-stream': [10 ** 6, 10 ** 7],
+    'csv-shards': [10 ** 6, 10 ** 7],
+    'csv-incremental': [10 ** 6, 10 ** 7],
+    'csv-thresholds': [10 ** 6, 10 ** 7]
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the knowledge graph analysis")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        help="Number of ground truth links of each run (rows of the dataset for csv-build)")
+    args = parser.parse_args()
+
+    sizes = args.sizes or DEFAULT_SIZES.get(args.benchmark, [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+    BENCHMARKS[args.benchmark](sizes)
+    return 0
+
+
+if __name__ == "__main__":
+    main()
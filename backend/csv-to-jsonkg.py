@@ -1,28 +1,684 @@
 import pandas as pd
+import numpy as np
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
 import json
+import multiprocessing
 import os
+import tempfile
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-def create_knowledge_graph_from_csv(csv_path, output_path=None):
+from file_utils import FileLock, atomic_write
+
+# Feature columns of the graph, linked to the Disease column. Every feature has:
+#   column: Column of the CSV
+#   node_id: Id of the node of a value, formatted with the column and the value
+#   node_type: Type of the nodes
+#   relationship: Relationship of the links from the diseases to the nodes
+#   binning: How the values become nodes:
+#       binary: One node, for the rows whose value is "positive"
+#       ranges: One node per bin of "bins" ([name, min, max], both ends included), with
+#           the ends as the "properties" of the node
+#       categorical: One node per value
+#   threshold: Minimum share of the rows of a disease for a link
+# The links of a disease follow the order of the features, the values of a categorical
+# feature from the most to the least common.
+FEATURE_SCHEMA = [
+    {"column": "Fever", "node_id": "{column}", "node_type": "Symptom", "relationship": "HAS_SYMPTOM",
+     "binning": "binary", "positive": "Yes", "threshold": 0.4},
+    {"column": "Cough", "node_id": "{column}", "node_type": "Symptom", "relationship": "HAS_SYMPTOM",
+     "binning": "binary", "positive": "Yes", "threshold": 0.4},
+    {"column": "Fatigue", "node_id": "{column}", "node_type": "Symptom", "relationship": "HAS_SYMPTOM",
+     "binning": "binary", "positive": "Yes", "threshold": 0.4},
+    {"column": "Difficulty Breathing", "node_id": "{column}", "node_type": "Symptom", "relationship": "HAS_SYMPTOM",
+     "binning": "binary", "positive": "Yes", "threshold": 0.4},
+    {"column": "Age", "node_id": "{value} Age", "node_type": "Age Group", "relationship": "COMMON_IN",
+     "binning": "ranges", "bins": [["Child", 0, 17], ["Young Adult", 18, 34], ["Middle Aged", 35, 59], ["Senior", 60, 120]],
+     "properties": ["min_age", "max_age"], "threshold": 0.3},
+    {"column": "Gender", "node_id": "{value} Gender", "node_type": "Gender", "relationship": "PREVALENT_IN",
+     "binning": "categorical", "threshold": 0.3},
+    {"column": "Blood Pressure", "node_id": "{value} Blood Pressure", "node_type": "Blood Pressure",
+     "relationship": "ASSOCIATED_WITH", "binning": "categorical", "threshold": 0.3},
+    {"column": "Cholesterol Level", "node_id": "{value} Cholesterol", "node_type": "Cholesterol Level",
+     "relationship": "CORRELATED_WITH", "binning": "categorical", "threshold": 0.3}
+]
+
+# Keys of a feature, and the extra keys of every binning
+FEATURE_KEYS = ["column", "node_id", "node_type", "relationship", "binning", "threshold"]
+BINNING_KEYS = {"binary": ["positive"], "ranges": ["bins"], "categorical": []}
+
+# Rows read at a time when streaming a CSV
+CSV_CHUNK_SIZE = 100000
+
+# Bytes of a CSV file hashed at its start and before its watermark to detect a rewritten file
+FINGERPRINT_SIZE = 65536
+
+
+def validate_schema(schema):
     """
-    Creates a clear and explicit knowledge graph in JSON format from a medical dataset CSV.
+    Check a feature schema (see FEATURE_SCHEMA).
     
-    This graph connects diseases to their associated features for better explainability.
-    Each node represents either a disease or a specific feature value (e.g., "High Blood Pressure").
+    Raises:
+        ValueError: If a feature misses a key, has an unknown binning or invalid bins, or
+            repeats a column
+    """
+    if not isinstance(schema, list) or not schema:
+        raise ValueError("The schema must be a non-empty list of features")
+    
+    columns = set()
+    for feature in schema:
+        if not isinstance(feature, dict):
+            raise ValueError(f"Invalid feature {feature!r}, expected an object")
+        missing = [key for key in FEATURE_KEYS if key not in feature]
+        if missing:
+            raise ValueError(f"Feature {feature.get('column')!r} misses {', '.join(missing)}")
+        column = feature["column"]
+        if feature["binning"] not in BINNING_KEYS:
+            raise ValueError(f"Unknown binning {feature['binning']!r} of {column!r}, "
+                             f"expected one of {', '.join(BINNING_KEYS)}")
+        missing = [key for key in BINNING_KEYS[feature["binning"]] if key not in feature]
+        if missing:
+            raise ValueError(f"Feature {column!r} misses {', '.join(missing)}")
+        if column == "Disease" or column in columns:
+            raise ValueError(f"Column {column!r} is used twice")
+        columns.add(column)
+        
+        if feature["binning"] == "ranges":
+            if not feature["bins"] or any(len(item) != 3 for item in feature["bins"]):
+                raise ValueError(f"The bins of {column!r} must be [name, min, max] lists")
+            if len(feature.get("properties") or [None, None]) != 2:
+                raise ValueError(f"The properties of {column!r} must be the names of the min and max")
+        try:
+            feature["node_id"].format(column=column, value="")
+        except (AttributeError, IndexError, KeyError, ValueError):
+            raise ValueError(f"Invalid node_id {feature['node_id']!r} of {column!r}, "
+                             "only {column} and {value} can be used")
+        if not isinstance(feature["threshold"], (int, float)):
+            raise ValueError(f"The threshold of {column!r} must be a number")
+    return schema
+
+
+def load_schema(path):
+    """Load a feature schema (see FEATURE_SCHEMA) from a JSON file and check it."""
+    with open(path, "r") as f:
+        return validate_schema(json.load(f))
+
+
+def get_csv_dtypes(schema):
+    """Return the dtypes of the columns read from the CSV, all of them but the ranges as categoricals."""
+    dtypes = {"Disease": "category"}
+    for feature in schema:
+        dtypes[feature["column"]] = None if feature["binning"] == "ranges" else "category"
+    return dtypes
+
+
+def read_csv_columns(csv_path, schema, **kwargs):
+    """Read the Disease and feature columns of a CSV (see pd.read_csv())."""
+    dtypes = get_csv_dtypes(schema)
+    return pd.read_csv(csv_path, usecols=list(dtypes),
+                       dtype={column: dtype for column, dtype in dtypes.items() if dtype}, **kwargs)
+
+
+def get_counting_schema(schema):
+    """Return the part of a schema the count tables depend on: the columns and their binnings."""
+    return [[feature["column"], feature["binning"], feature.get("positive"), feature.get("bins")]
+            for feature in schema]
+
+
+def get_node_id(feature, value):
+    """Return the id of the node of a feature value."""
+    return feature["node_id"].format(column=feature["column"], value=value)
+
+
+def get_bin_codes(values, bins):
+    """
+    Return the index in bins of every value, or -1 for the values outside all the bins
+    (missing, out of range or between two integer ranges).
+    """
+    values = np.asarray(values)
+    conditions = [(values >= low) & (values <= high) for _, low, high in bins]
+    return np.select(conditions, np.arange(len(bins)), default=-1)
+
+
+def count_pairs(disease_codes, value_codes, keep, diseases, values):
+    """
+    Count the rows of every (disease, value) pair in one pass.
+    
+    Args:
+        disease_codes: Disease of every row, as an index in diseases
+        value_codes: Value of every row, as an index in values
+        keep: Mask of the rows to count
+        diseases: Disease of every code
+        values: Value of every code
+    
+    Returns:
+        Dictionary of (disease, value) -> number of rows, in order of first appearance
+    """
+    keys = disease_codes[keep].astype(np.int64) * len(values) + value_codes[keep]
+    key_codes, first_keys = pd.factorize(keys)
+    counts = np.bincount(key_codes, minlength=len(first_keys))
+    return {(diseases[key // len(values)], values[key % len(values)]): count
+            for key, count in zip(first_keys.tolist(), counts.tolist())}
+
+
+def count_features(df, schema=FEATURE_SCHEMA):
+    """
+    Count the rows of every disease and of every disease and feature value, with one grouped
+    pass over the dataframe per feature.
+    
+    Args:
+        df: Dataframe of the medical dataset
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+    
+    Returns:
+        Dictionary of count tables:
+            rows: Number of rows
+            diseases: The values of the Disease column, in order of first appearance
+            totals: Disease -> number of rows
+            values: Feature column -> its values: the positive value of a binary feature,
+                the bin names of a ranges feature, or the values of a categorical feature
+                in order of first appearance
+            features: Feature column -> (disease, value) -> number of rows, in order of
+                first appearance
+        Missing diseases and values are listed in diseases and values but never counted.
+    """
+    disease_codes, diseases = pd.factorize(df["Disease"], use_na_sentinel=False)
+    known = ~pd.isna(diseases)[disease_codes]
+    totals = np.bincount(disease_codes[known], minlength=len(diseases)).tolist()
+    diseases = list(diseases)
+    
+    counts = {
+        "rows": len(df),
+        "diseases": diseases,
+        "totals": {disease: totals[code] for code, disease in enumerate(diseases) if totals[code]},
+        "values": {},
+        "features": {}
+    }
+    
+    for feature in schema:
+        column = feature["column"]
+        if feature["binning"] == "binary":
+            values = [feature["positive"]]
+            value_codes = np.zeros(len(df), dtype=np.int64)
+            keep = known & (df[column] == feature["positive"]).to_numpy()
+        elif feature["binning"] == "ranges":
+            values = [name for name, _, _ in feature["bins"]]
+            value_codes = get_bin_codes(df[column].to_numpy(), feature["bins"])
+            keep = known & (value_codes >= 0)
+        else:
+            value_codes, values = pd.factorize(df[column], use_na_sentinel=False)
+            keep = known & ~pd.isna(values)[value_codes]
+            values = list(values)
+        counts["values"][column] = values
+        counts["features"][column] = count_pairs(disease_codes, value_codes, keep, diseases, values)
+    
+    return counts
+
+
+def merge_values(values, other):
+    """Concatenate two lists of values in order of first appearance, without duplicates."""
+    return list(pd.unique(np.array(values + other, dtype=object)))
+
+
+def add_counts(counts, other):
+    """Add two count dictionaries, the keys of the first one first."""
+    result = dict(counts)
+    for key, count in other.items():
+        result[key] = result.get(key, 0) + count
+    return result
+
+
+def merge_counts(counts, other):
+    """
+    Merge the count tables of two parts of a dataset, counted with the same schema.
+    
+    The merge is associative, and merging the tables of the consecutive parts of a dataset in
+    order gives the tables of the whole dataset, orders of first appearance included.
+    
+    Args:
+        counts: Count tables of the first part, from count_features()
+        other: Count tables of the part that follows it
+    
+    Returns:
+        The count tables of both parts, the arguments are left unchanged
+    """
+    return {
+        "rows": counts["rows"] + other["rows"],
+        "diseases": merge_values(counts["diseases"], other["diseases"]),
+        "totals": add_counts(counts["totals"], other["totals"]),
+        "values": {column: merge_values(values, other["values"][column])
+                   for column, values in counts["values"].items()},
+        "features": {column: add_counts(table, other["features"][column])
+                     for column, table in counts["features"].items()}
+    }
+
+
+def count_csv(csv_path, chunksize=CSV_CHUNK_SIZE, schema=FEATURE_SCHEMA):
+    """
+    Count the features of a CSV file, streaming it in chunks.
+    
+    Only the columns of the graph are read, the text ones as categoricals, and the count
+    tables of the chunks are merged as they are read. The memory used is bounded by the chunk
+    size and the number of (disease, value) pairs, not by the number of rows.
     
     Args:
         csv_path: Path to the CSV file
-        output_path: Path to save the JSON output (default: same directory as CSV)
+        chunksize: Number of rows read at a time
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
     
     Returns:
-        The knowledge graph as a dictionary
+        The count tables of the file, see count_features()
     """
-    # Read the CSV
-    df = pd.read_csv(csv_path)
+    counts = None
+    with read_csv_columns(csv_path, schema, chunksize=chunksize) as reader:
+        for chunk in reader:
+            chunk_counts = count_features(chunk, schema)
+            counts = chunk_counts if counts is None else merge_counts(counts, chunk_counts)
     
-    # Set default output path if not provided
-    if output_path is None:
-        output_path = os.path.join(os.path.dirname(csv_path), "knowledge_graph.json")
+    if counts is None:
+        # A file without rows
+        counts = count_features(read_csv_columns(csv_path, schema), schema)
+    return counts
+
+
+def expand_csv_paths(patterns):
+    """
+    Return the CSV files of a list of paths and glob patterns.
+    
+    The files matching a pattern are taken in sorted order, and a file given twice is only
+    counted once.
+    
+    Args:
+        patterns: Paths and glob patterns (e.g. "exports/*/2024-*.csv"), or a single one
+    
+    Returns:
+        List of CSV file paths
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                raise ValueError(f"No CSV file matches {pattern}")
+            paths.extend(matches)
+        else:
+            paths.append(pattern)
+    return list(dict.fromkeys(paths))
+
+
+def count_shard(csv_path, chunksize=CSV_CHUNK_SIZE, schema=FEATURE_SCHEMA):
+    """
+    Count the features of one CSV shard, in a worker process of count_csvs().
+    
+    Returns:
+        Tuple of the count tables of the shard and its timing ({"path", "rows", "seconds"})
+    """
+    start = time.perf_counter()
+    counts = count_csv(csv_path, chunksize, schema)
+    return counts, {"path": csv_path, "rows": counts["rows"], "seconds": time.perf_counter() - start}
+
+
+def get_pool_context():
+    """
+    Return the multiprocessing context of the worker processes: fork where the platform has it,
+    so the workers inherit this module, which is loaded with importlib under a name that is not
+    a valid module name. Elsewhere the workers are spawned and import it again by that name.
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def map_shards(func, tasks, workers=None, context=None):
+    """
+    Call a function on every task in a pool of worker processes.
+    
+    If the pool breaks, e.g. because the workers cannot load the function, the tasks are run
+    again in this process.
+    
+    Args:
+        func: Function called as func(*task)
+        tasks: List of argument tuples
+        workers: Number of worker processes, one per core by default
+        context: Multiprocessing context of the workers, get_pool_context() by default
+    
+    Returns:
+        List of the results, in the order of the tasks
+    """
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        return [func(*task) for task in tasks]
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context or get_pool_context()) as executor:
+            return list(executor.map(func, *zip(*tasks)))
+    except BrokenProcessPool as e:
+        print(f"Worker processes failed ({e}), counting in this process")
+        return [func(*task) for task in tasks]
+
+
+def count_csvs(csv_paths, workers=None, chunksize=CSV_CHUNK_SIZE, schema=FEATURE_SCHEMA):
+    """
+    Count the features of several CSV shards in parallel and merge their count tables.
+    
+    Every shard is counted by a process of a pool, and the tables are merged in the order of
+    csv_paths, so the result is the same as counting the shards concatenated in that order.
+    
+    Args:
+        csv_paths: Paths of the CSV files
+        workers: Number of worker processes, one per core by default
+        chunksize: Number of rows read at a time
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+    
+    Returns:
+        Tuple of the merged count tables and the timing of every shard, see count_shard()
+    """
+    if not csv_paths:
+        raise ValueError("No CSV file to build the knowledge graph from")
+    
+    results = map_shards(count_shard, [(csv_path, chunksize, schema) for csv_path in csv_paths], workers)
+    
+    counts = results[0][0]
+    for shard_counts, _ in results[1:]:
+        counts = merge_counts(counts, shard_counts)
+    return counts, [timing for _, timing in results]
+
+
+class ByteRange(io.RawIOBase):
+    """Raw stream of the bytes of an open file from its current position up to an end offset."""
+    
+    def __init__(self, f, end):
+        self.f = f
+        self.end = end
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        data = self.f.read(max(0, min(len(buffer), self.end - self.f.tell())))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def get_fingerprint(csv_path, offset):
+    """Hash the start of a CSV file and its bytes before an offset, up to FINGERPRINT_SIZE of each."""
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        digest.update(f.read(min(offset, FINGERPRINT_SIZE)))
+        f.seek(max(0, offset - FINGERPRINT_SIZE))
+        digest.update(f.read(offset - f.tell()))
+    return digest.hexdigest()
+
+
+def count_csv_rows(csv_path, offset=None, chunksize=CSV_CHUNK_SIZE, schema=FEATURE_SCHEMA):
+    """
+    Count the rows of a CSV file from a byte offset up to its last complete line.
+    
+    A last line without a newline may still be being written, it is left for the next count.
+    
+    Args:
+        csv_path: Path to the CSV file
+        offset: Byte offset of the first row to count, None for the first row of the file
+        chunksize: Number of rows read at a time
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+    
+    Returns:
+        Tuple of the count tables of the rows, the byte offset after the last one (the
+        watermark of the next count) and the timing ({"path", "rows", "seconds"})
+    """
+    start = time.perf_counter()
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        columns = list(pd.read_csv(io.BytesIO(header), nrows=0).columns)
+        if offset is None:
+            offset = f.tell()
+        
+        # Find the last newline after the offset, reading the file backward
+        end = offset
+        position = os.fstat(f.fileno()).st_size
+        while position > offset:
+            block_start = max(offset, position - FINGERPRINT_SIZE)
+            f.seek(block_start)
+            newline = f.read(position - block_start).rfind(b'\n')
+            if newline >= 0:
+                end = block_start + newline + 1
+                break
+            position = block_start
+        
+        f.seek(offset)
+        counts = None
+        rows = io.BufferedReader(ByteRange(f, end))
+        with read_csv_columns(rows, schema, header=None, names=columns, chunksize=chunksize) as reader:
+            for chunk in reader:
+                chunk_counts = count_features(chunk, schema)
+                counts = chunk_counts if counts is None else merge_counts(counts, chunk_counts)
+    
+    return counts, end, {"path": csv_path, "rows": counts["rows"], "seconds": time.perf_counter() - start}
+
+
+def counts_to_json(counts):
+    """Convert count tables to a JSON serializable dictionary, the tables as lists of rows."""
+    return {
+        "rows": counts["rows"],
+        "diseases": counts["diseases"],
+        "totals": [[disease, count] for disease, count in counts["totals"].items()],
+        "values": counts["values"],
+        "features": {column: [[disease, value, count] for (disease, value), count in table.items()]
+                     for column, table in counts["features"].items()}
+    }
+
+
+def counts_from_json(data):
+    """Convert count tables back from counts_to_json()."""
+    return {
+        "rows": data["rows"],
+        "diseases": data["diseases"],
+        "totals": {disease: count for disease, count in data["totals"]},
+        "values": data["values"],
+        "features": {column: {(disease, value): count for disease, value, count in table}
+                     for column, table in data["features"].items()}
+    }
+
+
+def write_json(path, data, indent=None):
+    """Replace a JSON file through a temporary file, so readers never see it half written."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=indent)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_knowledge_graph(path):
+    """Return the knowledge graph saved at a path, None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_knowledge_graph(path, knowledge_graph, previous=None):
+    """
+    Replace the knowledge graph at a path with a graph built from the CSVs.
+    
+    The ground truth store of the API (see kg_store.py) journals the expert edits of the graph
+    next to it (path + ".journal") and compact() folds them into the graph, which then records
+    the version of the last one. Call this under the lock of the store (path + ".lock"), with
+    the graph read under the same lock as previous: the records already folded into previous
+    are dropped from the journal first, and the graph is written through a temporary file
+    without a version, so the store loads it again and applies the other records on top.
+    
+    Args:
+        path: Path of the knowledge graph
+        knowledge_graph: The new knowledge graph
+        previous: The graph at the path, None if there is none
+    """
+    journal_path = path + ".journal"
+    base_version = (previous or {}).get("version")
+    if base_version is not None and os.path.exists(journal_path):
+        with open(journal_path, "rb") as f:
+            lines = f.read().splitlines(keepends=True)
+        kept = []
+        for line in lines:
+            try:
+                version = json.loads(line).get("version")
+            except (ValueError, AttributeError):
+                version = None
+            if not isinstance(version, int) or version > base_version:
+                kept.append(line)
+        if len(kept) < len(lines):
+            atomic_write(journal_path, b"".join(kept).decode("utf-8"))
+    
+    write_json(path, knowledge_graph, indent=2)
+
+
+def get_thresholds(schema, thresholds=None):
+    """
+    Return the threshold of every feature column.
+    
+    Args:
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+        thresholds: None for the thresholds of the schema, a number for all the features, or a
+            dictionary of column or node type -> threshold for some of them (a column before
+            its node type), the others keeping the threshold of the schema
+    
+    Returns:
+        Dictionary of feature column -> threshold
+    """
+    if thresholds is None:
+        return {feature["column"]: feature["threshold"] for feature in schema}
+    if isinstance(thresholds, dict):
+        known = {feature["column"] for feature in schema} | {feature["node_type"] for feature in schema}
+        unknown = [key for key in thresholds if key not in known]
+        if unknown:
+            raise ValueError(f"No feature column or node type {', '.join(map(repr, unknown))} in the schema")
+        return {feature["column"]: thresholds.get(feature["column"],
+                                                  thresholds.get(feature["node_type"], feature["threshold"]))
+                for feature in schema}
+    return {feature["column"]: thresholds for feature in schema}
+
+
+def group_by_disease(table):
+    """Group a (disease, value) -> count table by disease, the values of a disease in table order."""
+    groups = defaultdict(list)
+    for (disease, value), count in table.items():
+        groups[disease].append((value, count))
+    return groups
+
+
+def group_features(counts, schema=FEATURE_SCHEMA):
+    """
+    Group the feature count tables by disease, in the order of the links of a disease: the
+    values of a categorical feature from the most to the least common, ties in order of first
+    appearance like value_counts(), and the others in table order.
+    
+    Returns:
+        Dictionary of feature column -> disease -> list of (value, number of rows)
+    """
+    groups = {}
+    for feature in schema:
+        groups[feature["column"]] = group_by_disease(counts["features"][feature["column"]])
+        if feature["binning"] == "categorical":
+            for values in groups[feature["column"]].values():
+                values.sort(key=lambda item: -item[1])
+    return groups
+
+
+def get_link_sections(counts, schema=FEATURE_SCHEMA):
+    """
+    Return the section of the graph of every (relationship, target) link the count tables can
+    create. The links of the graph are grouped in sections, one per feature of the schema.
+    """
+    sections = {}
+    for section, feature in enumerate(schema):
+        for value in counts["values"][feature["column"]]:
+            sections[(feature["relationship"], get_node_id(feature, value))] = section
+    return sections
+
+
+def create_disease_links(counts, disease, groups, schema, thresholds):
+    """
+    Create the links of a disease from the count tables.
+    
+    Args:
+        counts: Count tables of the dataset, from count_features()
+        disease: Disease with rows
+        groups: Feature values of every disease, from group_features()
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+        thresholds: Feature column -> threshold, from get_thresholds()
+    
+    Returns:
+        List of the links of the disease in every section of the graph (see get_link_sections())
+    """
+    total = counts["totals"][disease]
+    sections = []
+    
+    # Disease -> relationship -> feature value, when enough of its rows have the value
+    for feature in schema:
+        links = []
+        for value, count in groups[feature["column"]].get(disease, []):
+            weight = float(count / total)
+            if weight > thresholds[feature["column"]]:
+                links.append({
+                    "source": disease,
+                    "target": get_node_id(feature, value),
+                    "relationship": feature["relationship"],
+                    "weight": weight
+                })
+        sections.append(links)
+    
+    return sections
+
+
+def get_custom_elements(knowledge_graph):
+    """
+    Return the custom nodes and links of a knowledge graph, the ones added by experts rather
+    than built from the dataset: the nodes and links marked with custom: True (as every node
+    and link /api/update-graph creates is), and the links from or to a custom node.
+    """
+    nodes = [node for node in knowledge_graph["nodes"] if node.get("custom")]
+    node_ids = {node["id"] for node in nodes}
+    links = [link for link in knowledge_graph["links"]
+             if link.get("custom") or link["source"] in node_ids or link["target"] in node_ids]
+    return nodes, links
+
+
+def create_knowledge_graph_from_counts(counts, previous=None, changed=None, schema=FEATURE_SCHEMA,
+                                       thresholds=None, groups=None):
+    """
+    Creates the knowledge graph of a dataset from its count tables.
+    
+    With a previous graph of the dataset, only the links of the changed diseases are derived
+    from the counts again, the others are taken from the previous graph, and its custom nodes
+    and links (see get_custom_elements()) are kept after the ones of the dataset. A custom link
+    whose source or target is no longer in the graph is dropped.
+    
+    Args:
+        counts: Count tables of the dataset, from count_features()
+        previous: Knowledge graph built from earlier count tables of the dataset
+        changed: Diseases whose counts changed since the previous graph, all when None
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+        thresholds: Thresholds of the links, see get_thresholds()
+        groups: Feature values of every disease, from group_features(), grouped from the
+            counts when None
+    
+    Returns:
+        The knowledge graph as a dictionary
+    """
+    thresholds = get_thresholds(schema, thresholds)
     
     # Initialize the knowledge graph
     knowledge_graph = {
@@ -42,191 +698,390 @@ def create_knowledge_graph_from_csv(csv_path, output_path=None):
             knowledge_graph["nodes"].append(node)
             unique_nodes.add(node_id)
     
+    totals = counts["totals"]
+    
+    # Diseases with rows, in order of first appearance
+    diseases = [disease for disease in counts["diseases"] if totals.get(disease)]
+    
     # ========== Process Diseases ==========
-    for disease in df["Disease"].unique():
+    for disease in counts["diseases"]:
         add_node(disease, "Disease")
     
-    # ========== Process Symptoms ==========
-    # Process binary symptom columns as individual nodes
-    symptom_columns = ["Fever", "Cough", "Fatigue", "Difficulty Breathing"]
+    # ========== Process Features ==========
+    # Add the nodes of the feature values: every bin of a ranges feature with its ends, the
+    # values of the others
+    for feature in schema:
+        if feature["binning"] == "ranges":
+            properties = feature.get("properties")
+            for name, low, high in feature["bins"]:
+                add_node(get_node_id(feature, name), feature["node_type"],
+                         {properties[0]: low, properties[1]: high} if properties else None)
+        else:
+            for value in counts["values"][feature["column"]]:
+                add_node(get_node_id(feature, value), feature["node_type"])
     
-    for symptom in symptom_columns:
-        # Create nodes for Symptom (Yes)
-        symptom_node_id = f"{symptom}"
-        add_node(symptom_node_id, "Symptom")
-        
-        # Create relationships: Disease -> has symptom -> Symptom
-        for disease in df["Disease"].unique():
-            # Filter rows for this disease
-            disease_rows = df[df["Disease"] == disease]
-            
-            # Skip if there are no cases
-            if len(disease_rows) == 0:
-                continue
-            
-            # Check if this symptom is common for this disease
-            yes_count = (disease_rows[symptom] == "Yes").sum()
-            if yes_count > 0:
-                weight = float(yes_count / len(disease_rows))
-                if weight > 0.4:  # Only include if more than 50% have the symptom
-                    knowledge_graph["links"].append({
-                        "source": disease,
-                        "target": symptom_node_id,
-                        "relationship": "HAS_SYMPTOM",
-                        "weight": weight
-                    })
-    
-    # ========== Process Age ==========
-    # Define age groups
-    age_groups = [
-        {"range": (0, 17), "name": "Child"},
-        {"range": (18, 34), "name": "Young Adult"},
-        {"range": (35, 59), "name": "Middle Aged"},
-        {"range": (60, 120), "name": "Senior"}
-    ]
-    
-    # Add age group nodes
-    for group in age_groups:
-        node_id = f"{group['name']} Age"
-        add_node(node_id, "Age Group", {
-            "min_age": group["range"][0],
-            "max_age": group["range"][1]
-        })
-    
-    # Function to get age group from age
-    def get_age_group(age):
-        for group in age_groups:
-            if group["range"][0] <= age <= group["range"][1]:
-                return f"{group['name']} Age"
-        return None
+    # ========== Process Links ==========
+    # Take the links of the unchanged diseases from the previous graph
+    disease_links = {}
+    custom_nodes, custom_links = [], []
+    if previous is not None:
+        custom_nodes, custom_links = get_custom_elements(previous)
+        if changed is not None:
+            sections = get_link_sections(counts, schema)
+            custom = {id(link) for link in custom_links}
+            for node in previous["nodes"]:
+                if node["type"] == "Disease" and node["id"] in totals and node["id"] not in changed:
+                    disease_links[node["id"]] = [[] for _ in schema]
+            for link in previous["links"]:
+                section = sections.get((link["relationship"], link["target"]))
+                if section is not None and link["source"] in disease_links and id(link) not in custom:
+                    disease_links[link["source"]][section].append(link)
     
-    # Create relationship: Disease -> common in -> Age Group
-    for disease in df["Disease"].unique():
-        disease_rows = df[df["Disease"] == disease]
-        
-        # Skip if there are no cases
-        if len(disease_rows) == 0:
-            continue
-        
-        # Get counts by age group
-        age_group_counts = defaultdict(int)
-        for age in disease_rows["Age"]:
-            age_group = get_age_group(age)
-            if age_group:
-                age_group_counts[age_group] += 1
-        
-        # Find significant age groups for this disease
-        if age_group_counts:
-            total = len(disease_rows)
-            for age_group, count in age_group_counts.items():
-                weight = float(count / total)
-                if weight > 0.3:  # At least 30% of cases are in this age group
-                    knowledge_graph["links"].append({
-                        "source": disease,
-                        "target": age_group,
-                        "relationship": "COMMON_IN",
-                        "weight": weight
-                    })
-    
-    # ========== Process Gender ==========
-    # Add gender nodes
-    for gender in df["Gender"].unique():
-        add_node(f"{gender} Gender", "Gender")
-    
-    # Create relationship: Disease -> prevalent in -> Gender
-    for disease in df["Disease"].unique():
-        disease_rows = df[df["Disease"] == disease]
-        
-        # Skip if there are no cases
-        if len(disease_rows) == 0:
-            continue
-        
-        # Get counts by gender
-        gender_counts = disease_rows["Gender"].value_counts()
-        
-        # Check for clear prevalence
-        total = len(disease_rows)
-        for gender, count in gender_counts.items():
-            weight = float(count / total)
-            if weight > 0.3:  # At least 30% prevalence
-                knowledge_graph["links"].append({
-                    "source": disease,
-                    "target": f"{gender} Gender",
-                    "relationship": "PREVALENT_IN",
-                    "weight": weight
-                })
+    # Derive the links of the other diseases from the counts
+    if groups is None:
+        groups = group_features(counts, schema)
+    for disease in diseases:
+        if disease not in disease_links:
+            disease_links[disease] = create_disease_links(counts, disease, groups, schema, thresholds)
     
-    # ========== Process Blood Pressure ==========
-    # Add blood pressure nodes
-    for bp in df["Blood Pressure"].unique():
-        add_node(f"{bp} Blood Pressure", "Blood Pressure")
+    # Links grouped by section, the diseases of a section in order of first appearance
+    for section in range(len(schema)):
+        for disease in diseases:
+            knowledge_graph["links"].extend(disease_links[disease][section])
     
-    # Create relationship: Disease -> associated with -> Blood Pressure
-    for disease in df["Disease"].unique():
-        disease_rows = df[df["Disease"] == disease]
-        
-        # Skip if there are no cases
-        if len(disease_rows) == 0:
-            continue
+    # ========== Custom Nodes and Links ==========
+    for node in custom_nodes:
+        if node["id"] not in unique_nodes:
+            knowledge_graph["nodes"].append(node)
+            unique_nodes.add(node["id"])
+    knowledge_graph["links"].extend(link for link in custom_links
+                                    if link["source"] in unique_nodes and link["target"] in unique_nodes)
+    
+    return knowledge_graph
+
+
+def create_knowledge_graph_variants(counts, thresholds, schema=FEATURE_SCHEMA, previous=None):
+    """
+    Creates the knowledge graphs of a dataset for several thresholds from its count tables,
+    e.g. to sweep the thresholds without counting the dataset again. The count tables are
+    grouped by disease once for all the graphs.
+    
+    Args:
+        counts: Count tables of the dataset, from count_features()
+        thresholds: List of the thresholds of every graph, see get_thresholds()
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+        previous: List of the graphs they replace, in the order of thresholds (None for a graph
+            without one), whose custom nodes and links are kept (see get_custom_elements())
+    
+    Returns:
+        List of the knowledge graphs, in the order of thresholds
+    """
+    for threshold in thresholds:
+        get_thresholds(schema, threshold)
+    if previous is None:
+        previous = [None] * len(thresholds)
+    groups = group_features(counts, schema)
+    return [create_knowledge_graph_from_counts(counts, graph, schema=schema, thresholds=threshold, groups=groups)
+            for threshold, graph in zip(thresholds, previous)]
+
+
+def create_knowledge_graph_from_csv(csv_path, output_path=None, chunksize=CSV_CHUNK_SIZE, schema=FEATURE_SCHEMA):
+    """
+    Creates a clear and explicit knowledge graph in JSON format from a medical dataset CSV.
+    
+    This graph connects diseases to their associated features for better explainability.
+    Each node represents either a disease or a specific feature value (e.g., "High Blood Pressure").
+    The CSV is streamed in chunks, the feature frequencies of all the diseases are counted in
+    one grouped pass per chunk (see count_csv()), and the links are derived from the count tables.
+    
+    The custom nodes and links of the graph at output_path are kept (see get_custom_elements()),
+    and it is replaced under the lock of the ground truth store of the API (see
+    save_knowledge_graph()).
+    
+    Args:
+        csv_path: Path to the CSV file
+        output_path: Path to save the JSON output (default: same directory as CSV)
+        chunksize: Number of rows read at a time
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+    
+    Returns:
+        The knowledge graph as a dictionary
+    """
+    # Set default output path if not provided
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(csv_path), "knowledge_graph.json")
+    
+    counts = count_csv(csv_path, chunksize, schema)
+    
+    # Save the knowledge graph as JSON, keeping the custom elements of the graph it replaces
+    with FileLock(output_path + ".lock"):
+        previous = read_knowledge_graph(output_path)
+        knowledge_graph = create_knowledge_graph_from_counts(counts, previous, schema=schema)
+        save_knowledge_graph(output_path, knowledge_graph, previous)
+    
+    print(f"Knowledge graph created and saved to {output_path}")
+    return knowledge_graph
+
+def create_knowledge_graph_from_csvs(csv_paths, output_path=None, workers=None, chunksize=CSV_CHUNK_SIZE,
+                                     schema=FEATURE_SCHEMA):
+    """
+    Creates one knowledge graph from several CSV shards of a medical dataset (e.g. one per
+    hospital or per month), counted in parallel (see count_csvs()). The graph at output_path
+    is replaced as in create_knowledge_graph_from_csv().
+    
+    Args:
+        csv_paths: Paths and glob patterns of the CSV files
+        output_path: Path to save the JSON output (default: same directory as the first CSV)
+        workers: Number of worker processes, one per core by default
+        chunksize: Number of rows read at a time
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+    
+    Returns:
+        The knowledge graph as a dictionary
+    """
+    csv_paths = expand_csv_paths(csv_paths)
+    
+    start = time.perf_counter()
+    counts, timings = count_csvs(csv_paths, workers, chunksize, schema)
+    counted = time.perf_counter() - start
+    
+    # Set default output path if not provided
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(csv_paths[0]), "knowledge_graph.json")
+    
+    # Save the knowledge graph as JSON, keeping the custom elements of the graph it replaces
+    with FileLock(output_path + ".lock"):
+        previous = read_knowledge_graph(output_path)
+        start = time.perf_counter()
+        knowledge_graph = create_knowledge_graph_from_counts(counts, previous, schema=schema)
+        built = time.perf_counter() - start
+        save_knowledge_graph(output_path, knowledge_graph, previous)
+    
+    # Timing breakdown
+    for timing in timings:
+        print(f"  {timing['path']}: {timing['rows']} rows in {timing['seconds']:.2f}s")
+    shard_seconds = sum(timing["seconds"] for timing in timings)
+    print(f"Counted {len(timings)} CSV files ({counts['rows']} rows) in {counted:.2f}s "
+          f"({shard_seconds:.2f}s of shard time, {shard_seconds / counted:.1f}x parallelism), "
+          f"graph built in {built:.2f}s")
+    
+    print(f"Knowledge graph created and saved to {output_path}")
+    return knowledge_graph
+
+def get_variant_path(output_path, thresholds, index):
+    """
+    Return the path of the graph of a threshold variant: output_path with the threshold (or the
+    index of the variant, for per-feature thresholds) before the extension.
+    """
+    root, extension = os.path.splitext(output_path)
+    label = index if isinstance(thresholds, dict) else f"{thresholds:g}"
+    return f"{root}_{label}{extension}"
+
+def create_knowledge_graph_variants_from_csvs(csv_paths, thresholds, output_path=None, workers=None,
+                                              chunksize=CSV_CHUNK_SIZE, schema=FEATURE_SCHEMA):
+    """
+    Creates the knowledge graphs of CSV shards for several thresholds, counting the shards once
+    (see create_knowledge_graph_variants()), e.g. knowledge_graph_0.2.json,
+    knowledge_graph_0.3.json... for the thresholds [0.2, 0.3...]. Every graph is replaced as in
+    create_knowledge_graph_from_csv().
+    
+    Args:
+        csv_paths: Paths and glob patterns of the CSV files
+        thresholds: List of the thresholds of every graph, see get_thresholds()
+        output_path: Path of the graphs, before the threshold is added to it (default:
+            knowledge_graph.json in the directory of the first CSV)
+        workers: Number of worker processes, one per core by default
+        chunksize: Number of rows read at a time
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+    
+    Returns:
+        Dictionary of the path of every graph -> the knowledge graph
+    """
+    csv_paths = expand_csv_paths(csv_paths)
+    if not thresholds:
+        raise ValueError("No threshold to build the knowledge graphs for")
+    for threshold in thresholds:
+        get_thresholds(schema, threshold)
+    
+    start = time.perf_counter()
+    counts, timings = count_csvs(csv_paths, workers, chunksize, schema)
+    counted = time.perf_counter() - start
+    
+    # Set default output path if not provided
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(csv_paths[0]), "knowledge_graph.json")
+    
+    # Save the knowledge graphs as JSON, keeping the custom elements of the graphs they replace
+    variant_paths = [get_variant_path(output_path, threshold, index) for index, threshold in enumerate(thresholds)]
+    with contextlib.ExitStack() as stack:
+        for variant_path in dict.fromkeys(variant_paths):
+            stack.enter_context(FileLock(variant_path + ".lock"))
+        previous = [read_knowledge_graph(variant_path) for variant_path in variant_paths]
         
-        # Get counts by blood pressure
-        bp_counts = disease_rows["Blood Pressure"].value_counts()
+        start = time.perf_counter()
+        knowledge_graphs = create_knowledge_graph_variants(counts, thresholds, schema, previous)
+        built = time.perf_counter() - start
         
-        # Find significant associations
-        total = len(disease_rows)
-        for bp, count in bp_counts.items():
-            weight = float(count / total)
-            if weight > 0.3:  # At least 30% of cases have this BP
-                knowledge_graph["links"].append({
-                    "source": disease,
-                    "target": f"{bp} Blood Pressure",
-                    "relationship": "ASSOCIATED_WITH",
-                    "weight": weight
-                })
+        for variant_path, knowledge_graph, graph in zip(variant_paths, knowledge_graphs, previous):
+            save_knowledge_graph(variant_path, knowledge_graph, graph)
+    variants = dict(zip(variant_paths, knowledge_graphs))
+    
+    # Timing breakdown
+    for timing in timings:
+        print(f"  {timing['path']}: {timing['rows']} rows in {timing['seconds']:.2f}s")
+    print(f"Counted {len(timings)} CSV files ({counts['rows']} rows) once in {counted:.2f}s, "
+          f"{len(knowledge_graphs)} graphs built in {built:.2f}s")
+    
+    for variant_path, knowledge_graph in variants.items():
+        print(f"Knowledge graph with {len(knowledge_graph['links'])} links created and saved to {variant_path}")
+    return variants
+
+def update_knowledge_graph_from_csvs(csv_paths, output_path=None, workers=None, chunksize=CSV_CHUNK_SIZE,
+                                     schema=FEATURE_SCHEMA):
+    """
+    Updates the knowledge graph of CSV shards with the rows appended to them and the new shards.
+    
+    The count tables of every file are kept in a sidecar next to the graph (output_path +
+    ".counts"), with a watermark: the byte offset up to which the file was counted. Only the
+    rows after the watermarks and the new files are read, in parallel. A file rewritten since
+    it was counted (its start or its rows before the watermark changed) is counted again from
+    the start, and the files of earlier updates that are not given again stay counted.
     
-    # ========== Process Cholesterol Levels ==========
-    # Add cholesterol level nodes
-    for level in df["Cholesterol Level"].unique():
-        add_node(f"{level} Cholesterol", "Cholesterol Level")
+    Only the links of the diseases whose counts changed are derived again. The links of the
+    other diseases, and the custom nodes and links of the graph (see get_custom_elements()),
+    are kept as they are. Without a sidecar, every file is counted.
     
-    # Create relationship: Disease -> correlated with -> Cholesterol Level
-    for disease in df["Disease"].unique():
-        disease_rows = df[df["Disease"] == disease]
+    The sidecar records the schema of the counts. When the columns or the binnings of the
+    schema changed, the given files are counted again from the start and the files of earlier
+    updates are dropped; when only the thresholds, node ids, node types or relationships
+    changed, the counts are kept but the links of every disease are derived again.
+    
+    The graph is read, merged and written under the lock of the ground truth store of the API
+    (output_path + ".lock"), so a concurrent compaction of its journal does not overwrite the
+    updated graph with an older snapshot (see save_knowledge_graph()). The files are counted
+    before the lock is taken.
+    
+    Args:
+        csv_paths: Paths and glob patterns of the CSV files
+        output_path: Path of the knowledge graph (default: same directory as the first CSV)
+        workers: Number of worker processes, one per core by default
+        chunksize: Number of rows read at a time
+        schema: Feature columns of the graph, see FEATURE_SCHEMA
+    
+    Returns:
+        The knowledge graph as a dictionary
+    """
+    csv_paths = expand_csv_paths(csv_paths)
+    if not csv_paths:
+        raise ValueError("No CSV file to build the knowledge graph from")
+    
+    # Set default output path if not provided
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(csv_paths[0]), "knowledge_graph.json")
+    counts_path = output_path + ".counts"
+    
+    # Through JSON, to compare it with the one of the sidecar
+    schema = json.loads(json.dumps(schema))
+    
+    files = {}
+    relink = True
+    if os.path.exists(counts_path):
+        with open(counts_path, "r") as f:
+            sidecar = json.load(f)
+        stored_schema = sidecar.get("schema")
+        if stored_schema is not None and get_counting_schema(stored_schema) == get_counting_schema(schema):
+            files = sidecar["files"]
+            relink = stored_schema != schema
+    
+    # Read the rows after the watermark of the files counted before, if they were only appended to
+    tasks = []
+    for csv_path in csv_paths:
+        entry = files.get(os.path.abspath(csv_path))
+        offset = None
+        if (entry is not None and os.path.getsize(csv_path) >= entry["offset"] and
+                get_fingerprint(csv_path, entry["offset"]) == entry["fingerprint"]):
+            offset = entry["offset"]
+            if os.path.getsize(csv_path) == offset:
+                continue
+        tasks.append((csv_path, offset, chunksize, schema))
+    
+    start = time.perf_counter()
+    results = map_shards(count_csv_rows, tasks, workers)
+    counted = time.perf_counter() - start
+    
+    changed = set()
+    for (csv_path, offset, _, _), (new_counts, end, _) in zip(tasks, results):
+        key = os.path.abspath(csv_path)
+        if offset is None:
+            if key in files:
+                # A rewritten file, the diseases of its old rows change too
+                changed.update(disease for disease, _ in files[key]["counts"]["totals"])
+            file_counts = new_counts
+        else:
+            file_counts = merge_counts(counts_from_json(files[key]["counts"]), new_counts)
+        changed.update(new_counts["totals"])
+        files[key] = {"offset": end, "fingerprint": get_fingerprint(csv_path, end),
+                      "counts": counts_to_json(file_counts)}
+    
+    counts = None
+    for entry in files.values():
+        file_counts = counts_from_json(entry["counts"])
+        counts = file_counts if counts is None else merge_counts(counts, file_counts)
+    
+    with FileLock(output_path + ".lock"):
+        previous = read_knowledge_graph(output_path)
         
-        # Skip if there are no cases
-        if len(disease_rows) == 0:
-            continue
+        if not tasks and not relink and previous is not None:
+            print(f"No new rows, {output_path} is up to date")
+            return previous
         
-        # Get counts by cholesterol level
-        chol_counts = disease_rows["Cholesterol Level"].value_counts()
+        start = time.perf_counter()
+        knowledge_graph = create_knowledge_graph_from_counts(counts, previous, None if relink else changed, schema)
+        built = time.perf_counter() - start
         
-        # Find significant correlations
-        total = len(disease_rows)
-        for level, count in chol_counts.items():
-            weight = float(count / total)
-            if weight > 0.3:  # At least 30% of cases have this cholesterol level
-                knowledge_graph["links"].append({
-                    "source": disease,
-                    "target": f"{level} Cholesterol",
-                    "relationship": "CORRELATED_WITH",
-                    "weight": weight
-                })
+        # The graph first: if the sidecar is not written, the next update reads the rows again
+        save_knowledge_graph(output_path, knowledge_graph, previous)
+        write_json(counts_path, {"schema": schema, "files": files})
     
-    # Save the knowledge graph as JSON
-    with open(output_path, "w") as f:
-        json.dump(knowledge_graph, f, indent=2)
+    # Timing breakdown
+    for (_, offset, _, _), (_, _, timing) in zip(tasks, results):
+        print(f"  {timing['path']}: {timing['rows']} {'new ' if offset is not None else ''}rows "
+              f"in {timing['seconds']:.2f}s")
+    derived = "every disease" if relink else f"{len(changed)} diseases"
+    print(f"Counted {sum(timing['rows'] for _, _, timing in results)} rows of {len(tasks)} CSV files in "
+          f"{counted:.2f}s, links of {derived} derived again in {built:.2f}s")
     
-    print(f"Knowledge graph created and saved to {output_path}")
+    print(f"Knowledge graph updated and saved to {output_path}")
     return knowledge_graph
 
-# Execute the function with the specified CSV path
+# Execute the function with the specified CSV paths
 if __name__ == "__main__":
-    csv_path = "/Users/yanis/Desktop/presentation-kod/ds-mf-filtered.csv"
-    create_knowledge_graph_from_csv(csv_path)
-
-
-
-
-
-create_knowledge_graph_from_csv(csv_path)
- 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create the ground truth knowledge graph from medical dataset CSV files")
+    parser.add_argument('csv_paths', nargs='*', default=["/Users/yanis/Desktop/presentation-kod/ds-mf-filtered.csv"],
+                        help="CSV files or glob patterns of CSV shards")
+    parser.add_argument('-o', '--output', help="Path of the knowledge graph (default: knowledge_graph.json "
+                                               "in the directory of the first CSV)")
+    parser.add_argument('--workers', type=int, help="Number of worker processes (default: one per core)")
+    parser.add_argument('--chunksize', type=int, default=CSV_CHUNK_SIZE, help="Number of rows read at a time")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only read the rows appended since the last incremental run and the new files, "
+                             "keeping the custom nodes and links of the graph")
+    parser.add_argument('--schema', help="JSON file of the feature columns of the graph (default: FEATURE_SCHEMA)")
+    parser.add_argument('--thresholds', type=float, nargs='+',
+                        help="Build one graph per threshold of the links of every feature, counting the "
+                             "CSV files once (e.g. --thresholds 0.2 0.3 0.4 writes knowledge_graph_0.2.json...)")
+    args = parser.parse_args()
+    if args.incremental and args.thresholds:
+        parser.error("--thresholds cannot be used with --incremental")
+    
+    try:
+        schema = load_schema(args.schema) if args.schema else FEATURE_SCHEMA
+        if args.incremental:
+            update_knowledge_graph_from_csvs(args.csv_paths, args.output, args.workers, args.chunksize, schema)
+        elif args.thresholds:
+            create_knowledge_graph_variants_from_csvs(args.csv_paths, args.thresholds, args.output, args.workers,
+                                                      args.chunksize, schema)
+        else:
+            create_knowledge_graph_from_csvs(args.csv_paths, args.output, args.workers, args.chunksize, schema)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
@@ -0,0 +1,53 @@
+import fcntl
+import os
+import tempfile
+import threading
+
+
+class FileLock:
+    """
+    Exclusive lock held with flock() on a lock file.
+
+    Every acquisition opens its own file descriptor, so the lock excludes other threads
+    of this process as well as other worker processes.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Path of the lock file, created if missing
+        """
+        self.path = path
+        self._local = threading.local()
+
+    def __enter__(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        self._local.fd = fd
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fd = self._local.fd
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def atomic_write(path, content):
+    """
+    Replace a file with new text content so readers see either the old or the new file.
+
+    The content goes to a temporary file in the same directory, which is flushed to disk and
+    then renamed over the target.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,320 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from openai import OpenAI
+
+from file_utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class GPTResponseCache:
+    """
+    Bounded LRU cache of GPT completions, optionally persisted to a JSON file.
+
+    Entries are keyed by a hash of the model, the system prompt (which includes the content
+    of info.txt) and the user prompt, so any change to one of them is a cache miss.
+
+    The file is not rewritten on every put: new entries are saved in batches, at most once
+    every save_interval seconds, outside of the lock, and once more when the process exits.
+    """
+
+    def __init__(self, max_entries=256, path=None, save_interval=5.0):
+        """
+        Args:
+            max_entries: Maximum number of completions kept, the least recently used go first
+            path: Optional JSON file the cache is loaded from and saved to
+            save_interval: Minimum number of seconds between two writes of the file
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self.saves = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._saved = time.monotonic()
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self._entries.update(json.load(f))
+                while len(self._entries) > max_entries:
+                    self._entries.popitem(last=False)
+                logger.info(f"Loaded {len(self._entries)} cached GPT responses from {path}")
+            except Exception as e:
+                logger.warning(f"Could not load GPT response cache from {path}: {str(e)}")
+        if path:
+            atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(model, system_prompt, user_prompt):
+        """Return the cache key of a completion request."""
+        payload = json.dumps([model, system_prompt, user_prompt])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached completion for the key, or None."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store a completion, evicting the least recently used one when full."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            self._dirty = True
+            due = time.monotonic() - self._saved >= self.save_interval
+
+        if self.path and due:
+            self.flush()
+
+    def flush(self):
+        """Write the entries to the file if they changed since the last write."""
+        if not self.path:
+            return
+
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                entries = dict(self._entries)
+                self._dirty = False
+                self._saved = time.monotonic()
+
+            try:
+                atomic_write(self.path, json.dumps(entries))
+                self.saves += 1
+            except Exception as e:
+                logger.warning(f"Could not save GPT response cache to {self.path}: {str(e)}")
+                with self._lock:
+                    self._dirty = True
+
+    def stats(self):
+        """Return the hit and miss counters and the current size."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'saves': self.saves
+            }
+
+
+class JSONObjectScanner:
+    """
+    Finds the first complete top-level JSON object with a list under a key, {"result": [...]}
+    by default, in text that arrives in pieces.
+
+    Text before the opening brace, such as a markdown fence, is skipped, and so are the objects
+    without the key, such as a preamble or an echoed example, and brace-balanced text that is
+    not JSON. Every character is looked at once, tracking the brace depth and whether it is
+    inside a string.
+    """
+
+    def __init__(self, key="result"):
+        """
+        Args:
+            key: Key of the list the object must have
+        """
+        self.key = key
+        self.buffer = ""
+        self.result = None
+
+        self._start = None
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        """
+        Add text to the buffer.
+
+        Returns:
+            The parsed object once it is complete, None before that
+        """
+        if self.result is not None:
+            return self.result
+
+        self.buffer += text
+        while self._position < len(self.buffer):
+            char = self.buffer[self._position]
+            self._position += 1
+
+            if self._start is None:
+                if char == '{':
+                    self._start = self._position - 1
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    text, self._start = self.buffer[self._start:self._position], None
+                    try:
+                        parsed = json.loads(text)
+                    except ValueError:
+                        continue
+                    if isinstance(parsed, dict) and isinstance(parsed.get(self.key), list):
+                        self.result = parsed
+                        return self.result
+
+        return None
+
+
+class GPTClient:
+    """
+    Chat completion client shared by every request of the process.
+
+    The underlying OpenAI client is created once, so its HTTP connection pool and TLS sessions
+    are reused. Any object with the same `chat.completions.create()` interface can be passed as
+    the upstream instead, e.g. a local stub to run without network access.
+    """
+
+    def __init__(self, api_key, model="gpt-4", timeout=60.0, max_retries=2, cache=None, upstream=None):
+        """
+        Args:
+            api_key: OpenAI API key
+            model: Chat model used for completions
+            timeout: Request timeout in seconds
+            max_retries: Number of retries of the OpenAI client on transient errors
+            cache: Optional GPTResponseCache
+            upstream: Optional replacement of the OpenAI client
+        """
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = cache
+
+        self._upstream = upstream
+        self._lock = threading.Lock()
+
+    @property
+    def upstream(self):
+        """The client completions are requested from, the OpenAI client is created on first use."""
+        if self._upstream is None:
+            with self._lock:
+                if self._upstream is None:
+                    self._upstream = OpenAI(api_key=self.api_key, timeout=self.timeout,
+                                            max_retries=self.max_retries)
+        return self._upstream
+
+    @upstream.setter
+    def upstream(self, upstream):
+        self._upstream = upstream
+
+    def complete(self, system_prompt, user_prompt, validate=None):
+        """
+        Return the completion of a system and user prompt, from the cache when possible.
+
+        Args:
+            system_prompt: Content of the system message
+            user_prompt: Content of the user message
+            validate: Optional function of the completion text, the completion is only cached
+                when it returns true, e.g. when it parses
+
+        Returns:
+            The text of the completion
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, system_prompt, user_prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info("Using cached GPT response")
+                return cached
+
+        completion = self.upstream.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+        )
+        content = completion.choices[0].message.content
+
+        if self.cache is not None and content and (validate is None or validate(content)):
+            self.cache.put(key, content)
+        return content
+
+    def stream(self, system_prompt, user_prompt, validate=None):
+        """
+        Yield the completion of a system and user prompt piece by piece as it is generated.
+
+        A cached completion is yielded in one piece. Once the stream ends, the full
+        completion is added to the cache.
+
+        Args:
+            system_prompt: Content of the system message
+            user_prompt: Content of the user message
+            validate: Optional function of the completion text, called once the stream ends;
+                the completion is only cached when it returns true
+
+        Yields:
+            Text fragments of the completion
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, system_prompt, user_prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info("Using cached GPT response")
+                yield cached
+                return
+
+        chunks = self.upstream.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            stream=True
+        )
+
+        parts = []
+        for chunk in chunks:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                parts.append(text)
+                yield text
+
+        content = "".join(parts)
+        if self.cache is not None and content and (validate is None or validate(content)):
+            self.cache.put(key, content)
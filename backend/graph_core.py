@@ -0,0 +1,219 @@
+import numpy as np
+
+
+class NodeRecord:
+    """A node of a CompactGraph: its id, type, novelty flag and any other attributes."""
+
+    __slots__ = ('id', 'type', 'is_novel', 'attributes')
+
+    def __init__(self, node_id, node_type='', is_novel=False, attributes=None):
+        self.id = node_id
+        self.type = node_type
+        self.is_novel = is_novel
+        self.attributes = attributes
+
+    def get(self, key, default=None):
+        """Return an attribute of the node, like the attribute dictionary of a NetworkX node."""
+        if key == 'type':
+            return self.type
+        if key == 'is_novel':
+            return self.is_novel
+        if self.attributes is None:
+            return default
+        return self.attributes.get(key, default)
+
+    def update(self, node):
+        # A node given again updates the attributes it has, like NetworkX
+        if 'type' in node:
+            self.type = node['type']
+        if 'is_novel' in node:
+            self.is_novel = bool(node['is_novel'])
+        others = {k: v for k, v in node.items() if k not in ('id', 'type', 'is_novel')}
+        if others:
+            self.attributes = {**(self.attributes or {}), **others}
+
+
+class CompactGraph:
+    """
+    Directed graph of a JSON knowledge graph, stored in flat arrays instead of NetworkX dicts.
+
+    Node ids are interned to consecutive integers and the outgoing edges of every node are
+    stored in CSR form: the edges of node i are the positions indptr[i]:indptr[i + 1] of the
+    targets, weights, relationship_codes and novel arrays. Relationship names are interned
+    too, relationships[code] is the name of a code. A missing weight is stored as NaN, and
+    integer_weights flags the weights given as integers so they are returned as such.
+
+    The graph follows the NetworkX DiGraph semantics the analysis was written against: a node
+    or link given twice updates the attributes of the first one, the outgoing edges of a node
+    are in the order their targets were first linked, and link endpoints that are not in the
+    node list are added as nodes without attributes.
+    """
+
+    def __init__(self, kg_json):
+        """
+        Args:
+            kg_json: Knowledge graph dictionary ({"nodes": [...], "links": [...]})
+        """
+        self.ids = {}
+        self.nodes = []
+        for node in kg_json['nodes']:
+            number = self.ids.get(node['id'])
+            if number is None:
+                self.ids[node['id']] = len(self.nodes)
+                record = NodeRecord(node['id'])
+                self.nodes.append(record)
+            else:
+                record = self.nodes[number]
+            record.update(node)
+
+        self.relationships = []
+        self._set_edges(*self._collect_edges(kg_json['links'], {}))
+
+    def with_edges(self, nodes, outgoing):
+        """
+        Return the graph of an edited knowledge graph, without processing the other links again.
+
+        The edges of the untouched nodes are copied as arrays and the node records are shared
+        with this graph, which is left unchanged.
+
+        Args:
+            nodes: Node dictionaries added to the knowledge graph
+            outgoing: Dictionary of node id -> all the links leaving it in the edited graph, in
+                graph order, for the nodes whose outgoing links changed
+
+        Returns:
+            CompactGraph with the same nodes and edges as one built from the edited graph
+        """
+        graph = CompactGraph.__new__(CompactGraph)
+        graph.ids = dict(self.ids)
+        graph.nodes = list(self.nodes)
+        graph.relationships = list(self.relationships)
+
+        for node in nodes:
+            number = graph.ids.get(node['id'])
+            if number is None:
+                graph.ids[node['id']] = len(graph.nodes)
+                record = NodeRecord(node['id'])
+                graph.nodes.append(record)
+            else:
+                # The record is shared with this graph, so a copy is updated
+                old = graph.nodes[number]
+                record = graph.nodes[number] = NodeRecord(old.id, old.type, old.is_novel, old.attributes)
+            record.update(node)
+
+        # Drop the edges of the edited nodes and collect their new ones
+        keep = np.ones(len(self.targets), dtype=bool)
+        for node_id in outgoing:
+            number = self.ids.get(node_id)
+            if number is not None:
+                keep[self.indptr[number]:self.indptr[number + 1]] = False
+        relationship_codes = {relationship: code for code, relationship in enumerate(graph.relationships)}
+        edges = graph._collect_edges([link for links in outgoing.values() for link in links], relationship_codes)
+
+        sources = np.repeat(np.arange(len(self.nodes), dtype=np.int32), np.diff(self.indptr))
+        kept = (sources, self.targets, self.weights, self.integer_weights, self.relationship_codes, self.novel)
+        graph._set_edges(*(np.concatenate([old[keep], np.array(new, dtype=old.dtype)])
+                           for old, new in zip(kept, edges)))
+        return graph
+
+    def _collect_edges(self, links, relationship_codes):
+        # Merge the links into one edge per (source, target), in first-insertion order, with
+        # the attributes of the last link that has them
+        positions = {}
+        sources, targets, weights, integers, codes, novel = [], [], [], [], [], []
+
+        for link in links:
+            source = self._intern(link['source'] if isinstance(link['source'], str) else link['source']['id'])
+            target = self._intern(link['target'] if isinstance(link['target'], str) else link['target']['id'])
+
+            relationship = link.get('relationship')
+            code = None
+            if relationship is not None:
+                code = relationship_codes.get(relationship)
+                if code is None:
+                    code = relationship_codes[relationship] = len(self.relationships)
+                    self.relationships.append(relationship)
+
+            position = positions.get((source, target))
+            if position is None:
+                positions[(source, target)] = len(sources)
+                sources.append(source)
+                targets.append(target)
+                weights.append(link.get('weight', np.nan))
+                integers.append(isinstance(link.get('weight'), int))
+                codes.append(-1 if code is None else code)
+                novel.append(bool(link.get('is_novel', False)))
+            else:
+                if 'weight' in link:
+                    weights[position] = link['weight']
+                    integers[position] = isinstance(link['weight'], int)
+                if code is not None:
+                    codes[position] = code
+                if 'is_novel' in link:
+                    novel[position] = bool(link['is_novel'])
+
+        return sources, targets, weights, integers, codes, novel
+
+    def _set_edges(self, sources, targets, weights, integers, codes, novel):
+        # Sort the edges by source, keeping the link order within a source
+        sources = np.asarray(sources, dtype=np.int32)
+        order = np.argsort(sources, kind='stable')
+        self.indptr = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(self.nodes)), out=self.indptr[1:])
+        self.targets = np.asarray(targets, dtype=np.int32)[order]
+        self.weights = np.asarray(weights, dtype=np.float64)[order]
+        self.integer_weights = np.asarray(integers, dtype=bool)[order]
+        self.relationship_codes = np.asarray(codes, dtype=np.int16)[order]
+        self.novel = np.asarray(novel, dtype=bool)[order]
+
+    def _intern(self, node_id):
+        number = self.ids.get(node_id)
+        if number is None:
+            number = self.ids[node_id] = len(self.nodes)
+            self.nodes.append(NodeRecord(node_id))
+        return number
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return len(self.targets)
+
+    def has_node(self, node_id):
+        """Check whether a node exists."""
+        return node_id in self.ids
+
+    def node(self, node_id):
+        """Return the NodeRecord of a node."""
+        return self.nodes[self.ids[node_id]]
+
+    def out_edges(self, node_id):
+        """
+        Return the outgoing edges of a node, in the order their targets were first linked.
+
+        Returns:
+            List of (target id, relationship, weight, is_novel), the relationship is '' and the
+            weight None when the links had none; empty for a node that does not exist
+        """
+        number = self.ids.get(node_id)
+        if number is None:
+            return []
+        start, end = self.indptr[number], self.indptr[number + 1]
+        edges = []
+        for target, code, weight, integer, novel in zip(self.targets[start:end].tolist(),
+                                                        self.relationship_codes[start:end].tolist(),
+                                                        self.weights[start:end].tolist(),
+                                                        self.integer_weights[start:end].tolist(),
+                                                        self.novel[start:end].tolist()):
+            if weight != weight:
+                weight = None
+            elif integer:
+                weight = int(weight)
+            edges.append((self.nodes[target].id, self.relationships[code] if code >= 0 else '', weight, novel))
+        return edges
+
+    @property
+    def nbytes(self):
+        """Size of the edge arrays in bytes."""
+        return (self.indptr.nbytes + self.targets.nbytes + self.weights.nbytes + self.integer_weights.nbytes +
+                self.relationship_codes.nbytes + self.novel.nbytes)
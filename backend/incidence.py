@@ -0,0 +1,379 @@
+import zlib
+
+import numpy as np
+from scipy import sparse
+
+# Similarity metrics supported by DiseaseFactorMatrix.similarities()
+SIMILARITY_METRICS = ('jaccard', 'weighted_jaccard', 'cosine')
+
+
+class DiseaseFactorMatrix:
+    """
+    Sparse disease x factor incidence matrix of a knowledge graph.
+
+    Rows are the Disease nodes in graph order, columns are the targets of their links. Two CSR
+    matrices are kept over the same structure: a binary one for set similarities and one holding
+    the link weights. With them, the similarity of a set of factors to every disease is a couple
+    of sparse operations instead of a Python loop building a set per disease.
+    """
+
+    def __init__(self, kg_data):
+        """
+        Args:
+            kg_data: Knowledge graph dictionary ({"nodes": [...], "links": [...]})
+        """
+        self.diseases = []
+        self.rows = {}
+        for node in kg_data['nodes']:
+            if node['type'] == 'Disease' and node['id'] not in self.rows:
+                self.rows[node['id']] = len(self.diseases)
+                self.diseases.append(node['id'])
+
+        # A repeated (disease, factor) link keeps the weight of the last one, like NetworkX
+        self.columns = {}
+        weights = {}
+        for link in kg_data['links']:
+            source = link['source'] if isinstance(link['source'], str) else link['source']['id']
+            row = self.rows.get(source)
+            if row is None:
+                continue
+            target = link['target'] if isinstance(link['target'], str) else link['target']['id']
+            column = self.columns.setdefault(target, len(self.columns))
+            weights[(row, column)] = link.get('weight', 1.0)
+
+        rows = np.fromiter((row for row, _ in weights), dtype=np.int64, count=len(weights))
+        columns = np.fromiter((column for _, column in weights), dtype=np.int64, count=len(weights))
+        values = np.fromiter(weights.values(), dtype=np.float64, count=len(weights))
+        self._set_entries(rows, columns, values)
+
+    def with_rows(self, updates):
+        """
+        Return the matrix of a graph derived from this one by editing some diseases.
+
+        Only the rows of the edited diseases are rebuilt, new diseases get a row after the
+        existing ones and new factors a column after the existing ones. This matrix is left
+        unchanged.
+
+        Args:
+            updates: Dictionary of edited disease id -> {factor id: weight}, in graph order
+        """
+        matrix = DiseaseFactorMatrix.__new__(DiseaseFactorMatrix)
+        matrix.diseases = list(self.diseases)
+        matrix.rows = dict(self.rows)
+        matrix.columns = dict(self.columns)
+
+        edited_rows = []
+        new_rows, new_columns, new_values = [], [], []
+        for disease, factors in updates.items():
+            row = matrix.rows.get(disease)
+            if row is None:
+                row = matrix.rows[disease] = len(matrix.diseases)
+                matrix.diseases.append(disease)
+            else:
+                edited_rows.append(row)
+            for factor, weight in factors.items():
+                new_rows.append(row)
+                new_columns.append(matrix.columns.setdefault(factor, len(matrix.columns)))
+                new_values.append(weight)
+
+        entries = self.weighted.tocoo()
+        keep = ~np.isin(entries.row, edited_rows)
+        matrix._set_entries(np.concatenate([entries.row[keep], np.array(new_rows, dtype=np.int64)]),
+                            np.concatenate([entries.col[keep], np.array(new_columns, dtype=np.int64)]),
+                            np.concatenate([entries.data[keep], np.array(new_values, dtype=np.float64)]))
+        return matrix
+
+    def _set_entries(self, rows, columns, values):
+        # Build the matrices and the per-row statistics from (row, column, weight) entries
+        shape = (len(self.diseases), len(self.columns))
+        self.weighted = sparse.csr_matrix((values, (rows, columns)), shape=shape)
+        self.binary = sparse.csr_matrix((np.ones(len(values)), (rows, columns)), shape=shape)
+
+        # Per-disease factor counts, weight sums and weight norms
+        self.row_counts = np.diff(self.binary.indptr).astype(np.float64)
+        self.row_sums = np.asarray(self.weighted.sum(axis=1)).ravel()
+        self.row_norms = np.sqrt(np.asarray(self.weighted.multiply(self.weighted).sum(axis=1)).ravel())
+
+    def similarities(self, factors, metric='jaccard'):
+        """
+        Compute the similarity of a set of factors to every disease.
+
+        - jaccard: |shared| / |union| of the factor sets
+        - weighted_jaccard: sum of min / sum of max of the factor weights
+        - cosine: cosine of the factor weight vectors
+
+        Args:
+            factors: Dictionary of factor id -> weight, factors unknown to the graph count in
+                the union and the norm but match no disease
+            metric: One of SIMILARITY_METRICS
+
+        Returns:
+            (similarities, defined) arrays by row, defined is False where the similarity has no
+            meaning, e.g. a Jaccard similarity of two empty sets
+        """
+        if metric not in SIMILARITY_METRICS:
+            raise ValueError(f"Unknown similarity metric '{metric}', expected one of {', '.join(SIMILARITY_METRICS)}")
+
+        known = [(self.columns[factor], weight) for factor, weight in factors.items() if factor in self.columns]
+        columns = np.array([column for column, _ in known], dtype=np.int64)
+        weights = np.array([weight for _, weight in known], dtype=np.float64)
+
+        if metric == 'jaccard':
+            vector = np.zeros(len(self.columns))
+            vector[columns] = 1.0
+            shared = self.binary @ vector
+            union = len(factors) + self.row_counts - shared
+            numerator, denominator = shared, union
+        elif metric == 'weighted_jaccard':
+            # Sum of the minimum weights over the factors of both sides
+            submatrix = self.weighted[:, columns].tocsr()
+            submatrix.data = np.minimum(submatrix.data, weights[submatrix.indices])
+            minimum = np.asarray(submatrix.sum(axis=1)).ravel()
+            maximum = self.row_sums + sum(factors.values()) - minimum
+            numerator, denominator = minimum, maximum
+        else:
+            vector = np.zeros(len(self.columns))
+            vector[columns] = weights
+            norm = np.sqrt(sum(weight * weight for weight in factors.values()))
+            numerator, denominator = self.weighted @ vector, self.row_norms * norm
+
+        defined = denominator > 0
+        similarities = np.zeros(len(self.diseases))
+        np.divide(numerator, denominator, out=similarities, where=defined)
+        return similarities, defined
+
+    def top_k(self, similarities, defined, k, exclude=()):
+        """
+        Select the k most similar diseases without sorting them all.
+
+        Candidates are narrowed down with a partial selection, then only those are sorted.
+        Ties are broken by graph order, as a stable sort of every disease would.
+
+        Args:
+            similarities: Similarities by row, from similarities()
+            defined: Rows whose similarity is defined, from similarities()
+            k: Number of diseases to return
+            exclude: Disease ids left out, e.g. the predicted disease
+
+        Returns:
+            List of (disease id, similarity), most similar first
+        """
+        mask = defined.copy()
+        for disease in exclude:
+            row = self.rows.get(disease)
+            if row is not None:
+                mask[row] = False
+
+        candidates = np.flatnonzero(mask)
+        if k <= 0 or len(candidates) == 0:
+            return []
+
+        if len(candidates) > k:
+            # Keep everything at least as similar as the k-th best, so ties can be ordered
+            selected = np.argpartition(-similarities[candidates], k - 1)[:k]
+            threshold = similarities[candidates[selected]].min()
+            candidates = candidates[similarities[candidates] >= threshold]
+
+        order = np.lexsort((candidates, -similarities[candidates]))[:k]
+        return [(self.diseases[row], float(similarities[row])) for row in candidates[order]]
+
+
+def factor_similarity(factors, other, metric='jaccard'):
+    """
+    Similarity of two factor -> weight dictionaries, computed like DiseaseFactorMatrix does.
+
+    Returns:
+        The similarity, or None where it is not defined
+    """
+    shared = factors.keys() & other.keys()
+    if metric == 'jaccard':
+        numerator, denominator = len(shared), len(factors) + len(other) - len(shared)
+    elif metric == 'weighted_jaccard':
+        minimum = sum(min(factors[factor], other[factor]) for factor in shared)
+        numerator = minimum
+        denominator = sum(factors.values()) + sum(other.values()) - minimum
+    elif metric == 'cosine':
+        numerator = sum(factors[factor] * other[factor] for factor in shared)
+        denominator = (np.sqrt(sum(w * w for w in factors.values())) *
+                       np.sqrt(sum(w * w for w in other.values())))
+    else:
+        raise ValueError(f"Unknown similarity metric '{metric}', expected one of {', '.join(SIMILARITY_METRICS)}")
+
+    if denominator <= 0:
+        return None
+    return numerator / denominator
+
+
+class MinHashLSHIndex:
+    """
+    Approximate index of the diseases of a knowledge graph by the similarity of their factor sets.
+
+    Each disease gets a MinHash signature of its factor set, split into bands; diseases that
+    agree on every value of a band land in the same bucket of that band. A query only looks at
+    the diseases sharing a bucket with it, whose probability grows steeply with their Jaccard
+    similarity (1 - (1 - s^rows)^bands), and re-ranks them exactly.
+
+    Buckets hold tuples that are replaced rather than modified, so copy() only copies the
+    tables and an edited disease is re-indexed with update() in O(bands).
+    """
+
+    # Modulus of the universal hash functions, a 31-bit Mersenne prime so that a * x + b of
+    # values reduced modulo it cannot overflow 64 bits
+    PRIME = (1 << 31) - 1
+
+    def __init__(self, kg_data=None, num_perm=128, bands=32, seed=1):
+        """
+        Args:
+            kg_data: Optional knowledge graph dictionary to index
+            num_perm: Number of hash functions of the signatures
+            bands: Number of bands, must divide num_perm
+            seed: Seed of the hash functions
+        """
+        if num_perm % bands:
+            raise ValueError(f"bands ({bands}) must divide num_perm ({num_perm})")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, self.PRIME, size=num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, self.PRIME, size=num_perm, dtype=np.uint64)
+        self._band_weights = generator.randint(1, 1 << 62, size=self.rows, dtype=np.uint64) | np.uint64(1)
+
+        self.factors = {}
+        self.order = {}
+        self.signatures = {}
+        self.buckets = [{} for _ in range(bands)]
+
+        if kg_data is not None:
+            self._build(kg_data)
+
+    def copy(self):
+        """Return an index that can be updated without affecting this one."""
+        index = MinHashLSHIndex.__new__(MinHashLSHIndex)
+        index.__dict__.update(self.__dict__)
+        index.factors = dict(self.factors)
+        index.order = dict(self.order)
+        index.signatures = dict(self.signatures)
+        index.buckets = [dict(band) for band in self.buckets]
+        return index
+
+    def signature(self, factors):
+        """Return the MinHash signature of a collection of factor ids."""
+        return self._hash_values(list(factors)).min(axis=0)
+
+    def update(self, disease, factors):
+        """
+        Index a new disease or re-index an edited one.
+
+        Args:
+            disease: Disease id
+            factors: Dictionary of factor id -> weight of the disease
+        """
+        previous = self.signatures.pop(disease, None)
+        if previous is not None:
+            for band, key in zip(self.buckets, self._band_keys(previous[np.newaxis])[0]):
+                bucket = tuple(other for other in band[key] if other != disease)
+                if bucket:
+                    band[key] = bucket
+                else:
+                    del band[key]
+
+        self.order.setdefault(disease, len(self.order))
+        self.factors[disease] = dict(factors)
+        if factors:
+            signature = self.signature(factors)
+            self.signatures[disease] = signature
+            for band, key in zip(self.buckets, self._band_keys(signature[np.newaxis])[0]):
+                band[key] = band.get(key, ()) + (disease,)
+
+    def candidates(self, factors):
+        """Return the diseases sharing at least one bucket with a set of factors."""
+        if not factors:
+            return set()
+        keys = self._band_keys(self.signature(factors)[np.newaxis])[0]
+        found = set()
+        for band, key in zip(self.buckets, keys):
+            found.update(band.get(key, ()))
+        return found
+
+    def top_k(self, factors, k, metric='jaccard', exclude=()):
+        """
+        Approximate k most similar diseases, with their exact similarity.
+
+        Args:
+            factors: Dictionary of factor id -> weight
+            k: Number of diseases to return
+            metric: One of SIMILARITY_METRICS
+            exclude: Disease ids left out, e.g. the predicted disease
+
+        Returns:
+            List of (disease id, similarity), most similar first and in graph order on ties
+        """
+        if metric not in SIMILARITY_METRICS:
+            raise ValueError(f"Unknown similarity metric '{metric}', expected one of {', '.join(SIMILARITY_METRICS)}")
+        if k <= 0:
+            return []
+
+        scored = []
+        for disease in self.candidates(factors) - set(exclude):
+            similarity = factor_similarity(factors, self.factors[disease], metric)
+            if similarity is not None:
+                scored.append((-similarity, self.order[disease], disease))
+        scored.sort()
+        return [(disease, -negated) for negated, _, disease in scored[:k]]
+
+    def _build(self, kg_data):
+        # Factor weights by disease, the last of repeated links wins like in NetworkX
+        for node in kg_data['nodes']:
+            if node['type'] == 'Disease' and node['id'] not in self.factors:
+                self.order[node['id']] = len(self.order)
+                self.factors[node['id']] = {}
+        for link in kg_data['links']:
+            source = link['source'] if isinstance(link['source'], str) else link['source']['id']
+            factors = self.factors.get(source)
+            if factors is not None:
+                target = link['target'] if isinstance(link['target'], str) else link['target']['id']
+                factors[target] = link.get('weight', 1.0)
+
+        diseases = [disease for disease, factors in self.factors.items() if factors]
+        if not diseases:
+            return
+
+        # Hash every distinct factor once, then take the minimum over the factors of each
+        # disease with reduceat, a few thousand diseases at a time to bound memory
+        vocabulary = {}
+        for disease in diseases:
+            for factor in self.factors[disease]:
+                vocabulary.setdefault(factor, len(vocabulary))
+        hash_values = self._hash_values(list(vocabulary))
+
+        chunk = 4096
+        for start in range(0, len(diseases), chunk):
+            names = diseases[start:start + chunk]
+            columns = [vocabulary[factor] for disease in names for factor in self.factors[disease]]
+            offsets = np.cumsum([0] + [len(self.factors[disease]) for disease in names[:-1]])
+            signatures = np.minimum.reduceat(hash_values[columns], offsets, axis=0)
+
+            for disease, signature, keys in zip(names, signatures, self._band_keys(signatures)):
+                self.signatures[disease] = signature
+                for band, key in zip(self.buckets, keys):
+                    band.setdefault(key, []).append(disease)
+
+        for band in self.buckets:
+            for key, bucket in band.items():
+                band[key] = tuple(bucket)
+
+    def _hash_values(self, factors):
+        # Universal hashes (a * x + b) mod p of the CRC32 of each factor reduced mod p, one row
+        # per factor. a, b and x are below p < 2^31, so the product fits in 64 bits.
+        crcs = np.array([zlib.crc32(factor.encode('utf-8')) for factor in factors], dtype=np.uint64)
+        crcs %= np.uint64(self.PRIME)
+        values = (crcs[:, np.newaxis] * self._a + self._b) % np.uint64(self.PRIME)
+        return values.astype(np.uint32)
+
+    def _band_keys(self, signatures):
+        # Fold the values of each band into a single integer key, one row per signature
+        bands = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        return (bands * self._band_weights).sum(axis=2).tolist()
@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue already holds its maximum number of jobs."""
+
+
+class JobQueue:
+    """
+    Runs functions on a bounded pool of worker threads and keeps their results for polling.
+
+    At most `max_pending` jobs may be queued or running at once, further submissions are
+    refused instead of piling up. Finished jobs are kept for `result_ttl` seconds after they
+    complete and then evicted.
+    """
+
+    def __init__(self, max_workers=2, max_pending=32, result_ttl=600.0):
+        """
+        Args:
+            max_workers: Number of worker threads
+            max_pending: Maximum number of queued and running jobs
+            result_ttl: Seconds a finished job is kept before it is evicted
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a function call as a job.
+
+        Raises:
+            QueueFullError: If max_pending jobs are already queued or running
+
+        Returns:
+            The id of the job
+        """
+        with self._lock:
+            self._evict_expired()
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            self._pending += 1
+
+        self._executor.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    def get(self, job_id):
+        """
+        Return a copy of a job with its timings, or None if it does not exist or expired.
+
+        The timings are the seconds spent waiting in the queue and running, so far for a job
+        that is not finished yet.
+        """
+        with self._lock:
+            self._evict_expired()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+
+        now = time.time()
+        started_at = job['started_at']
+        finished_at = job['finished_at']
+        job['timing'] = {
+            'queued_seconds': (started_at or now) - job['submitted_at'],
+            'run_seconds': (finished_at or now) - started_at if started_at else 0
+        }
+        return job
+
+    def stats(self):
+        """Return the number of jobs by status."""
+        with self._lock:
+            self._evict_expired()
+            counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+            for job in self._jobs.values():
+                counts[job['status']] += 1
+            counts['max_pending'] = self.max_pending
+            return counts
+
+    def _run(self, job_id, func, args, kwargs):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+
+        try:
+            result = func(*args, **kwargs)
+            status, error = 'done', None
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            result, status, error = None, 'failed', str(e)
+
+        with self._lock:
+            job['status'] = status
+            job['result'] = result
+            job['error'] = error
+            job['finished_at'] = time.time()
+            self._pending -= 1
+
+            # Keep the jobs ordered by completion time, so expired ones are at the front
+            self._jobs.move_to_end(job_id)
+
+    def _evict_expired(self):
+        # Finished jobs are at the front of the ordered dict in completion order
+        cutoff = time.time() - self.result_ttl
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            if job['finished_at'] is None:
+                continue
+            if job['finished_at'] > cutoff:
+                break
+            del self._jobs[job_id]
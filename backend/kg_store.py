@@ -0,0 +1,746 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from file_utils import FileLock, atomic_write
+from xai import GroundTruthIndex
+
+logger = logging.getLogger(__name__)
+
+# Type given to a target node created by an update, based on the relationship of its link
+RELATIONSHIP_TARGET_TYPES = {
+    'HAS_SYMPTOM': 'Symptom',
+    'COMMON_IN': 'Age Group',
+    'PREVALENT_IN': 'Gender',
+    'ASSOCIATED_WITH': 'Blood Pressure',
+    'CORRELATED_WITH': 'Cholesterol Level'
+}
+
+
+def link_endpoint(value):
+    """Return the node id of a link source/target, which may be an id or a node object."""
+    return value['id'] if isinstance(value, dict) else value
+
+
+class SharedList:
+    """
+    Node or link list of a knowledge graph, shared by the snapshots derived from each other.
+
+    Items are appended to a storage shared by every generation of the list, and removed by
+    recording the generation that removed them, so fork() is O(1) and an edit only costs the
+    items it appends or removes. A generation sees the items appended up to its length and
+    not removed at or before it. Only the newest generation can be forked without a copy.
+    """
+
+    def __init__(self, items=()):
+        """
+        Args:
+            items: Initial items of the list
+        """
+        self._items = list(items)
+        self._removed = {}
+        self._newest = [0]
+        self._generation = 0
+        self._start = 0
+        self._length = len(self._items)
+        self._count = self._length
+
+    def fork(self):
+        """Return a new generation of the list, which can be modified without affecting this one."""
+        if self._newest[0] != self._generation:
+            # A newer generation of this one was discarded, start a new storage
+            return SharedList(self).fork()
+        self._newest[0] += 1
+        other = SharedList.__new__(SharedList)
+        other._items = self._items
+        other._removed = self._removed
+        other._newest = self._newest
+        other._generation = self._newest[0]
+        other._start = other._length = self._length
+        other._count = self._count
+        return other
+
+    def append(self, item):
+        self._items.append(item)
+        self._length += 1
+        self._count += 1
+
+    def remove_items(self, items):
+        """Remove the given items of the list, found by identity."""
+        for item in items:
+            self._removed[id(item)] = self._generation
+            self._count -= 1
+
+    def added_since(self, other):
+        """Return the items appended since other, the generation this one was forked from."""
+        if other is self:
+            return []
+        return [item for item in self._items[self._start:self._length] if self._visible(item)]
+
+    def _visible(self, item):
+        # The storage keeps the items alive, so their ids are not reused while it exists
+        removed = self._removed.get(id(item))
+        return removed is None or removed > self._generation
+
+    def __iter__(self):
+        items = itertools.islice(self._items, self._length)
+        if not self._removed:
+            return items
+        return (item for item in items if self._visible(item))
+
+    def __len__(self):
+        return self._count
+
+    def __eq__(self, other):
+        if isinstance(other, (SharedList, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"SharedList({list(self)!r})"
+
+
+# Marks a key removed from a SharedDict
+_REMOVED = object()
+
+
+class SharedDict:
+    """
+    Dictionary shared by the snapshots derived from each other, like SharedList.
+
+    The values of the first generation are kept in a plain dictionary, and every later write
+    is recorded with its generation in the history of its key, so fork() is O(1) and a write
+    only costs its key. Only the newest generation can be forked without a copy. Values are
+    shared between generations and must be replaced rather than modified.
+    """
+
+    def __init__(self, items=None):
+        """
+        Args:
+            items: Initial items of the dictionary
+        """
+        self._base = dict(items or {})
+        self._history = {}
+        self._newest = [0]
+        self._generation = 0
+
+    def fork(self):
+        """Return a new generation of the dictionary, which can be modified without affecting this one."""
+        if self._newest[0] != self._generation:
+            # A newer generation of this one was discarded, start a new storage
+            return SharedDict(self._items()).fork()
+        self._newest[0] += 1
+        other = SharedDict.__new__(SharedDict)
+        other._base = self._base
+        other._history = self._history
+        other._newest = self._newest
+        other._generation = self._newest[0]
+        return other
+
+    def get(self, key, default=None):
+        for generation, value in reversed(self._history.get(key, ())):
+            if generation <= self._generation:
+                return default if value is _REMOVED else value
+        return self._base.get(key, default)
+
+    def pop(self, key, default=None):
+        value = self.get(key, _REMOVED)
+        if value is _REMOVED:
+            return default
+        self._set(key, _REMOVED)
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key, _REMOVED)
+        if value is _REMOVED:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._set(key, value)
+
+    def __contains__(self, key):
+        return self.get(key, _REMOVED) is not _REMOVED
+
+    def _set(self, key, value):
+        if self._generation == 0:
+            if value is _REMOVED:
+                self._base.pop(key, None)
+            else:
+                self._base[key] = value
+            return
+        history = self._history.setdefault(key, [])
+        if history and history[-1][0] == self._generation:
+            history[-1] = (self._generation, value)
+        else:
+            history.append((self._generation, value))
+
+    def _items(self):
+        items = {}
+        for key in list(self._base) + list(self._history):
+            value = self.get(key, _REMOVED)
+            if value is not _REMOVED:
+                items[key] = value
+        return items
+
+
+class KGIndex:
+    """
+    Lookup tables over a knowledge graph so endpoints do not have to scan it.
+
+    - nodes_by_id: node id -> node
+    - ids_by_type: node type -> SharedList of the node ids, in graph order
+    - outgoing: source id -> links leaving it, in graph order
+    - incoming: target id -> links arriving at it, in graph order
+
+    The tables are SharedDicts, so copy() is O(1): the copy shares them with this index and
+    duplicates a per-key list the first time it modifies it, so an edit costs O(degree).
+    """
+
+    def __init__(self, kg_data=None):
+        """
+        Args:
+            kg_data: Optional knowledge graph dictionary to index
+        """
+        self.nodes_by_id = SharedDict()
+        self.ids_by_type = SharedDict()
+        self.outgoing = SharedDict()
+        self.incoming = SharedDict()
+        self._owned = set()
+
+        if kg_data is not None:
+            for node in kg_data['nodes']:
+                self.add_node(node)
+            for link in kg_data['links']:
+                self.add_link(link)
+
+    def copy(self):
+        """Return an index that can be modified without affecting this one."""
+        index = KGIndex()
+        index.nodes_by_id = self.nodes_by_id.fork()
+        index.ids_by_type = self.ids_by_type.fork()
+        index.outgoing = self.outgoing.fork()
+        index.incoming = self.incoming.fork()
+
+        # The lists are shared from now on, so both sides copy them before writing
+        self._owned = set()
+        return index
+
+    def nodes_of_type(self, node_type):
+        """Return the nodes of the given type, in graph order."""
+        return [self.nodes_by_id[node_id] for node_id in self.ids_by_type.get(node_type, [])]
+
+    def has_node(self, node_id, node_type=None):
+        """Check whether a node exists, optionally with the given type."""
+        node = self.nodes_by_id.get(node_id)
+        return node is not None and (node_type is None or node['type'] == node_type)
+
+    def add_node(self, node):
+        # The first node with a given id wins, as it did with the linear scans
+        if node['id'] not in self.nodes_by_id:
+            self.nodes_by_id[node['id']] = node
+
+        # The id lists of the types only grow, so they are forked rather than copied
+        node_type = node['type']
+        if ('type', node_type) not in self._owned:
+            ids = self.ids_by_type.get(node_type)
+            self.ids_by_type[node_type] = ids.fork() if ids is not None else SharedList()
+            self._owned.add(('type', node_type))
+        self.ids_by_type[node_type].append(node['id'])
+
+    def add_link(self, link):
+        self._bucket(self.outgoing, 'out', link_endpoint(link['source'])).append(link)
+        self._bucket(self.incoming, 'in', link_endpoint(link['target'])).append(link)
+
+    def remove_outgoing(self, source):
+        """Remove every link leaving the source node and return them."""
+        removed = self.outgoing.pop(source, [])
+        self._owned.discard(('out', source))
+
+        removed_ids = {id(link) for link in removed}
+        for target in {link_endpoint(link['target']) for link in removed}:
+            bucket = [link for link in self.incoming[target] if id(link) not in removed_ids]
+            self.incoming[target] = bucket
+            self._owned.add(('in', target))
+
+        return removed
+
+    def _bucket(self, table, kind, key):
+        # Copy a list shared with another index before the first write to it
+        if (kind, key) not in self._owned:
+            table[key] = list(table.get(key, []))
+            self._owned.add((kind, key))
+        return table[key]
+
+
+def validate_disease_update(disease_name, connections):
+    """
+    Check the disease and connections of an /api/update-graph edit.
+
+    Raises:
+        ValueError: If the disease name is not a string, or connections is not a list of
+            dictionaries with a string target and relationship and an optional numeric weight
+    """
+    if not isinstance(disease_name, str):
+        raise ValueError("Disease name must be a string")
+    if not isinstance(connections, list):
+        raise ValueError("Connections must be a list")
+    for conn in connections:
+        if not isinstance(conn, dict):
+            raise ValueError(f"Invalid connection {conn!r}, expected an object")
+        if not isinstance(conn.get('target'), str) or not isinstance(conn.get('relationship'), str):
+            raise ValueError(f"Invalid connection {conn!r}, target and relationship must be strings")
+        weight = conn.get('weight', 0.5)
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)):
+            raise ValueError(f"Invalid connection {conn!r}, weight must be a number")
+
+
+def apply_disease_update(kg_data, index, disease_name, action, connections):
+    """
+    Apply an /api/update-graph edit to a knowledge graph and its index in place.
+
+    Every node and link the edit creates is marked with custom: True, so a graph regenerated
+    from the CSV keeps them (see get_custom_elements() in csv-to-jsonkg.py).
+
+    Args:
+        kg_data: Knowledge graph dictionary, its SharedList nodes and links are modified
+        index: KGIndex of kg_data, kept in sync with the edit
+        disease_name: Disease being added or modified
+        action: 'add' to create the disease, 'modify' to replace its connections
+        connections: List of {'target', 'relationship', 'weight'} dictionaries, checked with
+            validate_disease_update()
+    """
+    # If adding a new disease, add it to the nodes
+    if action == 'add':
+        node = {'id': disease_name, 'type': 'Disease', 'custom': True}
+        kg_data['nodes'].append(node)
+        index.add_node(node)
+
+    # If modifying, remove all existing connections for this disease
+    if action == 'modify':
+        kg_data['links'].remove_items(index.remove_outgoing(disease_name))
+
+    # Add the new connections
+    for conn in connections:
+        target = conn.get('target')
+        relationship = conn.get('relationship')
+        weight = conn.get('weight', 0.5)
+
+        # If target doesn't exist, add it with the type implied by the relationship
+        if not index.has_node(target):
+            target_type = RELATIONSHIP_TARGET_TYPES.get(relationship)
+            if target_type == 'Symptom':
+                logger.info(f"Adding new symptom node: {target}")
+
+            node = {
+                'id': target,
+                'type': target_type,
+                'custom': True  # Mark as a custom-added node
+            }
+            kg_data['nodes'].append(node)
+            index.add_node(node)
+
+        # Add the new link
+        link = {
+            'source': disease_name,
+            'target': target,
+            'relationship': relationship,
+            'weight': weight,
+            'custom': True
+        }
+        kg_data['links'].append(link)
+        index.add_link(link)
+
+
+class GraphEdit:
+    """
+    What changed between a snapshot and the snapshot derived from it by disease edits.
+
+    - previous_version: version of the snapshot the edits were applied to
+    - factors: edited disease id -> {factor id: weight} of its links after the edits
+    - outgoing: edited disease id -> its links after the edits, in graph order
+    - nodes: nodes added by the edits, in graph order
+    - removed_links: links of the previous graph removed by the edits
+    - added_links: links added by the edits, in graph order
+    - affected: ids of the nodes whose links or attributes changed, or that link to such a node
+
+    Caches of derived data use it to patch or drop only what depends on the edited diseases.
+    """
+
+    def __init__(self, previous, kg_data, index, diseases):
+        """
+        Args:
+            previous: Snapshot the edits were applied to
+            kg_data: The edited knowledge graph dictionary
+            index: KGIndex of the edited graph
+            diseases: Ids of the diseases that were added or modified
+        """
+        self.previous_version = previous.version
+        self.factors = {}
+        self.outgoing = {}
+        self.removed_links = []
+
+        for disease in diseases:
+            if disease in self.outgoing:
+                continue
+            links = index.outgoing.get(disease, [])
+            self.outgoing[disease] = links
+            factors = {}
+            for link in links:
+                factors[link_endpoint(link['target'])] = link.get('weight', 1.0)
+            self.factors[disease] = factors
+
+            current = {id(link) for link in links}
+            self.removed_links.extend(link for link in previous.index.outgoing.get(disease, [])
+                                      if id(link) not in current)
+
+        # Edits only append nodes and links, after removing the replaced links
+        self.nodes = kg_data['nodes'].added_since(previous.kg['nodes'])
+        self.added_links = kg_data['links'].added_since(previous.kg['links'])
+
+        self.affected = set(self.outgoing)
+        for node in self.nodes:
+            self.affected.add(node['id'])
+            self.affected.update(link_endpoint(link['source']) for link in index.incoming.get(node['id'], []))
+
+
+class GroundTruthSnapshot:
+    """
+    A fully loaded view of the ground truth knowledge graph at one version.
+
+    Snapshots are never mutated once published by the store, so request handlers can
+    read from them without locking. Writers build a new graph and publish a new snapshot.
+    """
+
+    def __init__(self, kg_data, version, index=None, ground_truth=None, edit=None):
+        """
+        Args:
+            kg_data: The knowledge graph dictionary, its nodes and links in SharedLists
+            version: Version counter the graph was loaded at
+            index: KGIndex of kg_data, built from it when not given
+            ground_truth: GroundTruthIndex of kg_data, built from it on first use when not given
+            edit: GraphEdit from the previous snapshot, when this one was derived from it
+        """
+        self.kg = kg_data
+        self.version = version
+        self.index = index if index is not None else KGIndex(kg_data)
+        self.edit = edit
+
+        self._ground_truth = ground_truth
+        self._build_lock = threading.Lock()
+
+    @property
+    def ground_truth(self):
+        """GroundTruthIndex the predictions are analyzed against, shared by every request."""
+        if self._ground_truth is None:
+            with self._build_lock:
+                if self._ground_truth is None:
+                    self._ground_truth = GroundTruthIndex(self.kg)
+        return self._ground_truth
+
+    def derive(self, kg_data, version, index, diseases):
+        """
+        Return the snapshot of a graph derived from this one by editing some diseases.
+
+        The structures this snapshot's ground truth index already built are patched for the
+        edit, the others are left to be built on first use.
+
+        Args:
+            kg_data: The edited knowledge graph dictionary
+            version: Version of the edited graph
+            index: KGIndex of the edited graph
+            diseases: Ids of the diseases that were added or modified
+        """
+        edit = GraphEdit(self, kg_data, index, diseases)
+        ground_truth = None
+        if self._ground_truth is not None:
+            ground_truth = self._ground_truth.derive(kg_data, edit)
+        return GroundTruthSnapshot(kg_data, version, index, ground_truth, edit)
+
+
+class GroundTruthStore:
+    """
+    Process-wide holder of the ground truth knowledge graph.
+
+    The JSON file is parsed once and served from memory. Edits are not written to it
+    directly: each one is appended as a small record to a journal next to it, under a lock
+    shared by all worker processes, and compact() periodically folds the journal into a new
+    JSON snapshot that atomically replaces the old one.
+
+    Every call to get() stats the files and reads the version counter; when another worker
+    appended to the journal only the new records are applied, and the graph is fully
+    reloaded only when the JSON file itself or the journal was replaced. compact() replaces
+    the journal by a new empty file rather than truncating it, so an offset read in the old
+    journal is never taken for an offset in the new one.
+    """
+
+    def __init__(self, kg_path):
+        """
+        Args:
+            kg_path: Path to the ground truth knowledge graph JSON
+        """
+        self.kg_path = kg_path
+        self.version_path = kg_path + ".version"
+        self.journal_path = kg_path + ".journal"
+        self.file_lock = FileLock(kg_path + ".lock")
+
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._signature = None
+        self._base_version = 0
+        self._journal_offset = 0
+        self._compactor = None
+
+    @property
+    def version(self):
+        """Version of the current ground truth graph."""
+        return self.get().version
+
+    def get(self):
+        """Return the current snapshot, reloading it if the files or version changed."""
+        signature = self._current_signature()
+        snapshot = self._snapshot
+        if snapshot is not None and signature == self._signature:
+            return snapshot
+
+        with self._lock:
+            signature = self._current_signature()
+            if self._snapshot is None or signature[:3] != self._signature[:3]:
+                self._reload(signature)
+            elif signature != self._signature:
+                self._apply_new_records(signature)
+            return self._snapshot
+
+    def update_disease(self, disease_name, action, connections):
+        """
+        Apply an /api/update-graph edit on top of the current graph.
+
+        The edit is checked and journaled under the inter-process lock, so concurrent edits
+        from other workers are never lost. It is applied to copies of the graph before it is
+        journaled, so a record that cannot be applied never reaches the journal. Only the
+        edit record is written, the JSON file is left to compact().
+
+        Raises:
+            ValueError: If the disease or connections are invalid (see
+                validate_disease_update()), or action is 'add' and a node with the disease
+                name already exists, a disease or a node of another type
+            LookupError: If action is 'modify' and the disease does not exist
+
+        Returns:
+            The newly published snapshot
+        """
+        validate_disease_update(disease_name, connections)
+
+        with self.file_lock, self._lock:
+            snapshot = self.get()
+
+            disease_exists = snapshot.index.has_node(disease_name, 'Disease')
+            if action == 'add' and disease_exists:
+                raise ValueError(f"Disease '{disease_name}' already exists")
+            if action == 'add' and snapshot.index.has_node(disease_name):
+                # The index keeps one node per id, the disease would be hidden behind it
+                node_type = snapshot.index.nodes_by_id[disease_name]['type']
+                raise ValueError(f"'{disease_name}' already exists as a {node_type} node")
+            if action == 'modify' and not disease_exists:
+                raise LookupError(f"Disease '{disease_name}' not found")
+
+            record = {
+                'version': max(snapshot.version, self._read_version()) + 1,
+                'op': 'update_disease',
+                'disease': disease_name,
+                'action': action,
+                'connections': connections
+            }
+            updated = self._derive_snapshot(snapshot, [record])
+
+            self._append_record(record)
+            self._write_version(record['version'])
+
+            self._snapshot = updated
+            self._signature = self._current_signature()
+            return updated
+
+    def compact(self):
+        """
+        Fold the journal into a new JSON snapshot of the graph.
+
+        The snapshot is written to a temporary file and renamed over the JSON file, then the
+        journal is replaced by an empty file. The snapshot stores its version, so records left
+        in the journal by a crash between the two steps are skipped when the graph is loaded
+        again. A worker that loaded the new JSON file before the journal was replaced sees
+        the journal change inode and loads the graph again.
+
+        Returns:
+            True if there was anything to compact
+        """
+        with self.file_lock, self._lock:
+            snapshot = self.get()
+            if not os.path.exists(self.journal_path) or os.path.getsize(self.journal_path) == 0:
+                return False
+
+            kg_data = {
+                'version': snapshot.version,
+                'nodes': list(snapshot.kg['nodes']),
+                'links': list(snapshot.kg['links'])
+            }
+            atomic_write(self.kg_path, json.dumps(kg_data, indent=2))
+            atomic_write(self.journal_path, '')
+
+            self._base_version = snapshot.version
+            self._journal_offset = 0
+            self._signature = self._current_signature()
+            logger.info(f"Compacted ground truth KG journal into version {snapshot.version}")
+            return True
+
+    def start_compaction(self, interval=60.0):
+        """Compact the journal every `interval` seconds in a daemon thread."""
+        if self._compactor is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Error compacting ground truth KG journal: {str(e)}")
+
+        self._compactor = threading.Thread(target=run, name="kg-compaction", daemon=True)
+        self._compactor.start()
+
+    def _reload(self, signature):
+        with open(self.kg_path, 'r') as f:
+            kg_data = json.load(f)
+
+        base_version = kg_data.get('version')
+        kg_data = {'nodes': SharedList(kg_data['nodes']), 'links': SharedList(kg_data['links'])}
+
+        version = max(signature[4], base_version or 0)
+        if base_version is None and self._signature is not None and signature[4] == self._signature[4]:
+            # The file was replaced outside of the store, e.g. regenerated from the CSV,
+            # so bump the counter ourselves to make the change visible.
+            version += 1
+            self._write_version(version)
+            signature = signature[:4] + (version,)
+
+        self._base_version = base_version or 0
+        self._journal_offset = 0
+        records = self._read_new_records()
+
+        snapshot = GroundTruthSnapshot(kg_data, version)
+        self._snapshot = self._apply_records(snapshot, records, signature)
+        logger.info(f"Loaded ground truth KG version {self._snapshot.version}: "
+                    f"{len(kg_data['nodes'])} nodes, {len(kg_data['links'])} links, "
+                    f"{len(records)} journaled edits")
+
+    def _apply_new_records(self, signature):
+        if signature[3] < self._journal_offset:
+            # The journal lost records we read, so the offset no longer points after them
+            self._reload(signature)
+            return
+
+        records = self._read_new_records()
+        snapshot = self._apply_records(self._snapshot, records, signature)
+        if snapshot.version < signature[4]:
+            snapshot = GroundTruthSnapshot(snapshot.kg, signature[4], snapshot.index, snapshot.ground_truth,
+                                           GraphEdit(snapshot, snapshot.kg, snapshot.index, []))
+            self._snapshot = snapshot
+
+    def _apply_records(self, snapshot, records, signature):
+        # Apply the records newer than the JSON file, then publish the result
+        records = [record for record in records if record['version'] > self._base_version]
+        snapshot = self._derive_snapshot(snapshot, records)
+
+        self._snapshot = snapshot
+        self._signature = signature
+        return snapshot
+
+    def _derive_snapshot(self, snapshot, records):
+        # Apply edit records on new generations of the graph lists and index, which share
+        # what the edits do not touch with the snapshot. A record that cannot be applied, e.g.
+        # journaled by an older version without checks, is logged and skipped so it does not
+        # break every load of the graph.
+        if not records:
+            return snapshot
+
+        kg_data = {
+            'nodes': snapshot.kg['nodes'].fork(),
+            'links': snapshot.kg['links'].fork()
+        }
+        index = snapshot.index.copy()
+        diseases = []
+        for record in records:
+            if record.get('op') != 'update_disease':
+                continue
+            try:
+                validate_disease_update(record.get('disease'), record.get('connections'))
+            except ValueError as e:
+                logger.error(f"Skipping ground truth KG edit version {record.get('version')}: {str(e)}")
+                continue
+            apply_disease_update(kg_data, index, record['disease'], record['action'], record['connections'])
+            diseases.append(record['disease'])
+
+        version = max(snapshot.version, records[-1]['version'])
+        return snapshot.derive(kg_data, version, index, diseases)
+
+    def _read_new_records(self):
+        # Read the complete records appended since the last read, a partially written last
+        # line is left for the next read
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        end = data.rfind(b"\n") + 1
+        self._journal_offset += end
+        records = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                logger.error(f"Skipping unreadable ground truth KG journal record: {str(e)}")
+                continue
+            if isinstance(record, dict) and isinstance(record.get('version'), int):
+                records.append(record)
+            else:
+                logger.error(f"Skipping ground truth KG journal record without a version: {line[:200]!r}")
+        return records
+
+    def _append_record(self, record):
+        # Drop a torn record left by a crashed writer before appending
+        with open(self.journal_path, 'ab') as f:
+            if f.tell() > self._journal_offset:
+                f.truncate(self._journal_offset)
+            f.write(json.dumps(record).encode('utf-8') + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_offset = os.path.getsize(self.journal_path)
+
+    def _current_signature(self):
+        # (JSON file mtime, JSON file size, journal inode, journal size, version counter)
+        stat = os.stat(self.kg_path)
+        try:
+            journal = os.stat(self.journal_path)
+            journal_inode, journal_size = journal.st_ino, journal.st_size
+        except FileNotFoundError:
+            journal_inode, journal_size = None, 0
+        return (stat.st_mtime_ns, stat.st_size, journal_inode, journal_size, self._read_version())
+
+    def _read_version(self):
+        try:
+            with open(self.version_path, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_version(self, version):
+        atomic_write(self.version_path, str(version))
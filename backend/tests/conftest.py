@@ -0,0 +1,29 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def kg_path(tmp_path):
+    """Path of a small ground truth knowledge graph."""
+    path = tmp_path / "knowledge_graph.json"
+    path.write_text(json.dumps({
+        "nodes": [
+            {"id": "Asthma", "type": "Disease"},
+            {"id": "Influenza", "type": "Disease"},
+            {"id": "Fever", "type": "Symptom"},
+            {"id": "Cough", "type": "Symptom"},
+            {"id": "Senior Age", "type": "Age Group"}
+        ],
+        "links": [
+            {"source": "Asthma", "target": "Cough", "relationship": "HAS_SYMPTOM", "weight": 0.8},
+            {"source": "Influenza", "target": "Fever", "relationship": "HAS_SYMPTOM", "weight": 0.9},
+            {"source": "Influenza", "target": "Senior Age", "relationship": "COMMON_IN", "weight": 0.4}
+        ]
+    }))
+    return str(path)
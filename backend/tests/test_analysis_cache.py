@@ -0,0 +1,65 @@
+from analysis_cache import AnalysisCache
+from kg_store import GroundTruthStore
+from xai import KGExplainer
+
+PREDICTION_KG = {
+    "nodes": [{"id": "Asthma", "type": "Disease"}, {"id": "Cough", "type": "Symptom"}],
+    "links": [{"source": "Asthma", "target": "Cough", "relationship": "HAS_SYMPTOM", "weight": 1.0}]
+}
+
+
+def analyze(cache, snapshot, sections):
+    """Analyze the prediction like api.analyze_prediction(), through the cache."""
+    key = AnalysisCache.make_key(PREDICTION_KG, sorted(sections))
+    cache.invalidate(snapshot.version, snapshot.edit)
+    cached = cache.get(key, snapshot.version)
+    if cached is not None:
+        return cached
+
+    explainer = KGExplainer.from_index(snapshot.ground_truth, PREDICTION_KG)
+    results = explainer.analyze(sections)
+    result = {section: results[section] for section in sections}
+    cache.put(key, snapshot.version, result, explainer.get_dependencies())
+    return result
+
+
+def test_results_carried_over_unrelated_edit(kg_path, tmp_path):
+    store = GroundTruthStore(kg_path)
+    cache = AnalysisCache(path=str(tmp_path / "analyses.db"))
+    result = analyze(cache, store.get(), ['metrics'])
+
+    snapshot = store.update_disease("Influenza", "modify", [
+        {"target": "Fatigue", "relationship": "HAS_SYMPTOM", "weight": 0.7}
+    ])
+    assert analyze(cache, snapshot, ['metrics']) == result
+    assert cache.stats()['carried_over'] == 1
+    assert cache.stats()['memory_hits'] == 1
+
+    # The on-disk entry moved to the new version too
+    reopened = AnalysisCache(path=str(tmp_path / "analyses.db"))
+    assert analyze(reopened, snapshot, ['metrics']) == result
+    assert reopened.stats()['disk_hits'] == 1
+
+
+def test_results_dropped_by_edit_of_their_disease(kg_path):
+    store = GroundTruthStore(kg_path)
+    cache = AnalysisCache()
+    analyze(cache, store.get(), ['metrics'])
+
+    snapshot = store.update_disease("Asthma", "modify", [
+        {"target": "Fever", "relationship": "HAS_SYMPTOM", "weight": 0.9}
+    ])
+    analyze(cache, snapshot, ['metrics'])
+    assert cache.stats()['invalidated'] == 1
+    assert cache.stats()['hits'] == 0
+
+
+def test_results_reading_whole_graph_dropped_by_any_edit(kg_path):
+    store = GroundTruthStore(kg_path)
+    cache = AnalysisCache()
+    analyze(cache, store.get(), ['structural_comparison'])
+
+    snapshot = store.update_disease("Influenza", "modify", [])
+    analyze(cache, snapshot, ['structural_comparison'])
+    assert cache.stats()['carried_over'] == 0
+    assert cache.stats()['hits'] == 0
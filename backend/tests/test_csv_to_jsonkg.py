@@ -0,0 +1,244 @@
+import importlib
+import json
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+
+import pandas as pd
+import pytest
+
+from benchmark import make_dataset, masked_feature_counts
+from file_utils import FileLock
+from kg_store import GroundTruthStore
+
+builder = importlib.import_module("csv-to-jsonkg")
+
+COLUMNS = ["Disease", "Fever", "Cough", "Fatigue", "Difficulty Breathing", "Age", "Gender",
+           "Blood Pressure", "Cholesterol Level", "Outcome Variable"]
+
+ROWS = [
+    "Influenza,Yes,No,Yes,Yes,19,Female,Low,Normal,Positive",
+    "Influenza,Yes,Yes,Yes,No,67,Male,Normal,Normal,Positive",
+    "Asthma,No,Yes,No,Yes,25,Male,Normal,High,Positive",
+    "Asthma,No,Yes,Yes,Yes,31,Female,Normal,Normal,Negative"
+]
+
+NEW_ROWS = [
+    "Influenza,Yes,No,No,No,72,Female,High,Normal,Positive",
+    "Influenza,No,No,Yes,No,70,Male,Low,High,Negative"
+]
+
+
+DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "ds-mf-filtered.csv")
+
+AGE_GROUPS = [("Child", 0, 17), ("Young Adult", 18, 34), ("Middle Aged", 35, 59), ("Senior", 60, 120)]
+
+
+def baseline_graph(df):
+    """Build the graph of a dataset like the builder did before the grouped pass, one disease mask per feature."""
+    kg = {"nodes": [], "links": []}
+    unique_nodes = set()
+
+    def add_node(node_id, node_type, properties=None):
+        if node_id not in unique_nodes:
+            kg["nodes"].append({"id": node_id, "type": node_type, **(properties or {})})
+            unique_nodes.add(node_id)
+
+    def add_links(disease, counts, total, relationship, threshold, node_id):
+        for value, count in counts.items():
+            weight = float(count / total)
+            if weight > threshold:
+                kg["links"].append({"source": disease, "target": node_id(value),
+                                    "relationship": relationship, "weight": weight})
+
+    for disease in df["Disease"].unique():
+        add_node(disease, "Disease")
+
+    for symptom in ["Fever", "Cough", "Fatigue", "Difficulty Breathing"]:
+        add_node(symptom, "Symptom")
+        for disease in df["Disease"].unique():
+            disease_rows = df[df["Disease"] == disease]
+            yes_count = (disease_rows[symptom] == "Yes").sum()
+            if yes_count > 0:
+                add_links(disease, {symptom: yes_count}, len(disease_rows), "HAS_SYMPTOM", 0.4, lambda value: value)
+
+    for name, low, high in AGE_GROUPS:
+        add_node(f"{name} Age", "Age Group", {"min_age": low, "max_age": high})
+    for disease in df["Disease"].unique():
+        disease_rows = df[df["Disease"] == disease]
+        age_group_counts = defaultdict(int)
+        for age in disease_rows["Age"]:
+            for name, low, high in AGE_GROUPS:
+                if low <= age <= high:
+                    age_group_counts[f"{name} Age"] += 1
+                    break
+        add_links(disease, age_group_counts, len(disease_rows), "COMMON_IN", 0.3, lambda value: value)
+
+    for column, node_id, node_type, relationship in [
+        ("Gender", "{} Gender", "Gender", "PREVALENT_IN"),
+        ("Blood Pressure", "{} Blood Pressure", "Blood Pressure", "ASSOCIATED_WITH"),
+        ("Cholesterol Level", "{} Cholesterol", "Cholesterol Level", "CORRELATED_WITH")
+    ]:
+        for value in df[column].unique():
+            add_node(node_id.format(value), node_type)
+        for disease in df["Disease"].unique():
+            disease_rows = df[df["Disease"] == disease]
+            add_links(disease, disease_rows[column].value_counts(), len(disease_rows), relationship, 0.3,
+                      node_id.format)
+    return kg
+
+
+def write_csv(path, rows, mode="w"):
+    with open(path, mode) as f:
+        if mode == "w":
+            f.write(",".join(COLUMNS) + "\n")
+        f.write("".join(row + "\n" for row in rows))
+
+
+def check_endpoints(kg):
+    node_ids = {node["id"] for node in kg["nodes"]}
+    for link in kg["links"]:
+        assert link["source"] in node_ids and link["target"] in node_ids, link
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_grouped_counts_match_masked_counts(seed):
+    df = make_dataset(5000, num_diseases=25, seed=seed)
+    counts = builder.count_features(df)
+    expected = masked_feature_counts(df)
+    assert counts["features"] == expected["features"]
+
+
+def test_graph_matches_baseline_builder(tmp_path):
+    kg = builder.create_knowledge_graph_from_csv(DATASET, str(tmp_path / "knowledge_graph.json"))
+    assert kg == baseline_graph(pd.read_csv(DATASET))
+
+
+@pytest.mark.parametrize("chunksize", [builder.CSV_CHUNK_SIZE, 777])
+def test_synthetic_graph_matches_baseline_builder(tmp_path, chunksize):
+    df = make_dataset(3000, num_diseases=30, seed=3)
+    # Few rows for some diseases, so that some values tie and some links fall under the thresholds
+    df = pd.concat([df, make_dataset(40, num_diseases=8, seed=4).replace(
+        {"Disease": {f"Disease {i}": f"Rare {i}" for i in range(8)}})], ignore_index=True)
+    csv_path = str(tmp_path / "dataset.csv")
+    df.to_csv(csv_path, index=False)
+
+    kg = builder.create_knowledge_graph_from_csv(csv_path, str(tmp_path / "knowledge_graph.json"), chunksize)
+    assert kg == baseline_graph(pd.read_csv(csv_path))
+
+
+def test_update_keeps_expert_diseases_and_links(tmp_path):
+    csv_path = str(tmp_path / "dataset.csv")
+    kg_path = str(tmp_path / "knowledge_graph.json")
+    write_csv(csv_path, ROWS)
+    builder.update_knowledge_graph_from_csvs([csv_path], kg_path, workers=1)
+
+    # Edits of /api/update-graph, folded into the graph file
+    store = GroundTruthStore(kg_path)
+    store.update_disease("Migraine", "add", [
+        {"target": "Fatigue", "relationship": "HAS_SYMPTOM", "weight": 0.7},
+        {"target": "Aura", "relationship": "HAS_SYMPTOM", "weight": 0.9}
+    ])
+    store.update_disease("Asthma", "modify", [
+        {"target": "Fever", "relationship": "HAS_SYMPTOM", "weight": 0.6}
+    ])
+    assert store.compact()
+    edited = store.get().kg
+
+    write_csv(csv_path, NEW_ROWS, mode="a")
+    kg = builder.update_knowledge_graph_from_csvs([csv_path], kg_path, workers=1)
+
+    node_ids = {node["id"] for node in kg["nodes"]}
+    assert {"Migraine", "Aura"} <= node_ids
+    custom_links = [link for link in edited["links"] if link.get("custom")]
+    assert len(custom_links) == 3
+    for link in custom_links:
+        assert link in kg["links"]
+
+    # The edit replaced the links of Asthma, whose counts did not change
+    assert [link for link in kg["links"] if link["source"] == "Asthma"] == [
+        {"source": "Asthma", "target": "Fever", "relationship": "HAS_SYMPTOM", "weight": 0.6, "custom": True}
+    ]
+    check_endpoints(kg)
+    with open(kg_path) as f:
+        assert json.load(f) == kg
+
+
+def test_custom_link_to_missing_node_is_dropped(tmp_path):
+    csv_path = str(tmp_path / "dataset.csv")
+    write_csv(csv_path, ROWS)
+    counts = builder.count_csv(csv_path)
+    previous = builder.create_knowledge_graph_from_counts(counts)
+    previous["links"] += [
+        {"source": "Asthma", "target": "Fatigue", "relationship": "HAS_SYMPTOM", "weight": 0.5, "custom": True},
+        {"source": "Asthma", "target": "Rash", "relationship": "HAS_SYMPTOM", "weight": 0.5, "custom": True}
+    ]
+
+    kg = builder.create_knowledge_graph_from_counts(counts, previous, set())
+    assert previous["links"][-2] in kg["links"]
+    assert previous["links"][-1] not in kg["links"]
+    check_endpoints(kg)
+
+
+@pytest.mark.parametrize("build", ["update_knowledge_graph_from_csvs", "create_knowledge_graph_from_csvs"])
+def test_build_waits_for_store_lock(tmp_path, build):
+    csv_path = str(tmp_path / "dataset.csv")
+    kg_path = str(tmp_path / "knowledge_graph.json")
+    write_csv(csv_path, ROWS)
+
+    lock = FileLock(kg_path + ".lock")
+    with lock:
+        thread = threading.Thread(target=getattr(builder, build), args=([csv_path], kg_path), kwargs={"workers": 1})
+        thread.start()
+        thread.join(0.5)
+        assert thread.is_alive()
+        assert not (tmp_path / "knowledge_graph.json").exists()
+    thread.join(10)
+    assert not thread.is_alive()
+    check_endpoints(GroundTruthStore(kg_path).get().kg)
+
+
+def test_rebuild_keeps_compacted_and_journaled_edits(tmp_path):
+    csv_path = str(tmp_path / "dataset.csv")
+    kg_path = str(tmp_path / "knowledge_graph.json")
+    write_csv(csv_path, ROWS)
+    builder.create_knowledge_graph_from_csvs([csv_path], kg_path, workers=1)
+
+    store = GroundTruthStore(kg_path)
+    store.update_disease("Migraine", "add", [{"target": "Aura", "relationship": "HAS_SYMPTOM"}])
+    with open(kg_path + ".journal") as f:
+        folded = f.read()
+    assert store.compact()
+    store.update_disease("Eczema", "add", [{"target": "Rash", "relationship": "HAS_SYMPTOM"}])
+
+    # A record left in the journal by a crash between the two steps of compact()
+    with open(kg_path + ".journal") as f:
+        journal = f.read()
+    with open(kg_path + ".journal", "w") as f:
+        f.write(folded + journal)
+
+    write_csv(csv_path, NEW_ROWS, mode="a")
+    builder.create_knowledge_graph_from_csvs([csv_path], kg_path, workers=1)
+    with open(kg_path + ".journal") as f:
+        assert f.read() == journal
+
+    for snapshot in [store.get(), GroundTruthStore(kg_path).get()]:
+        node_ids = [node["id"] for node in snapshot.kg["nodes"]]
+        assert node_ids.count("Migraine") == 1 and node_ids.count("Eczema") == 1
+        assert "Aura" in node_ids and "Rash" in node_ids
+        check_endpoints(snapshot.kg)
+        assert sum(1 for link in snapshot.kg["links"] if link["source"] == "Influenza") > 0
+
+
+def test_shards_counted_in_spawned_workers(tmp_path, capsys):
+    tasks = []
+    for i in range(2):
+        csv_path = str(tmp_path / f"shard_{i}.csv")
+        write_csv(csv_path, ROWS if i == 0 else NEW_ROWS)
+        tasks.append((csv_path,))
+
+    results = builder.map_shards(builder.count_csv_rows, tasks, workers=2,
+                                 context=multiprocessing.get_context("spawn"))
+    assert "counting in this process" not in capsys.readouterr().out
+    assert [result[0] for result in results] == [builder.count_csv_rows(*task)[0] for task in tasks]
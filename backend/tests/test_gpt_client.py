@@ -0,0 +1,147 @@
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from gpt_client import GPTClient, GPTResponseCache, JSONObjectScanner
+
+VALID_REPLY = '```json\n{"result": [{"predicted disease": "Asthma", "Cough": "Yes"}]}\n```'
+INVALID_REPLY = 'The patient probably has asthma.'
+
+
+class StubCompletions:
+    """Replacement of chat.completions that replies with the given texts and counts the calls."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def create(self, model, messages, stream=False):
+        content = self.replies[min(self.calls, len(self.replies) - 1)]
+        self.calls += 1
+        if stream:
+            return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + 7]))])
+                    for i in range(0, len(content), 7)]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def make_client(*replies):
+    completions = StubCompletions(replies)
+    client = GPTClient("key", cache=GPTResponseCache(), upstream=SimpleNamespace(
+        chat=SimpleNamespace(completions=completions)))
+    return client, completions
+
+
+@pytest.fixture
+def api_client(monkeypatch, tmp_path):
+    import api
+
+    monkeypatch.setattr(api, "ground_truth_store", api.GroundTruthStore(str(tmp_path / "kg.json")))
+    (tmp_path / "kg.json").write_text('{"nodes": [], "links": []}')
+
+    def client(*replies):
+        gpt_client, completions = make_client(*replies)
+        monkeypatch.setattr(api, "gpt_client", gpt_client)
+        return api.app.test_client(), completions
+    return client
+
+
+def test_complete_caches_valid_reply():
+    client, completions = make_client(VALID_REPLY)
+    validate = lambda content: content.startswith('```json')
+
+    assert client.complete("system", "prompt", validate) == VALID_REPLY
+    assert client.complete("system", "prompt", validate) == VALID_REPLY
+    assert completions.calls == 1
+
+
+def test_complete_does_not_cache_invalid_reply():
+    client, completions = make_client(INVALID_REPLY, VALID_REPLY)
+    validate = lambda content: content.startswith('```json')
+
+    assert client.complete("system", "prompt", validate) == INVALID_REPLY
+    assert client.cache.stats()['size'] == 0
+    assert client.complete("system", "prompt", validate) == VALID_REPLY
+    assert client.complete("system", "prompt", validate) == VALID_REPLY
+    assert completions.calls == 2
+
+
+def test_gpt_inference_retries_invalid_reply(api_client):
+    client, completions = api_client(INVALID_REPLY, VALID_REPLY)
+
+    response = client.post("/api/gpt-inference", json={"prompt": "cough and wheezing"})
+    assert response.status_code == 400
+
+    response = client.post("/api/gpt-inference", json={"prompt": "cough and wheezing"})
+    assert response.status_code == 200
+    assert response.get_json()["result"][0]["predicted disease"] == "Asthma"
+
+    response = client.post("/api/gpt-inference", json={"prompt": "cough and wheezing"})
+    assert response.status_code == 200
+    assert completions.calls == 2
+
+
+def read_events(response):
+    """Return the names of the server-sent events of a response."""
+    return [line[len("event: "):] for line in response.get_data(as_text=True).splitlines()
+            if line.startswith("event: ")]
+
+
+def test_stream_does_not_cache_reply_without_result(api_client):
+    client, completions = api_client(INVALID_REPLY, VALID_REPLY)
+
+    response = client.post("/api/gpt-inference?stream=1", json={"prompt": "cough and wheezing"})
+    assert read_events(response)[-1] == "error"
+
+    response = client.post("/api/gpt-inference?stream=1", json={"prompt": "cough and wheezing"})
+    assert read_events(response)[-1] == "result"
+
+    response = client.post("/api/gpt-inference?stream=1", json={"prompt": "cough and wheezing"})
+    assert read_events(response) == ["token", "result"]
+    assert completions.calls == 2
+
+
+def test_scanner_skips_objects_without_result():
+    scanner = JSONObjectScanner()
+    text = ('Example: {"format": {"result": "list"}} and {not json}\n'
+            '```json\n{"result": [{"predicted disease": "Asthma", "note": "} {"}]}\n```')
+    for i in range(0, len(text), 5):
+        scanner.feed(text[i:i + 5])
+    assert scanner.result == {"result": [{"predicted disease": "Asthma", "note": "} {"}]}
+
+
+def test_stream_skips_leading_object(api_client):
+    client, completions = api_client('Here is the format: {"example": true}\n' + VALID_REPLY)
+
+    response = client.post("/api/gpt-inference?stream=1", json={"prompt": "cough and wheezing"})
+    body = response.get_data(as_text=True)
+    assert read_events(response)[-1] == "result"
+    assert '"predicted disease": "Asthma"' in body.split("event: result")[1]
+
+
+def test_cache_file_is_written_in_batches(tmp_path):
+    path = str(tmp_path / "gpt_cache.json")
+    cache = GPTResponseCache(path=path, save_interval=3600)
+    for i in range(100):
+        cache.put(f"key {i}", f"reply {i}")
+    assert cache.stats()['saves'] == 0
+
+    cache.flush()
+    cache.flush()
+    assert cache.stats()['saves'] == 1
+    reloaded = GPTResponseCache(path=path)
+    assert reloaded.get("key 99") == "reply 99"
+    assert reloaded.stats()['size'] == 100
+
+    cache = GPTResponseCache(path=path, save_interval=0)
+    cache.put("key 100", "reply 100")
+    assert GPTResponseCache(path=path).get("key 100") == "reply 100"
+
+
+def test_client_does_not_import_graph_modules():
+    script = "import sys, gpt_client; print(sorted({'kg_store', 'xai', 'scipy'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,14 @@
+import zlib
+
+from incidence import MinHashLSHIndex
+
+
+def test_hash_values_match_exact_universal_hashes():
+    index = MinHashLSHIndex(num_perm=16, bands=4)
+    factors = ["Fever", "Cough", "Senior Age", "High Blood Pressure", "éruption"]
+    values = index._hash_values(factors)
+
+    p = MinHashLSHIndex.PRIME
+    for row, factor in enumerate(factors):
+        x = zlib.crc32(factor.encode('utf-8')) % p
+        assert values[row].tolist() == [(int(a) * x + int(b)) % p for a, b in zip(index._a, index._b)]
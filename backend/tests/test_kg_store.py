@@ -0,0 +1,167 @@
+import json
+import os
+
+import pytest
+
+from kg_store import GroundTruthStore
+
+MALFORMED_EDIT = {"disease": "Asthma", "action": "modify", "connections": ["Fever"]}
+
+
+def test_reload_applies_journaled_edit(kg_path):
+    store = GroundTruthStore(kg_path)
+    snapshot = store.update_disease("Asthma", "modify", [
+        {"target": "Wheezing", "relationship": "HAS_SYMPTOM", "weight": 0.6}
+    ])
+
+    reloaded = GroundTruthStore(kg_path).get()
+    assert reloaded.version == snapshot.version
+    assert reloaded.index.outgoing["Asthma"] == [
+        {"source": "Asthma", "target": "Wheezing", "relationship": "HAS_SYMPTOM", "weight": 0.6, "custom": True}
+    ]
+    assert reloaded.index.has_node("Wheezing", "Symptom")
+
+    # The JSON file is only rewritten by compact()
+    with open(kg_path) as f:
+        assert "Wheezing" not in f.read()
+    assert GroundTruthStore(kg_path).compact()
+    assert GroundTruthStore(kg_path).get().kg == reloaded.kg
+
+
+@pytest.mark.parametrize("connections", [
+    ["Fever"],
+    [{"target": "Fever"}],
+    [{"target": "Fever", "relationship": "HAS_SYMPTOM", "weight": "high"}],
+    {"target": "Fever", "relationship": "HAS_SYMPTOM"},
+    None
+])
+def test_malformed_edit_is_rejected_before_journaling(kg_path, connections):
+    store = GroundTruthStore(kg_path)
+    version = store.version
+
+    with pytest.raises(ValueError):
+        store.update_disease("Asthma", "modify", connections)
+
+    assert not os.path.exists(kg_path + ".journal")
+    assert store.version == version
+    assert GroundTruthStore(kg_path).get().index.outgoing["Asthma"][0]["target"] == "Cough"
+
+
+def test_malformed_journal_record_is_skipped(kg_path):
+    # Records journaled before the edits were checked
+    with open(kg_path + ".journal", "w") as f:
+        f.write(json.dumps(dict(MALFORMED_EDIT, version=1, op="update_disease")) + "\n")
+        f.write("not json\n")
+    with open(kg_path + ".version", "w") as f:
+        f.write("1")
+
+    store = GroundTruthStore(kg_path)
+    assert store.get().version == 1
+    assert store.get().index.outgoing["Asthma"][0]["target"] == "Cough"
+
+    store.update_disease("Asthma", "modify", [{"target": "Fever", "relationship": "HAS_SYMPTOM"}])
+    assert store.compact()
+    assert GroundTruthStore(kg_path).get().index.outgoing["Asthma"] == [
+        {"source": "Asthma", "target": "Fever", "relationship": "HAS_SYMPTOM", "weight": 0.5, "custom": True}
+    ]
+
+
+def test_update_graph_rejects_malformed_edit(kg_path, monkeypatch):
+    import api
+
+    monkeypatch.setattr(api, "ground_truth_store", GroundTruthStore(kg_path))
+    client = api.app.test_client()
+
+    response = client.post("/api/update-graph", json=MALFORMED_EDIT)
+    assert response.status_code == 400
+    assert not os.path.exists(kg_path + ".journal")
+
+    response = client.get("/api/diseases")
+    assert response.status_code == 200
+
+
+def test_update_graph_rejects_disease_named_like_another_node(kg_path, monkeypatch):
+    import api
+
+    monkeypatch.setattr(api, "ground_truth_store", GroundTruthStore(kg_path))
+    client = api.app.test_client()
+
+    response = client.post("/api/update-graph", json={"disease": "Fever", "action": "add", "connections": []})
+    assert response.status_code == 400
+    assert "Symptom" in response.get_json()["error"]
+    assert not api.ground_truth_store.get().index.has_node("Fever", "Disease")
+
+    response = client.post("/api/update-graph", json={"disease": "Fever", "action": "modify", "connections": []})
+    assert response.status_code == 404
+
+
+def disease_ids(snapshot):
+    return [node["id"] for node in snapshot.index.nodes_of_type("Disease") if node["id"].startswith("X")]
+
+
+def test_reader_between_compaction_steps_sees_later_edits(kg_path, monkeypatch):
+    import kg_store
+
+    writer, reader = GroundTruthStore(kg_path), GroundTruthStore(kg_path)
+    writer.update_disease("X1", "add", [])
+    writer.update_disease("X2", "add", [])
+    reader.get()
+
+    # The reader loads the compacted JSON file while the old journal is still in place
+    write = kg_store.atomic_write
+
+    def atomic_write(path, content):
+        write(path, content)
+        if path == kg_path:
+            assert disease_ids(reader.get()) == ["X1", "X2"]
+    monkeypatch.setattr(kg_store, "atomic_write", atomic_write)
+    assert writer.compact()
+    monkeypatch.setattr(kg_store, "atomic_write", write)
+
+    snapshot = writer.update_disease("X3", "add", [])
+    assert reader.get().version == snapshot.version
+    assert disease_ids(reader.get()) == ["X1", "X2", "X3"]
+
+    reader.update_disease("X4", "add", [])
+    assert reader.compact()
+    assert disease_ids(GroundTruthStore(kg_path).get()) == ["X1", "X2", "X3", "X4"]
+
+
+def test_edit_leaves_previous_snapshot_unchanged(kg_path):
+    store = GroundTruthStore(kg_path)
+    before = store.get()
+    nodes, links = list(before.kg["nodes"]), list(before.kg["links"])
+
+    after = store.update_disease("Influenza", "modify", [
+        {"target": "Cough", "relationship": "HAS_SYMPTOM", "weight": 0.3}
+    ])
+    store.update_disease("Migraine", "add", [{"target": "Aura", "relationship": "HAS_SYMPTOM"}])
+
+    assert list(before.kg["nodes"]) == nodes and list(before.kg["links"]) == links
+    assert [link["target"] for link in before.index.outgoing["Influenza"]] == ["Fever", "Senior Age"]
+    assert [link["source"] for link in before.index.incoming["Cough"]] == ["Asthma"]
+    assert not before.index.has_node("Migraine")
+
+    assert [link["target"] for link in after.index.outgoing["Influenza"]] == ["Cough"]
+    assert [link["source"] for link in after.index.incoming["Cough"]] == ["Asthma", "Influenza"]
+    assert after.index.incoming["Fever"] == []
+    assert len(after.kg["links"]) == 2
+    assert after.edit.removed_links == before.index.outgoing["Influenza"]
+    assert after.edit.added_links == after.index.outgoing["Influenza"]
+    assert list(store.get().index.ids_by_type["Disease"]) == ["Asthma", "Influenza", "Migraine"]
+
+
+def test_edit_after_failed_journaling(kg_path, monkeypatch):
+    store = GroundTruthStore(kg_path)
+
+    def fail(record):
+        raise OSError("disk full")
+    monkeypatch.setattr(store, "_append_record", fail)
+    with pytest.raises(OSError):
+        store.update_disease("Migraine", "add", [{"target": "Aura", "relationship": "HAS_SYMPTOM"}])
+    monkeypatch.undo()
+
+    snapshot = store.update_disease("Eczema", "add", [{"target": "Rash", "relationship": "HAS_SYMPTOM"}])
+    assert not snapshot.index.has_node("Migraine") and not snapshot.index.has_node("Aura")
+    assert [node["id"] for node in snapshot.kg["nodes"]][-2:] == ["Eczema", "Rash"]
+    assert GroundTruthStore(kg_path).get().kg == snapshot.kg
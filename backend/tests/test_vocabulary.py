@@ -0,0 +1,20 @@
+from kg_store import KGIndex
+from vocabulary import VocabularyIndex, estimate_tokens
+
+INFO = (
+    "Diseases: Asthma, Influenza, Eczema, Migraine\n"
+    "Symptoms: Fever, Cough, Fatigue, Difficulty Breathing, Headache\n"
+    "Age Groups: Child, Senior\n"
+)
+
+
+def test_tokens_saved_against_info_file():
+    kg_index = KGIndex({
+        "nodes": [{"id": "Bronchitis", "type": "Disease"}, {"id": "Wheezing", "type": "Symptom"}],
+        "links": [{"source": "Bronchitis", "target": "Wheezing", "relationship": "HAS_SYMPTOM"}]
+    })
+    selection = VocabularyIndex(INFO, kg_index).select("cough and fever", max_diseases=1, max_symptoms=2)
+
+    # The items only in the graph were never part of the prompt
+    assert selection['full_tokens'] == estimate_tokens(INFO)
+    assert selection['tokens_saved'] == estimate_tokens(INFO) - estimate_tokens(selection['text'])
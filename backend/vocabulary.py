@@ -0,0 +1,189 @@
+import math
+import re
+from collections import defaultdict
+
+# Sections of info.txt, in file order
+INFO_SECTIONS = ['Diseases', 'Symptoms', 'Age Groups', 'Gender', 'Blood Pressure', 'Cholesterol Level']
+
+# Sections that are filtered by relevance, the others are small and always sent in full
+FILTERED_SECTIONS = {'Diseases': 'Disease', 'Symptoms': 'Symptom'}
+
+
+def parse_info_sections(content):
+    """
+    Parse info.txt into its sections.
+
+    Returns:
+        Dictionary of section name -> list of items, in file order
+    """
+    sections = {}
+    current_section = None
+
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        if ':' in line and line.split(':', 1)[0].strip() in INFO_SECTIONS:
+            section_name, section_content = line.split(':', 1)
+            current_section = section_name.strip()
+            sections[current_section] = section_content.strip()
+        elif current_section:
+            sections[current_section] += line
+
+    return {name: [item.strip() for item in content.split(', ') if item.strip()]
+            for name, content in sections.items()}
+
+
+def format_info_sections(sections):
+    """Format sections back into the info.txt layout."""
+    return "".join(f"{name}: {', '.join(items)}\n" for name, items in sections.items())
+
+
+def estimate_tokens(text):
+    """Rough GPT token count of a text, about four characters per token."""
+    return (len(text) + 3) // 4
+
+
+def trigrams(text):
+    """Return the character trigrams of the words of a text, padded at word boundaries."""
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        padded = f" {word} "
+        terms.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return terms
+
+
+class VocabularyIndex:
+    """
+    BM25 index over the vocabulary sent to GPT: the diseases and symptoms of info.txt and of
+    the ground truth knowledge graph.
+
+    Documents are bags of character trigrams, which tolerates typos, plurals and the French
+    spelling of many medical terms. A disease document also contains the names of the factors
+    it is linked to in the graph, so a prompt describing symptoms ranks their diseases up.
+    """
+
+    def __init__(self, info_content, kg_index=None, k1=1.5, b=0.75):
+        """
+        Args:
+            info_content: Content of info.txt
+            kg_index: Optional KGIndex of the ground truth graph, to add its nodes and links
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+        """
+        self.sections = parse_info_sections(info_content)
+        self.k1 = k1
+        self.b = b
+
+        # Items of the filtered sections, with the info.txt items first
+        self.items = {}
+        for section, node_type in FILTERED_SECTIONS.items():
+            items = list(dict.fromkeys(self.sections.get(section, [])))
+            if kg_index is not None:
+                known = set(items)
+                items.extend(node_id for node_id in dict.fromkeys(kg_index.ids_by_type.get(node_type, []))
+                             if node_id not in known)
+            self.items[section] = items
+
+        # One document per item: (section, item, terms)
+        self.documents = []
+        for section, items in self.items.items():
+            for item in items:
+                text = item
+                if kg_index is not None and section == 'Diseases':
+                    factors = [link['target'] for link in kg_index.outgoing.get(item, [])
+                               if isinstance(link['target'], str)]
+                    text = " ".join([item, item] + factors)
+                self.documents.append((section, item, trigrams(text)))
+
+        # Inverted index: term -> [(document number, term frequency)]
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for number, (_, _, terms) in enumerate(self.documents):
+            counts = defaultdict(int)
+            for term in terms:
+                counts[term] += 1
+            for term, count in counts.items():
+                self.postings[term].append((number, count))
+            self.lengths.append(len(terms))
+
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        total = len(self.documents)
+        self.idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+        # The unfiltered prompt injected info.txt as it is, without the items of the graph
+        self.full_tokens = estimate_tokens(info_content)
+
+    def scores(self, query):
+        """Return the BM25 score of every matching document for a query, by document number."""
+        scores = defaultdict(float)
+        for term in set(trigrams(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for number, count in self.postings[term]:
+                norm = 1 - self.b + self.b * self.lengths[number] / self.average_length
+                scores[number] += idf * count * (self.k1 + 1) / (count + self.k1 * norm)
+        return scores
+
+    def full_text(self):
+        """The vocabulary text with every item, as sent without filtering."""
+        sections = dict(self.sections)
+        sections.update(self.items)
+        return format_info_sections(sections)
+
+    def select(self, query, max_diseases=20, max_symptoms=20, token_budget=None):
+        """
+        Build the vocabulary text for a prompt with only its most relevant items.
+
+        The best scoring diseases and symptoms are kept, up to the given counts and, if set, as
+        long as the text stays within the token budget. A section where nothing matches the
+        prompt is kept in full, as are the sections that are not filtered.
+
+        Args:
+            query: The user prompt
+            max_diseases: Maximum number of diseases kept
+            max_symptoms: Maximum number of symptoms kept
+            token_budget: Optional maximum estimated token count of the text
+
+        Returns:
+            Dictionary with the 'text' to inject, the 'selected' items by section, the estimated
+            'full_tokens' of info.txt as injected without filtering, 'tokens' of the filtered
+            text and 'tokens_saved'
+        """
+        limits = {'Diseases': max_diseases, 'Symptoms': max_symptoms}
+        ranked = {section: [] for section in self.items}
+        for number, score in sorted(self.scores(query).items(), key=lambda x: -x[1]):
+            section, item, _ = self.documents[number]
+            if len(ranked[section]) < limits[section]:
+                ranked[section].append(item)
+
+        for section, items in ranked.items():
+            if not items:
+                items.extend(self.items[section])
+
+        sections = dict(self.sections)
+        sections.update(ranked)
+        text = format_info_sections(sections)
+
+        # Drop the lowest ranked items of the longest section until the text fits the budget
+        while token_budget is not None and estimate_tokens(text) > token_budget:
+            longest = max(ranked, key=lambda section: len(ranked[section]))
+            if not ranked[longest]:
+                break
+            ranked[longest].pop()
+            sections.update(ranked)
+            text = format_info_sections(sections)
+
+        tokens = estimate_tokens(text)
+        return {
+            'text': text,
+            'selected': ranked,
+            'full_tokens': self.full_tokens,
+            'tokens': tokens,
+            'tokens_saved': max(0, self.full_tokens - tokens)
+        }
@@ -1,11 +1,371 @@
 import json
 import os
+import threading
 import pandas as pd
 import networkx as nx
 from collections import defaultdict
 import matplotlib.pyplot as plt
 import numpy as np
 from pathlib import Path
+from types import MappingProxyType
+from graph_core import CompactGraph
+from incidence import DiseaseFactorMatrix, MinHashLSHIndex
+
+# Key symptoms that should always be considered, even with lower weight
+KEY_SYMPTOMS = frozenset(["Fever", "Cough", "Fatigue", "Difficulty Breathing"])
+
+# Analysis stages in the order they run: the method computing each section and the sections
+# it reads. Visualization combines everything, so asking for it runs the whole analysis.
+ANALYSIS_STAGES = {
+    'structural_comparison': ('_structural_comparison', ()),
+    'semantic_comparison': ('_semantic_comparison', ()),
+    'reasoning_paths': ('_analyze_reasoning_paths', ()),
+    'counterfactuals': ('_generate_counterfactuals', ()),
+    'explanations': ('_generate_explanations', ('reasoning_paths', 'counterfactuals')),
+    'metrics': ('_calculate_metrics', ('reasoning_paths', 'semantic_comparison')),
+    'visualization_data': ('_prepare_visualization_data',
+                           ('structural_comparison', 'semantic_comparison', 'reasoning_paths',
+                            'counterfactuals', 'explanations', 'metrics')),
+}
+ANALYSIS_SECTIONS = tuple(ANALYSIS_STAGES)
+
+
+class DiseaseProfile:
+    """
+    Read-only summary of the factors linked to one disease in a graph.
+    
+    - factors: (target, relationship, weight) of each outgoing edge, in graph order
+    - by_relationship: relationship -> ((target, weight), ...), in graph order
+    - weights: target -> weight
+    - relationships: target -> relationship
+    - target_types: target -> node type
+    - novel: targets whose edge or node is marked is_novel
+    - key_symptoms: targets that are key symptoms
+    
+    The analysis stages look factors up here instead of scanning the disease's edges again.
+    """
+    
+    __slots__ = ('disease', 'factors', 'by_relationship', 'weights', 'relationships',
+                 'target_types', 'novel', 'key_symptoms')
+    
+    def __init__(self, graph, disease, default_weight=0):
+        """
+        Args:
+            graph: CompactGraph the disease belongs to
+            disease: Disease node id, a disease missing from the graph has no factors
+            default_weight: Weight of the edges without one
+        """
+        factors = []
+        by_relationship = {}
+        target_types = {}
+        novel = set()
+        
+        for target, relationship, weight, is_novel in graph.out_edges(disease):
+            if weight is None:
+                weight = default_weight
+            node = graph.node(target)
+            factors.append((target, relationship, weight))
+            by_relationship.setdefault(relationship, []).append((target, weight))
+            target_types[target] = node.type
+            if is_novel or node.is_novel:
+                novel.add(target)
+        
+        self.disease = disease
+        self.factors = tuple(factors)
+        self.by_relationship = MappingProxyType({rel: tuple(items) for rel, items in by_relationship.items()})
+        self.weights = MappingProxyType({target: weight for target, _, weight in factors})
+        self.relationships = MappingProxyType({target: relationship for target, relationship, _ in factors})
+        self.target_types = MappingProxyType(target_types)
+        self.novel = frozenset(novel)
+        self.key_symptoms = frozenset(target for target, _, _ in factors if target in KEY_SYMPTOMS)
+
+
+class DiseaseProfileCache:
+    """Builds the DiseaseProfile of a disease of a graph on first use and keeps it."""
+    
+    def __init__(self, graph):
+        """
+        Args:
+            graph: CompactGraph of the diseases
+        """
+        self.graph = graph
+        self._profiles = {}
+        self._lock = threading.Lock()
+    
+    def get(self, disease):
+        """Return the profile of a disease."""
+        profile = self._profiles.get(disease)
+        if profile is None:
+            with self._lock:
+                profile = self._profiles.get(disease)
+                if profile is None:
+                    profile = DiseaseProfile(self.graph, disease)
+                    self._profiles[disease] = profile
+        return profile
+    
+    def derive(self, graph, affected):
+        """
+        Return the cache of a graph derived from this one, keeping the profiles of the
+        diseases that are not affected by the edit.
+        
+        Args:
+            graph: CompactGraph of the edited graph
+            affected: Ids of the nodes whose links or linked nodes changed
+        """
+        cache = DiseaseProfileCache(graph)
+        with self._lock:
+            cache._profiles = {disease: profile for disease, profile in self._profiles.items()
+                               if disease not in affected}
+        return cache
+
+
+class GroundTruthIndex:
+    """
+    Read-only structures derived from one version of the ground truth knowledge graph.
+    
+    Everything the analysis of a prediction needs from the ground truth is built here once,
+    on first use, and then shared by all the predictions analyzed against this version:
+    
+    - graph: CompactGraph of the ground truth
+    - edges: edge index for matching prediction links (see KGExplainer.build_edge_index)
+    - profiles: DiseaseProfileCache of the diseases
+    - factors: DiseaseFactorMatrix for scoring alternative diagnoses
+    - lsh: MinHashLSHIndex for scoring them approximately
+    - structure: node and relationship type counts and the disease ids
+    - visualization_base: the ground truth half of the combined visualization graph
+    
+    The structures are built under a lock and never modified afterwards, so the index can be
+    used from any number of threads. The knowledge graph must not be modified either.
+    """
+    
+    def __init__(self, kg_json, lsh=None):
+        """
+        Args:
+            kg_json: Ground truth knowledge graph dictionary
+            lsh: Optional prebuilt MinHashLSHIndex of the graph
+        """
+        self.kg = kg_json
+        
+        self._graph = None
+        self._edges = None
+        self._profiles = None
+        self._factors = None
+        self._lsh = lsh
+        self._structure = None
+        self._visualization_base = None
+        self._lock = threading.RLock()
+    
+    def _build(self, name, build):
+        # Build an attribute once, the first thread to need it does it
+        value = getattr(self, name)
+        if value is None:
+            with self._lock:
+                value = getattr(self, name)
+                if value is None:
+                    value = build()
+                    setattr(self, name, value)
+        return value
+    
+    @property
+    def graph(self):
+        return self._build('_graph', lambda: CompactGraph(self.kg))
+    
+    @property
+    def edges(self):
+        return self._build('_edges', lambda: KGExplainer.build_edge_index(self.kg))
+    
+    @property
+    def profiles(self):
+        return self._build('_profiles', lambda: DiseaseProfileCache(self.graph))
+    
+    @property
+    def factors(self):
+        return self._build('_factors', lambda: DiseaseFactorMatrix(self.kg))
+    
+    @property
+    def lsh(self):
+        return self._build('_lsh', lambda: MinHashLSHIndex(self.kg))
+    
+    @property
+    def structure(self):
+        return self._build('_structure', self._build_structure)
+    
+    @property
+    def visualization_base(self):
+        return self._build('_visualization_base', self._build_visualization_base)
+    
+    def derive(self, kg_json, edit):
+        """
+        Return the index of a graph derived from this one by editing some diseases.
+        
+        The structures this index already built are patched for the edit instead of being
+        rebuilt from the whole graph, so the new index is as warm as this one. The others are
+        left to be built on first use.
+        
+        Args:
+            kg_json: The edited knowledge graph dictionary
+            edit: GraphEdit from this graph to the edited one
+        """
+        index = GroundTruthIndex(kg_json, lsh=self.derive_lsh(edit.factors))
+        
+        with self._lock:
+            if self._graph is not None:
+                index._graph = self._graph.with_edges(edit.nodes, edit.outgoing)
+                if self._profiles is not None:
+                    index._profiles = self._profiles.derive(index._graph, edit.affected)
+            if self._edges is not None:
+                index._edges = self._derive_edges(edit)
+            if self._factors is not None:
+                index._factors = self._factors.with_rows(edit.factors)
+            if self._structure is not None:
+                index._structure = self._derive_structure(edit)
+            if self._visualization_base is not None:
+                index._visualization_base = self._derive_visualization_base(kg_json, edit)
+        return index
+    
+    def derive_lsh(self, updates):
+        """
+        Return the LSH index of a graph derived from this one by editing some diseases.
+        
+        The index is updated from a copy of this one, or left to be built on first use if
+        this index never built it.
+        
+        Args:
+            updates: Dictionary of edited disease id -> {factor id: weight}
+        """
+        if self._lsh is None:
+            return None
+        lsh = self._lsh.copy()
+        for disease, factors in updates.items():
+            lsh.update(disease, factors)
+        return lsh
+    
+    def _build_structure(self):
+        node_types = {}
+        for node in self.kg['nodes']:
+            node_types[node['type']] = node_types.get(node['type'], 0) + 1
+        
+        relationship_types = {}
+        for link in self.kg['links']:
+            relationship_types[link['relationship']] = relationship_types.get(link['relationship'], 0) + 1
+        
+        return {
+            'node_types': node_types,
+            'relationship_types': relationship_types,
+            'disease_ids': {node['id'] for node in self.kg['nodes'] if node['type'] == 'Disease'}
+        }
+    
+    def _derive_edges(self, edit):
+        # Replace the keys of the edited diseases, the first link of a key gives its weight
+        def key(link):
+            source = link['source'] if isinstance(link['source'], str) else link['source']['id']
+            target = link['target'] if isinstance(link['target'], str) else link['target']['id']
+            return source, target, link['relationship']
+        
+        edges = dict(self._edges)
+        for link in edit.removed_links:
+            edges.pop(key(link), None)
+        for links in edit.outgoing.values():
+            for link in links:
+                edges.setdefault(key(link), link.get('weight', 0))
+        return edges
+    
+    def _derive_structure(self, edit):
+        node_types = dict(self._structure['node_types'])
+        disease_ids = set(self._structure['disease_ids'])
+        for node in edit.nodes:
+            node_types[node['type']] = node_types.get(node['type'], 0) + 1
+            if node['type'] == 'Disease':
+                disease_ids.add(node['id'])
+        
+        relationship_types = dict(self._structure['relationship_types'])
+        for link in edit.removed_links:
+            relationship_types[link['relationship']] -= 1
+            if relationship_types[link['relationship']] == 0:
+                del relationship_types[link['relationship']]
+        for link in edit.added_links:
+            relationship_types[link['relationship']] = relationship_types.get(link['relationship'], 0) + 1
+        
+        return {
+            'node_types': node_types,
+            'relationship_types': relationship_types,
+            'disease_ids': disease_ids
+        }
+    
+    def _derive_visualization_base(self, kg_json, edit):
+        base = self._visualization_base
+        if base['all_links'] is not None:
+            # New nodes may resolve dangling links, build it again on first use
+            return None
+        
+        nodes = list(base['nodes'])
+        positions = dict(base['positions'])
+        for node in edit.nodes:
+            node_copy = node.copy()
+            node_copy['source'] = 'ground_truth'
+            nodes.append(node_copy)
+            positions[node['id']] = len(nodes) - 1
+        
+        # Without dangling links, the base links are the copies of the graph links in order,
+        # and a modified disease lost all its previous links
+        removed = {link['source'] if isinstance(link['source'], str) else link['source']['id']
+                   for link in edit.removed_links}
+        if removed:
+            links = [link for link in base['links'] if link['source'] not in removed]
+        else:
+            links = list(base['links'])
+        
+        for link in edit.added_links:
+            link_copy = link.copy()
+            link_copy['source_graph'] = 'ground_truth'
+            link_copy['source'] = link['source'] if isinstance(link['source'], str) else link['source']['id']
+            link_copy['target'] = link['target'] if isinstance(link['target'], str) else link['target']['id']
+            if link_copy['source'] not in positions or link_copy['target'] not in positions:
+                return None
+            links.append(link_copy)
+        
+        if len(links) != len(kg_json['links']):
+            return None
+        
+        return {
+            'nodes': nodes,
+            'positions': positions,
+            'links': links,
+            'all_links': None
+        }
+    
+    def _build_visualization_base(self):
+        # Copies of the ground truth nodes and links as they appear in the combined graph
+        nodes = []
+        positions = {}
+        for node in self.kg['nodes']:
+            node_copy = node.copy()
+            node_copy['source'] = 'ground_truth'
+            nodes.append(node_copy)
+            positions[node['id']] = len(nodes) - 1
+        
+        # Links whose endpoints are not ground truth nodes are only shown when the prediction
+        # has them, they are kept aside with their endpoints
+        links = []
+        dangling = False
+        for link in self.kg['links']:
+            link_copy = link.copy()
+            link_copy['source_graph'] = 'ground_truth'
+            source_id = link['source'] if isinstance(link['source'], str) else link['source']['id']
+            target_id = link['target'] if isinstance(link['target'], str) else link['target']['id']
+            link_copy['source'] = source_id
+            link_copy['target'] = target_id
+            resolved = source_id in positions and target_id in positions
+            dangling = dangling or not resolved
+            links.append((link_copy, resolved))
+        
+        return {
+            'nodes': nodes,
+            'positions': positions,
+            'links': [link for link, resolved in links if resolved],
+            'all_links': links if dangling else None
+        }
+
 
 class KGExplainer:
     """
@@ -13,23 +373,58 @@ class KGExplainer:
     and identifying reasoning errors, providing explanations, and generating visualization data.
     """
     
-    def __init__(self, ground_truth_path, prediction_kg_path):
+    def __init__(self, ground_truth_path=None, prediction_kg_path=None,
+                 ground_truth_kg=None, prediction_kg=None, ground_truth_index=None,
+                 counterfactual_top_k=3, similarity_metric='jaccard',
+                 approximate_counterfactuals=False, prediction_graph=None, predicted_disease=None):
         """
-        Initialize the KG Explainer with paths to both knowledge graphs.
+        Initialize the KG Explainer with both knowledge graphs.
+        
+        Each graph can be given either as a path to its JSON file or as an already loaded
+        dictionary. Passing dictionaries avoids any disk access, which is what the API does.
         
         Args:
             ground_truth_path: Path to the ground truth knowledge graph JSON
             prediction_kg_path: Path to the prediction-based knowledge graph JSON
+            ground_truth_kg: Ground truth knowledge graph dictionary (instead of the path)
+            prediction_kg: Prediction-based knowledge graph dictionary (instead of the path)
+            ground_truth_index: GroundTruthIndex of the ground truth (instead of the path or
+                dictionary), shared between instances so only the prediction is processed
+            counterfactual_top_k: Number of alternative diagnoses of the counterfactuals
+            similarity_metric: Similarity of the alternative diagnoses, 'jaccard',
+                'weighted_jaccard' or 'cosine'
+            approximate_counterfactuals: Only score the diseases the LSH index finds likely
+                to be similar, instead of every disease
+            prediction_graph: CompactGraph of the prediction, when it was already built
+            predicted_disease: Disease of the prediction to analyze, the first Disease node
+                when not given
         """
         self.ground_truth_path = ground_truth_path
         self.prediction_kg_path = prediction_kg_path
+        self.ground_truth_kg = ground_truth_index.kg if ground_truth_index is not None else ground_truth_kg
+        self.prediction_kg = prediction_kg
+        self.predicted_disease = predicted_disease
         
         # Load the knowledge graphs
         self.load_knowledge_graphs()
         
-        # Convert to NetworkX graphs for analysis
-        self.ground_truth_nx = self.to_networkx(self.ground_truth_kg)
-        self.prediction_nx = self.to_networkx(self.prediction_kg)
+        # Everything derived from the ground truth is built once per graph by the index
+        if ground_truth_index is None:
+            ground_truth_index = GroundTruthIndex(self.ground_truth_kg)
+        self.ground_truth = ground_truth_index
+        
+        # Convert the prediction to a compact graph for analysis
+        if prediction_graph is None:
+            prediction_graph = CompactGraph(self.prediction_kg)
+        self.prediction_graph = prediction_graph
+        
+        # Factor profiles of the predicted disease in both graphs, shared by every stage
+        self.ground_truth_profile = self.ground_truth.profiles.get(self.predicted_disease)
+        self.prediction_profile = DiseaseProfile(self.prediction_graph, self.predicted_disease, default_weight=1.0)
+        
+        self.counterfactual_top_k = counterfactual_top_k
+        self.similarity_metric = similarity_metric
+        self.approximate_counterfactuals = approximate_counterfactuals
         
         # Results storage
         self.analysis_results = {
@@ -41,37 +436,82 @@ class KGExplainer:
             "metrics": {},
             "visualization_data": {}
         }
+        
+        # Sections already computed by analyze(), which are never computed twice
+        self.completed_sections = set()
+    
+    @classmethod
+    def from_graphs(cls, ground_truth_kg, prediction_kg, **options):
+        """
+        Create an explainer from in-memory knowledge graphs, without touching the disk.
+        
+        Args:
+            ground_truth_kg: Ground truth knowledge graph dictionary
+            prediction_kg: Prediction-based knowledge graph dictionary
+            **options: counterfactual_top_k, similarity_metric and approximate_counterfactuals
+        
+        Returns:
+            A KGExplainer instance
+        """
+        return cls(ground_truth_kg=ground_truth_kg, prediction_kg=prediction_kg, **options)
+    
+    @classmethod
+    def from_index(cls, ground_truth_index, prediction_kg, **options):
+        """
+        Create an explainer for a prediction against a prebuilt ground truth index.
+        
+        The setup only processes the prediction graph, whatever the size of the ground truth.
+        
+        Args:
+            ground_truth_index: GroundTruthIndex of the ground truth
+            prediction_kg: Prediction-based knowledge graph dictionary
+            **options: counterfactual_top_k, similarity_metric and approximate_counterfactuals
+        
+        Returns:
+            A KGExplainer instance
+        """
+        return cls(ground_truth_index=ground_truth_index, prediction_kg=prediction_kg, **options)
     
     def load_knowledge_graphs(self):
-        """Load both knowledge graphs from their respective JSON files."""
+        """Load the knowledge graphs that were not given as dictionaries from their JSON files."""
         try:
-            with open(self.ground_truth_path, 'r') as f:
-                self.ground_truth_kg = json.load(f)
+            if self.ground_truth_kg is None:
+                if self.ground_truth_path is None:
+                    raise ValueError("Either ground_truth_path or ground_truth_kg is required")
+                with open(self.ground_truth_path, 'r') as f:
+                    self.ground_truth_kg = json.load(f)
             
-            with open(self.prediction_kg_path, 'r') as f:
-                self.prediction_kg = json.load(f)
+            if self.prediction_kg is None:
+                if self.prediction_kg_path is None:
+                    raise ValueError("Either prediction_kg_path or prediction_kg is required")
+                with open(self.prediction_kg_path, 'r') as f:
+                    self.prediction_kg = json.load(f)
             
             print(f"Successfully loaded both knowledge graphs.")
             print(f"Ground truth KG: {len(self.ground_truth_kg['nodes'])} nodes, {len(self.ground_truth_kg['links'])} links")
             print(f"Prediction KG: {len(self.prediction_kg['nodes'])} nodes, {len(self.prediction_kg['links'])} links")
             
             # Extract predicted disease
-            self.predicted_disease = self._get_predicted_disease()
+            self.predicted_diseases = self._get_predicted_diseases()
+            if self.predicted_disease is None:
+                self.predicted_disease = self.predicted_diseases[0] if self.predicted_diseases else None
             print(f"Predicted disease: {self.predicted_disease}")
             
         except Exception as e:
             print(f"Error loading knowledge graphs: {e}")
             raise
     
-    def _get_predicted_disease(self):
-        """Extract the predicted disease from the prediction KG."""
+    def _get_predicted_diseases(self):
+        """Extract every candidate disease from the prediction KG, in graph order."""
+        diseases = []
         for node in self.prediction_kg['nodes']:
-            if node['type'] == 'Disease':
-                return node['id']
-        return None
+            if node['type'] == 'Disease' and node['id'] not in diseases:
+                diseases.append(node['id'])
+        return diseases
     
-    def to_networkx(self, kg_json):
-        """Convert the JSON KG to a NetworkX graph for analysis."""
+    @staticmethod
+    def to_networkx(kg_json):
+        """Convert the JSON KG to a NetworkX graph, e.g. for plotting (the analysis uses CompactGraph)."""
         G = nx.DiGraph()
         
         # Add nodes with attributes
@@ -95,32 +535,112 @@ class KGExplainer:
         
         return G
     
-    def analyze(self):
+    @staticmethod
+    def build_edge_index(kg_json):
         """
-        Perform comprehensive analysis comparing the two knowledge graphs.
+        Index the links of a JSON KG by (source, target, relationship).
+        
+        Returns:
+            Dictionary of (source id, target id, relationship) -> weight of the first such link
         """
-        # 1. Structural comparison
-        self._structural_comparison()
+        edges = {}
+        for link in kg_json['links']:
+            source = link['source'] if isinstance(link['source'], str) else link['source']['id']
+            target = link['target'] if isinstance(link['target'], str) else link['target']['id']
+            edges.setdefault((source, target, link['relationship']), link.get('weight', 0))
+        return edges
+    
+    def analyze(self, sections=None):
+        """
+        Perform comprehensive analysis comparing the two knowledge graphs.
         
-        # 2. Semantic comparison for the specific disease
-        self._semantic_comparison()
+        Only the requested sections and the sections they depend on are computed, and the
+        sections computed by an earlier call are reused, so asking for more sections later
+        only runs the stages still missing.
         
-        # 3. Analyze reasoning paths
-        self._analyze_reasoning_paths()
+        Args:
+            sections: Names of the sections to compute (see ANALYSIS_SECTIONS), all of them
+                when None
         
-        # 4. Generate counterfactual explanations
-        self._generate_counterfactuals()
+        Returns:
+            The analysis results, in which the sections that were not computed are empty
+        """
+        if sections is None:
+            sections = ANALYSIS_SECTIONS
+        
+        # Resolve the dependencies of the requested sections
+        required = set()
+        pending = list(sections)
+        while pending:
+            section = pending.pop()
+            if section not in ANALYSIS_STAGES:
+                raise ValueError(f"Unknown analysis section '{section}'")
+            if section not in required:
+                required.add(section)
+                pending.extend(ANALYSIS_STAGES[section][1])
+        
+        # Run the missing stages in order, so dependencies always come first
+        for section, (method, _) in ANALYSIS_STAGES.items():
+            if section in required and section not in self.completed_sections:
+                getattr(self, method)()
+                self.completed_sections.add(section)
         
-        # 5. Create clinical explanations
-        self._generate_explanations()
+        return self.analysis_results
+    
+    def analyze_candidates(self, sections=('metrics', 'explanations', 'counterfactuals')):
+        """
+        Analyze every candidate disease of the prediction and rank them.
         
-        # 6. Calculate metrics
-        self._calculate_metrics()
+        A prediction with several Disease nodes, such as a differential diagnosis, is analyzed
+        in one pass. Each candidate gets an explainer sharing this one's ground truth index,
+        prediction graph and options, so only what is specific to the candidate is computed.
+        The structural comparison and the combined graph do not depend on the candidate and
+        are computed once.
         
-        # 7. Prepare visualization data
-        self._prepare_visualization_data()
+        Args:
+            sections: Sections computed for each candidate. The metrics are always computed
+                since they rank the candidates; structural_comparison and visualization_data
+                are not per-candidate sections and are left out.
+        
+        Returns:
+            Dictionary with
+            - candidates: for each candidate, its disease, rank, rank in the prediction,
+              confidence score, reliability and sections, the most confident first
+            - structural_comparison: comparison of the whole prediction with the ground truth
+            - combined_graph: nodes and links of both graphs, as in the visualization data
+        """
+        sections = [section for section in sections
+                    if section not in ('structural_comparison', 'visualization_data')]
+        
+        candidates = []
+        for position, disease in enumerate(self.predicted_diseases):
+            explainer = KGExplainer(prediction_kg=self.prediction_kg,
+                                    ground_truth_index=self.ground_truth,
+                                    prediction_graph=self.prediction_graph,
+                                    predicted_disease=disease,
+                                    counterfactual_top_k=self.counterfactual_top_k,
+                                    similarity_metric=self.similarity_metric,
+                                    approximate_counterfactuals=self.approximate_counterfactuals)
+            results = explainer.analyze(sections + ['metrics'])
+            candidates.append({
+                'disease': disease,
+                'predicted_rank': position + 1,
+                'confidence_score': results['metrics'].get('confidence_score', 0),
+                'reliability': results['metrics'].get('reliability', 'UNKNOWN'),
+                'sections': {section: results[section] for section in sections}
+            })
         
-        return self.analysis_results
+        # Most confident first, candidates with the same score keep the predicted order
+        candidates.sort(key=lambda candidate: -candidate['confidence_score'])
+        for rank, candidate in enumerate(candidates, 1):
+            candidate['rank'] = rank
+        
+        self.analyze(['structural_comparison'])
+        return {
+            'candidates': candidates,
+            'structural_comparison': self.analysis_results['structural_comparison'],
+            'combined_graph': self._build_combined_graph()
+        }
     
 
     def _generate_counterfactuals(self):
@@ -132,63 +652,40 @@ class KGExplainer:
             self.analysis_results['counterfactuals'] = results
             return
         
-        # Find most similar diseases based on shared factors
-        disease_similarity = {}
+        # Get all factors connected to the predicted disease, with their weights
         predicted_factors = set()
-        
-        # Get all factors connected to the predicted disease
-        for _, target, _ in self.prediction_nx.out_edges(self.predicted_disease, data=True):
+        for target, _, _ in self.prediction_profile.factors:
             predicted_factors.add(target)
-        
-        # Compare with other diseases in ground truth
-        for node in self.ground_truth_kg['nodes']:
-            if node['type'] == 'Disease' and node['id'] != self.predicted_disease:
-                disease_id = node['id']
-                disease_factors = set()
-                
-                for _, target, _ in self.ground_truth_nx.out_edges(disease_id, data=True):
-                    disease_factors.add(target)
-                
-                # Calculate Jaccard similarity
-                shared_factors = predicted_factors.intersection(disease_factors)
-                combined_factors = predicted_factors.union(disease_factors)
-                
-                if combined_factors:
-                    similarity = len(shared_factors) / len(combined_factors)
-                    
-                    # Factors that would need to change
-                    factors_to_add = disease_factors - predicted_factors
-                    factors_to_remove = predicted_factors - disease_factors
-                    
-                    disease_similarity[disease_id] = {
-                        'similarity': similarity,
-                        'shared_factors': list(shared_factors),
-                        'factors_to_add': list(factors_to_add),
-                        'factors_to_remove': list(factors_to_remove)
-                    }
-        
-        # Find the top 3 most similar alternative diseases
-        top_alternatives = sorted(
-            disease_similarity.items(),
-            key=lambda x: x[1]['similarity'],
-            reverse=True
-        )[:3]
+        predicted_weights = dict(self.prediction_profile.weights)
+        
+        # Score every other disease of the ground truth at once and keep the most similar,
+        # or in approximate mode only the candidates of the LSH index
+        if self.approximate_counterfactuals:
+            top_alternatives = self.ground_truth.lsh.top_k(
+                predicted_weights, self.counterfactual_top_k, self.similarity_metric,
+                exclude=[self.predicted_disease]
+            )
+        else:
+            similarities, defined = self.ground_truth.factors.similarities(predicted_weights, self.similarity_metric)
+            top_alternatives = self.ground_truth.factors.top_k(
+                similarities, defined, self.counterfactual_top_k, exclude=[self.predicted_disease]
+            )
         
         counterfactuals = []
-        for disease_id, data in top_alternatives:
+        for disease_id, similarity in top_alternatives:
             # Generate a counterfactual explanation
             changes_needed = []
             
-            for factor in data['factors_to_add']:
+            # Factors that would need to change
+            profile = self.ground_truth.profiles.get(disease_id)
+            disease_factors = {target for target, _, _ in profile.factors}
+            factors_to_add = disease_factors - predicted_factors
+            factors_to_remove = predicted_factors - disease_factors
+            
+            for factor in factors_to_add:
                 # Get the factor type from ground truth
-                factor_type = None
-                relationship = None
-                
-                for _, target, edge_data in self.ground_truth_nx.out_edges(disease_id, data=True):
-                    if target == factor:
-                        factor_type = self.ground_truth_nx.nodes[target].get('type', '')
-                        relationship = edge_data['relationship']
-                        break
+                factor_type = profile.target_types.get(factor)
+                relationship = profile.relationships.get(factor)
                 
                 if factor_type and relationship:
                     changes_needed.append({
@@ -198,16 +695,10 @@ class KGExplainer:
                         'relationship': relationship
                     })
             
-            for factor in data['factors_to_remove']:
+            for factor in factors_to_remove:
                 # Get the factor type from prediction
-                factor_type = None
-                relationship = None
-                
-                for _, target, edge_data in self.prediction_nx.out_edges(self.predicted_disease, data=True):
-                    if target == factor:
-                        factor_type = self.prediction_nx.nodes[target].get('type', '')
-                        relationship = edge_data['relationship']
-                        break
+                factor_type = self.prediction_profile.target_types.get(factor)
+                relationship = self.prediction_profile.relationships.get(factor)
                 
                 if factor_type and relationship:
                     changes_needed.append({
@@ -219,7 +710,7 @@ class KGExplainer:
             
             counterfactuals.append({
                 'alternative_disease': disease_id,
-                'similarity': data['similarity'],
+                'similarity': similarity,
                 'changes_needed': changes_needed
             })
         
@@ -266,29 +757,24 @@ class KGExplainer:
         """Compare the structural elements of both graphs."""
         results = {}
         
-        # Node type comparison
-        gt_node_types = defaultdict(int)
+        # Node type comparison, the ground truth counts are computed once by the index
+        structure = self.ground_truth.structure
+        gt_node_types = structure['node_types']
         pred_node_types = defaultdict(int)
         
-        for node in self.ground_truth_kg['nodes']:
-            gt_node_types[node['type']] += 1
-        
         for node in self.prediction_kg['nodes']:
             pred_node_types[node['type']] += 1
         
         # Find shared disease nodes
-        gt_disease_nodes = {node['id'] for node in self.ground_truth_kg['nodes'] if node['type'] == 'Disease'}
+        gt_disease_nodes = structure['disease_ids']
         pred_disease_nodes = {node['id'] for node in self.prediction_kg['nodes'] if node['type'] == 'Disease'}
         
         shared_diseases = gt_disease_nodes.intersection(pred_disease_nodes)
         
         # Relationship type comparison
-        gt_rel_types = defaultdict(int)
+        gt_rel_types = structure['relationship_types']
         pred_rel_types = defaultdict(int)
         
-        for link in self.ground_truth_kg['links']:
-            gt_rel_types[link['relationship']] += 1
-        
         for link in self.prediction_kg['links']:
             pred_rel_types[link['relationship']] += 1
         
@@ -316,7 +802,7 @@ class KGExplainer:
             return
         
         # Check if the predicted disease exists in ground truth
-        if not self.ground_truth_nx.has_node(self.predicted_disease):
+        if not self.ground_truth.graph.has_node(self.predicted_disease):
             results['disease_match'] = False
             results['explanation'] = f"The predicted disease '{self.predicted_disease}' does not exist in the ground truth knowledge graph."
             self.analysis_results['semantic_comparison'] = results
@@ -326,32 +812,23 @@ class KGExplainer:
         
         # Compare outgoing links (disease -> factor relationships)
         gt_links = {}
-        for _, target, data in self.ground_truth_nx.out_edges(self.predicted_disease, data=True):
-            rel_type = data['relationship']
-            if rel_type not in gt_links:
-                gt_links[rel_type] = []
-            gt_links[rel_type].append({
-                'target': target,
-                'weight': data['weight']
-            })
+        for rel_type, items in self.ground_truth_profile.by_relationship.items():
+            gt_links[rel_type] = [{'target': target, 'weight': weight} for target, weight in items]
         
         pred_links = {}
         # Track novel factors
         novel_factors = []
         
-        for _, target, data in self.prediction_nx.out_edges(self.predicted_disease, data=True):
-            rel_type = data['relationship']
+        for target, rel_type, weight in self.prediction_profile.factors:
             if rel_type not in pred_links:
                 pred_links[rel_type] = []
             
             # Check if this is a novel factor (not in ground truth)
-            is_novel = data.get('is_novel', False)
-            if is_novel or (self.prediction_nx.nodes[target].get('is_novel', False)):
-                is_novel = True
+            is_novel = target in self.prediction_profile.novel
                 
             pred_links[rel_type].append({
                 'target': target,
-                'weight': data['weight'],
+                'weight': weight,
                 'is_novel': is_novel
             })
             
@@ -360,7 +837,7 @@ class KGExplainer:
                 novel_factors.append({
                     'factor': target,
                     'relationship': rel_type,
-                    'factor_type': self.prediction_nx.nodes[target].get('type', '')
+                    'factor_type': self.prediction_profile.target_types[target]
                 })
         
         # Compare by relationship type
@@ -419,19 +896,19 @@ class KGExplainer:
         prediction_factors = {}
         novel_symptoms = []
         
-        for _, target, data in self.prediction_nx.out_edges(self.predicted_disease, data=True):
-            factor_type = self.prediction_nx.nodes[target].get('type', '')
+        for target, relationship, weight in self.prediction_profile.factors:
+            factor_type = self.prediction_profile.target_types[target]
             
             # Check if this is a novel factor
-            is_novel = data.get('is_novel', False) or self.prediction_nx.nodes[target].get('is_novel', False)
+            is_novel = target in self.prediction_profile.novel
             
             if factor_type not in prediction_factors:
                 prediction_factors[factor_type] = []
             
             factor_info = {
                 'factor': target,
-                'relationship': data['relationship'],
-                'weight': data.get('weight', 1.0),
+                'relationship': relationship,
+                'weight': weight,
                 'is_novel': is_novel
             }
             
@@ -481,30 +958,22 @@ class KGExplainer:
                 evidence = ""
                 
                 # Special handling for DOES_NOT_HAVE_SYMPTOM relationships
+                gt_relationship = self.ground_truth_profile.relationships.get(factor)
+                gt_weight = self.ground_truth_profile.weights.get(factor, 0)
                 if relationship == "DOES_NOT_HAVE_SYMPTOM":
-                    has_symptom_in_gt = False
-                    for _, gt_target, gt_data in self.ground_truth_nx.out_edges(self.predicted_disease, data=True):
-                        if gt_target == factor and gt_data['relationship'] == "HAS_SYMPTOM":
-                            has_symptom_in_gt = True
-                            gt_weight = gt_data.get('weight', 0)
-                            if gt_weight > 0.5:
-                                is_valid = False
-                                evidence = f"Invalid absence - symptom is common in ground truth (weight: {gt_weight:.2f})"
-                            else:
-                                is_valid = True
-                                evidence = f"Valid absence - symptom is uncommon in ground truth (weight: {gt_weight:.2f})"
-                            break
-                    
-                    if not has_symptom_in_gt:
+                    if gt_relationship == "HAS_SYMPTOM":
+                        if gt_weight > 0.5:
+                            is_valid = False
+                            evidence = f"Invalid absence - symptom is common in ground truth (weight: {gt_weight:.2f})"
+                        else:
+                            is_valid = True
+                            evidence = f"Valid absence - symptom is uncommon in ground truth (weight: {gt_weight:.2f})"
+                    else:
                         is_valid = True
                         evidence = "Valid absence - this symptom is not strongly associated with the disease in ground truth"
-                else:
-                    for _, gt_target, gt_data in self.ground_truth_nx.out_edges(self.predicted_disease, data=True):
-                        if gt_target == factor and gt_data['relationship'] == relationship:
-                            is_valid = True
-                            gt_weight = gt_data.get('weight', 0)
-                            evidence = f"Connection confirmed with weight {gt_weight:.2f}"
-                            break
+                elif gt_relationship == relationship:
+                    is_valid = True
+                    evidence = f"Connection confirmed with weight {gt_weight:.2f}"
                 
                 reasoning_item = {
                     'factor_type': factor_type,
@@ -526,48 +995,40 @@ class KGExplainer:
         # Find potentially missing important factors
  # Find potentially missing important factors
         missing_factors = []
-        if self.ground_truth_nx.has_node(self.predicted_disease):
-            # Define key symptoms that should always be considered, even with lower weight
-            key_symptoms = set(["Fever", "Cough", "Fatigue", "Difficulty Breathing"])
-            
-            for _, target, data in self.ground_truth_nx.out_edges(self.predicted_disease, data=True):
-                # Get target type and weight
-                target_type = self.ground_truth_nx.nodes[target].get('type', '')
-                weight = data.get('weight', 0)
-                relationship = data.get('relationship', '')
+        if self.ground_truth.graph.has_node(self.predicted_disease):
+            for target, relationship, weight in self.ground_truth_profile.factors:
+                # Get target type and key symptom flag
+                target_type = self.ground_truth_profile.target_types[target]
+                is_key_symptom = target in self.ground_truth_profile.key_symptoms
                 
                 # Modified: Check if this factor should be considered as important
                 # Now includes ALL factors with weight > 0.4, regardless of type or relationship
                 is_important = (
                     (weight > 0.4) or  # Any factor with significant weight
-                    (target_type == "Symptom" and target in key_symptoms and weight > 0.4)  # threshold for key symptoms
+                    (target_type == "Symptom" and is_key_symptom and weight > 0.4)  # threshold for key symptoms
                 )
                 
                 if is_important:
-                    # Check if this factor is missing in prediction
-                    factor_found = False
-                    for _, pred_target, pred_data in self.prediction_nx.out_edges(self.predicted_disease, data=True):
-                        # Check if target is found with any relationship
-                        if pred_target == target:
-                            factor_found = True
-                            
-                            # If relationships don't match and both are significant, flag as issue
-                            if pred_data['relationship'] != relationship and weight > 0.5:
-                                # Create a unique key for this factor+relationship
-                                factor_key = f"{target}:{pred_data['relationship']}"
-                                
-                                # Only add if we haven't processed it already
-                                if factor_key not in processed_factors:
-                                    processed_factors.add(factor_key)
-                                    invalid_reasoning.append({
-                                        'factor_type': target_type,
-                                        'factor': target,
-                                        'relationship': pred_data['relationship'],
-                                        'expected_relationship': relationship,
-                                        'is_valid': False,
-                                        'evidence': f"Wrong relationship: factor has {pred_data['relationship']} but should have {relationship} (weight: {weight:.2f})"
-                                    })
-                            break
+                    # Check if this factor is missing in prediction, with any relationship
+                    pred_relationship = self.prediction_profile.relationships.get(target)
+                    factor_found = pred_relationship is not None
+                    
+                    # If relationships don't match and both are significant, flag as issue
+                    if factor_found and pred_relationship != relationship and weight > 0.5:
+                        # Create a unique key for this factor+relationship
+                        factor_key = f"{target}:{pred_relationship}"
+                        
+                        # Only add if we haven't processed it already
+                        if factor_key not in processed_factors:
+                            processed_factors.add(factor_key)
+                            invalid_reasoning.append({
+                                'factor_type': target_type,
+                                'factor': target,
+                                'relationship': pred_relationship,
+                                'expected_relationship': relationship,
+                                'is_valid': False,
+                                'evidence': f"Wrong relationship: factor has {pred_relationship} but should have {relationship} (weight: {weight:.2f})"
+                            })
                     
                     if not factor_found:
                         missing_factors.append({
@@ -575,7 +1036,7 @@ class KGExplainer:
                             'factor_type': target_type,
                             'relationship': relationship,
                             'weight': weight,
-                            'is_key_symptom': target in key_symptoms
+                            'is_key_symptom': is_key_symptom
                         })
         
         # Recalculate reasoning accuracy after adding new invalid reasoning items
@@ -761,15 +1222,15 @@ class KGExplainer:
         
         # Factor coverage (percentage of important ground truth factors included in prediction)
         gt_factors = set()
-        for _, target, data in self.ground_truth_nx.out_edges(self.predicted_disease, data=True):
-            if data.get('weight', 0) > 0.5:  # Only consider moderately important factors
+        for target, _, weight in self.ground_truth_profile.factors:
+            if weight > 0.5:  # Only consider moderately important factors
                 gt_factors.add(target)
         
         pred_factors = set()
         pred_novel_factors = set()
-        for _, target, data in self.prediction_nx.out_edges(self.predicted_disease, data=True):
+        for target, _, _ in self.prediction_profile.factors:
             pred_factors.add(target)
-            if data.get('is_novel', False) or self.prediction_nx.nodes[target].get('is_novel', False):
+            if target in self.prediction_profile.novel:
                 pred_novel_factors.add(target)
         
         if gt_factors:
@@ -813,31 +1274,25 @@ class KGExplainer:
         
         self.analysis_results['metrics'] = metrics
 
-    def _prepare_visualization_data(self):
-        """Prepare data for visualization in the React component."""
-        viz_data = {}
-        
-        # Combine both graphs for visualization
-        combined_nodes = []
-        combined_links = []
-        
-        # Track nodes to avoid duplicates
+    def _build_combined_graph(self):
+        """Combine the ground truth and the prediction into one graph for visualization."""
+        # Combine both graphs for visualization, starting from the ground truth nodes and links
+        # the index prepared once. They are shared between analyses, so the ones that change
+        # are replaced by copies.
+        base = self.ground_truth.visualization_base
+        combined_nodes = list(base['nodes'])
+        
+        # Track nodes to avoid duplicates, ground truth positions come from the base
         node_map = {}
         
-        # Process ground truth nodes first
-        for node in self.ground_truth_kg['nodes']:
-            node_id = node['id']
-            node_copy = node.copy()
-            node_copy['source'] = 'ground_truth'
-            combined_nodes.append(node_copy)
-            node_map[node_id] = len(combined_nodes) - 1
-        
         # Process prediction nodes, marking shared ones
         for node in self.prediction_kg['nodes']:
             node_id = node['id']
-            if node_id in node_map:
+            position = node_map.get(node_id, base['positions'].get(node_id))
+            if position is not None:
                 # Node exists in both graphs
-                combined_nodes[node_map[node_id]]['source'] = 'both'
+                if combined_nodes[position].get('source') != 'both':
+                    combined_nodes[position] = {**combined_nodes[position], 'source': 'both'}
             else:
                 # Node only in prediction
                 node_copy = node.copy()
@@ -850,21 +1305,19 @@ class KGExplainer:
                 combined_nodes.append(node_copy)
                 node_map[node_id] = len(combined_nodes) - 1
         
-        # Process ground truth links
-        for link in self.ground_truth_kg['links']:
-            link_copy = link.copy()
-            link_copy['source_graph'] = 'ground_truth'
-            
-            # Check if both nodes exist in the combined graph
-            source_id = link['source'] if isinstance(link['source'], str) else link['source']['id']
-            target_id = link['target'] if isinstance(link['target'], str) else link['target']['id']
-            
-            if source_id in node_map and target_id in node_map:
-                link_copy['source'] = source_id
-                link_copy['target'] = target_id
-                combined_links.append(link_copy)
+        def in_combined_graph(node_id):
+            return node_id in base['positions'] or node_id in node_map
+        
+        # Process ground truth links, only those between ground truth nodes unless some have
+        # endpoints the prediction added
+        if base['all_links'] is None:
+            combined_links = list(base['links'])
+        else:
+            combined_links = [link for link, resolved in base['all_links']
+                              if resolved or (in_combined_graph(link['source']) and in_combined_graph(link['target']))]
         
         # Process prediction links
+        ground_truth_edges = self.ground_truth.edges
         for link in self.prediction_kg['links']:
             link_copy = link.copy()
             
@@ -872,20 +1325,11 @@ class KGExplainer:
             source_id = link['source'] if isinstance(link['source'], str) else link['source']['id']
             target_id = link['target'] if isinstance(link['target'], str) else link['target']['id']
             
-            if source_id in node_map and target_id in node_map:
+            if in_combined_graph(source_id) and in_combined_graph(target_id):
                 # Check if this link exists in ground truth
-                link_exists = False
-                match_weight = 0
-                
-                for gt_link in self.ground_truth_kg['links']:
-                    gt_source = gt_link['source'] if isinstance(gt_link['source'], str) else gt_link['source']['id']
-                    gt_target = gt_link['target'] if isinstance(gt_link['target'], str) else gt_link['target']['id']
-                    
-                    if (gt_source == source_id and gt_target == target_id and 
-                        gt_link['relationship'] == link['relationship']):
-                        link_exists = True
-                        match_weight = gt_link.get('weight', 0)
-                        break
+                edge_key = (source_id, target_id, link['relationship'])
+                link_exists = edge_key in ground_truth_edges
+                match_weight = ground_truth_edges.get(edge_key, 0)
                 
                 if link_exists:
                     link_copy['source_graph'] = 'both'
@@ -901,6 +1345,17 @@ class KGExplainer:
                 link_copy['target'] = target_id
                 combined_links.append(link_copy)
         
+        return {
+            'nodes': combined_nodes,
+            'links': combined_links
+        }
+    
+    def _prepare_visualization_data(self):
+        """Prepare data for visualization in the React component."""
+        viz_data = {}
+        
+        combined_graph = self._build_combined_graph()
+        
         # Add assessment data
         assessment_data = {
             'predicted_disease': self.predicted_disease,
@@ -930,10 +1385,7 @@ class KGExplainer:
         if 'minimal_changes_explanation' in self.analysis_results.get('counterfactuals', {}):
             counterfactual_data['minimal_changes'] = self.analysis_results['counterfactuals']['minimal_changes_explanation']
         
-        viz_data['combined_graph'] = {
-            'nodes': combined_nodes,
-            'links': combined_links
-        }
+        viz_data['combined_graph'] = combined_graph
         
         viz_data['assessment'] = assessment_data
         viz_data['explanations'] = explanation_data
@@ -952,6 +1404,38 @@ class KGExplainer:
     def get_visualization_data(self):
         """Return the visualization data for the React component."""
         return self.analysis_results['visualization_data']
+    
+    def get_dependencies(self):
+        """
+        Describe what the computed sections read from the ground truth, so a cached result
+        can be kept across edits of the ground truth that cannot change it.
+        
+        Returns:
+            Dictionary with
+            - global: whether a section read the whole graph (structural comparison, visualization)
+            - diseases: the diseases whose node or factors were read
+            - ranking: for the counterfactuals, the predicted factors, metric and number of
+              alternatives, and the similarity of the last one (None when fewer were found),
+              which an edited disease must reach to enter the alternatives
+        """
+        dependencies = {
+            'global': bool(self.completed_sections & {'structural_comparison', 'visualization_data'}),
+            'diseases': [self.predicted_disease] if self.predicted_disease else [],
+            'ranking': None
+        }
+        
+        if 'counterfactuals' in self.completed_sections and self.predicted_disease:
+            alternatives = self.analysis_results['counterfactuals'].get('alternative_diagnoses', [])
+            dependencies['diseases'].extend(item['alternative_disease'] for item in alternatives)
+            if self.counterfactual_top_k > 0:
+                dependencies['ranking'] = {
+                    'factors': dict(self.prediction_profile.weights),
+                    'metric': self.similarity_metric,
+                    'k': self.counterfactual_top_k,
+                    'threshold': alternatives[-1]['similarity'] if len(alternatives) >= self.counterfactual_top_k else None
+                }
+        
+        return dependencies
 
 
 def main():